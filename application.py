@@ -12,12 +12,18 @@ All of the files in this directory and all subdirectories are:
 Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
 """
 import datetime
-import csv
-from typing import Dict, List, Tuple, Optional
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+import dataset
+from dataset import Dataset, read_rows
 from airport import Airport
 from customer import Customer
-from flight import Trip, FlightSegment
+from flight import Trip, FlightSegment, FlightSchedule
 from visualizer import Visualizer
+from metrics import METRICS, dump_at_exit
+from parsers import parse_segments_file
+from checkpoint import Checkpoint
+from store import BinaryStore
 
 #############################################
 # DO NOT DECLARE ANY OTHER GLOBAL VARIABLES!
@@ -30,9 +36,27 @@ from visualizer import Visualizer
 AIRPORT_LOCATIONS = {}
 
 # DEFAULT_BASE_COST: Default rate per km for the base cost of a flight segment.
-DEFAULT_BASE_COST = 0.1225
+# (This is the rate the Dataset loader uses.)
+DEFAULT_BASE_COST = dataset.DEFAULT_BASE_COST
 
 
+def stream_data(file_airports: str, file_customers: str, file_segments: str,
+                file_trips: str) -> Tuple[Iterator[List[str]],
+                                          Iterator[List[str]],
+                                          Iterator[List[str]],
+                                          Iterator[List[str]]]:
+    """ The streaming version of import_data: returns a tuple of row iterators
+        (airports, flights, customers, trips) in the same order, without
+        reading any file until its rows are asked for. Each iterator can only
+        be consumed once.
+
+        Precondition: the dataset file must be in CSV format.
+    """
+    return (read_rows(file_airports), read_rows(file_segments),
+            read_rows(file_customers), read_rows(file_trips))
+
+
+@METRICS.timed("import_data")
 def import_data(file_airports: str, file_customers: str, file_segments: str,
                 file_trips: str) -> Tuple[List[List[str]], List[List[str]],
                                           List[List[str]], List[List[str]]]:
@@ -42,180 +66,97 @@ def import_data(file_airports: str, file_customers: str, file_segments: str,
 
         Precondition: the dataset file must be in CSV format.
     """
-
-    airport_log, customer_log, flight_log, trip_log = [], [], [], []
-
-    airport_data = csv.reader(open(file_airports))
-    customer_data = csv.reader(open(file_customers))
-    flight_data = csv.reader(open(file_segments))
-    trip_data = csv.reader(open(file_trips))
-
-    for row in airport_data:
-        airport_log.append(row)
-
-    for row in flight_data:
-        flight_log.append(row)
-
-    for row in customer_data:
-        customer_log.append(row)
-
-    for row in trip_data:
-        trip_log.append(row)
-
-    return airport_log, flight_log, customer_log, trip_log
+    airport_data, flight_data, customer_data, trip_data = \
+        stream_data(file_airports, file_customers, file_segments, file_trips)
+    return (list(airport_data), list(flight_data), list(customer_data),
+            list(trip_data))
 
 
-def create_customers(log: List[List[str]]) -> Dict[int, Customer]:
+def create_customers(log: Iterable[List[str]]) -> Dict[int, Customer]:
     """ Returns a dictionary of Customer IDs and their Customer instances, based
     on the customers from the input dataset from the <log>.
 
     Precondition:
-        - The <log> list contains the input data in the correct format.
+        - The rows of <log> contain the input data in the correct format. <log>
+      may be a list, or an iterator that is consumed one row at a time.
     >>> a = import_data('data/airports.csv', 'data/segments.csv','data/customers.csv', 'data/trips.csv')
     >>> create_customers(a[1])
     []
     """
-    final = {}
-    for line in log:
-        final[int(line[0])] = Customer(int(line[0]), line[1], int(line[2]),
-                                       line[3])
-    return final
+    return Dataset().load_customers(log)
 
 
-def create_flight_segments(log: List[List[str]])\
-        -> Dict[datetime.date, List[FlightSegment]]:
+def create_flight_segments(log: Union[Iterable[List[str]], BinaryStore]) \
+        -> FlightSchedule:
     """ Returns a dictionary storing all FlightSegments, indexed by their
-    departure date, based on the input dataset stored in the <log>.
+    departure date, based on the input dataset stored in the <log>. The
+    returned FlightSchedule also indexes the segments by route and date.
 
     Precondition:
-    - The <log> list contains the input data in the correct format.
+    - The rows of <log> contain the input data in the correct format. <log>
+      may be a list, or an iterator that is consumed one row at a time, or a
+      BinaryStore (see store.py) holding the segments.
     >>> a = import_data('data/airports.csv', 'data/segments.csv',
     'data/customers.csv', 'data/trips.csv')
     >>> create_flight_segments(a[2])
     []
     """
-    month_days = {1: 31, 2: 28, 3: 31, 4: 30, 5: 31, 6: 30, 7: 31, 8: 31, 9: 30,
-                  10: 31, 11: 30, 12: 31}
-    final = {}
-    ids = {}
-    a1 = import_data('data/airports.csv', 'data/segments.csv',
-                     'data/customers.csv', 'data/trips.csv')
-    airp = create_airports(a1[0])
-    for airport in airp:
-        ids[airport.get_airport_id()] = airport.get_location()
-    for line in log:
-        date1 = datetime.datetime
-        date22 = datetime.datetime
-        a = line[3]
-        dep = line[4]
-        arr = line[5]
-        date1 = datetime.datetime(int(a[:4]), int(a[5:7]), int(a[8:]),
-                                  int(dep[:2]), int(dep[3:]))
-        if int(dep[:2]) >= int(arr[:2]):
-            # if the return flight ends up not being in the same day
-            if not month_days[date1.month] == date1.day:
-                # if it isn't the last day of the month
-                date22 = datetime.datetime(int(a[:4]), int(a[5:7]),
-                                           int(a[8:]) + 1, int(arr[:2]),
-                                           int(arr[3:]))
-            else:
-                # if it is the last day of the month
-                date22 = datetime.datetime(int(a[:4]), int(a[5:7]) + 1, 1,
-                                           int(arr[:2]), int(arr[3:]))
-
-        elif int(dep[:2]) < int(arr[:2]):
-            # if it lands the same day
-            date22 = datetime.datetime(int(a[:4]), int(a[5:7]), int(a[8:]),
-                                       int(arr[:2]), int(arr[3:]))
-
-        if not datetime.date(int(a[:4]), int(a[5:7]), int(a[8:])) in final:
-            # if the date doesn't already exist in the dic
-            final[datetime.date(int(a[:4]), int(a[5:7]), int(a[8:]))] = \
-                [FlightSegment(line[0], date1, date22, DEFAULT_BASE_COST,
-                               float(line[6]), line[1], line[2],
-                               (ids[line[1]], ids[line[2]]))]
-        else:
-            # if it already does
-            final[datetime.date(int(a[:4]), int(a[5:7]), int(a[8:]))] += \
-                [FlightSegment(line[0], date1, date22, DEFAULT_BASE_COST,
-                               float(line[6]), line[1], line[2],
-                               (ids[line[1]], ids[line[2]]))]
-    return final
-
-
-def create_airports(log: List[List[str]]) -> List[Airport]:
+    data = Dataset()
+    if not AIRPORT_LOCATIONS:
+        # create_airports() has not been called yet
+        create_airports(read_rows('data/airports.csv'))
+    for iata in AIRPORT_LOCATIONS:
+        data.airports[iata] = Airport(iata, iata, AIRPORT_LOCATIONS[iata])
+    if isinstance(log, BinaryStore):
+        return data.load_stored_segments(log)
+    return data.load_segments(log)
+
+
+def create_airports(log: Iterable[List[str]]) -> List[Airport]:
     """ Return a list of Airports with all applicable data, based
     on the input dataset stored in the <log>.
 
     Precondition:
-    - The <log> list contains the input data in the correct format.
+    - The rows of <log> contain the input data in the correct format. <log>
+      may be a list, or an iterator that is consumed one row at a time.
     >>> a = import_data('data/airports.csv', 'data/segments.csv',
     'data/customers.csv', 'data/trips.csv')
     >>> create_airports(a[0])
     []
     """
-    final = []
-    for line in log:
-        final.append(Airport(line[0], line[1], (float(line[2]),
-                                                float(line[3]))))
+    final = Dataset().load_airports(log)
+    for airport in final:
+        AIRPORT_LOCATIONS[airport.get_airport_id()] = airport.get_location()
     return final
 
 
 def choose_flights(flight_segments: Dict[datetime.date, List[FlightSegment]],
                    temp_inter: List[Tuple[Tuple[str, str], str]],
                    date: datetime.date) -> List[Tuple[FlightSegment, str]]:
+    """ Returns the (FlightSegment, seat_type) pairs booked for the itinerary
+    legs in <temp_inter>, searching day by day starting from <date>. The legs
+    that get booked are removed from <temp_inter>. If the whole itinerary
+    cannot be booked before running out of flights, return [].
+
+    On each day, the segments are considered in the order they are stored for
+    that day: the first one flying a remaining leg is booked, and after that a
+    segment is only booked if it departs after the last booked one arrives.
+    The candidates are found through the route index of <flight_segments>,
+    which is built here if a plain dictionary is given.
     """
-    Help-Function
-    """
-    month_days = {1: 31, 2: 28, 3: 31, 4: 30, 5: 31, 6: 30, 7: 31, 8: 31, 9: 30,
-                  10: 31, 11: 30, 12: 31}
-    final = []
-    segos = len(temp_inter)
-    if date not in flight_segments:
-        return []
-    for flight in flight_segments[date]:
-        # parsing through all the flights
-        for segs in temp_inter:
-            # parsing through my segments for this trip
-            if flight.get_dep() == segs[0][0] and flight.get_arr() == \
-                    segs[0][1]:
-                # if the departure and arivaal are the same
-                if not final:
-                    # if it is the first flight to be added
-                    final.append((flight, segs[1]))
-                    # remove from the segment from the list
-                    temp_inter.remove(segs)
-                elif final != [] and flight.get_times()[0] >= \
-                        final[-1][0].get_times()[1]:
-                    # if the flight is not the first segment
-                    final.append((flight, segs[1]))
-                    # remove from the list
-                    temp_inter.remove(segs)
-    if len(final) == segos:
-        # if the length of the final and inter are the same
-        return final
-    else:
-        # if it is not the same
-        new_date: datetime.date
-        if month_days[date.month] == date.day:
-            new_date = datetime.date(date.year, date.month + 1, 1)
-        else:
-            new_date = datetime.date(date.year, date.month, date.day + 1)
-        # the new date
-        final += choose_flights(flight_segments, temp_inter, new_date)
-        if len(final) == segos:
-            return final
-        else:
-            return []
-
-
-def load_trips(log: List[List[str]], customer_dict: Dict[int, Customer],
+    if not isinstance(flight_segments, FlightSchedule):
+        flight_segments = FlightSchedule.from_dict(flight_segments)
+    return flight_segments.choose_flights(temp_inter, date)
+
+
+def load_trips(log: Iterable[List[str]], customer_dict: Dict[int, Customer],
                flight_segments: Dict[datetime.date, List[FlightSegment]]) \
         -> List[Trip]:
     """ Creates the Trip objects and makes the bookings.
 
     Preconditions:
-    - The <log> list contains the input data in the correct format.
+    - The rows of <log> contain the input data in the correct format. <log>
+      may be a list, or an iterator that is consumed one row at a time.
     - the customers are already correctly stored in the <customer_dict>,
     indexed by their customer ID.
     - the flight segments are already correctly stored in the <flight_segments>,
@@ -226,53 +167,78 @@ def load_trips(log: List[List[str]], customer_dict: Dict[int, Customer],
     >>> load_trips(a[3], b ,c)
     []
     """
-    final = []
-    for line in log:
-        booking_id = line[0]
-        customer_id = int(line[1])
-        dod = datetime.date(int(line[2][:4]), int(line[2][5:7]),
-                            int(line[2][8:]))
-        # extracting the arrivals and departures for
-        temp_inter = []
-        for i in range(len(line) - 1):
-            if i >= 3 and i % 2 != 0:
-                # if we are at the right index and odd i
-                if i == 3:
-                    # if we are at the very first dep
-                    temp_inter.append(((line[i][3:6], line[i+2][2:5]),
-                                       line[i+1][1:-2]))
-                elif not (i + 2 > len(line) - 1) and not i+2 > len(line)-1:
-                    # If we are at an odd index and this is not the last dep
-                    temp_inter.append(((line[i][2:5], line[i+2][2:5]),
-                                       line[i+1][1:-2]))
-        # everything works fine until here
-
-        second_list = choose_flights(flight_segments, temp_inter, dod)
-        imdone = customer_dict[customer_id].book_trip(booking_id,
-                                                      second_list, dod)
-        if second_list != []:
-            final.append(imdone)
-    return final
+    data = Dataset()
+    data.customers = customer_dict
+    if isinstance(flight_segments, FlightSchedule):
+        data.flight_segments = flight_segments
+    else:
+        data.flight_segments = FlightSchedule.from_dict(flight_segments)
+    return data.load_trips(log)
 
 
 if __name__ == '__main__':
+    # the metrics of this run are written to the file named by the
+    # PAIR_METRICS_FILE environment variable, if it is set
+    metrics_file = dump_at_exit(METRICS)
+    if metrics_file is not None:
+        print("The metrics will be written to", metrics_file)
     print("\n---------------------------------------------")
     print("Reading in all data! Processing...")
     print("---------------------------------------------\n")
 
-    # input_data = import_data('data/airports.csv', 'data/customers.csv',
+    # input_data = stream_data('data/airports.csv', 'data/customers.csv',
     #     'data/segments.csv', 'data/trips.csv')
-    input_data = import_data('data/airports.csv', 'data/customers.csv',
+    input_data = stream_data('data/airports.csv', 'data/customers.csv',
                              'data/segments_small.csv', 'data/trips_small.csv')
 
-    airports = create_airports(input_data[0])
+    # each file is parsed once, against the dataset's airport registry; the
+    # segments and trips are parsed by every core, then added in file order.
+    # If the airports, customers and segments were converted by store.py,
+    # they are read from the store instead, without parsing them, as long as
+    # the store still matches the CSV files.
+    data = Dataset()
+    store = None
+    if os.path.exists('data/small.store'):
+        try:
+            store = BinaryStore('data/small.store')
+        except ValueError as error:
+            print(error, "; reading the CSV files instead", sep="")
+        if store is not None and not store.is_built_from(
+                'data/airports.csv', 'data/customers.csv',
+                'data/segments_small.csv'):
+            print("data/small.store is out of date; reading the CSV files "
+                  "instead")
+            store.close()
+            store = None
+    airports = data.load_airports(store.airport_rows() if store is not None
+                                  else input_data[0])
     print("Airports Created! Still Processing...")
-    flights = create_flight_segments(input_data[1])
+    if store is not None:
+        flights = data.load_stored_segments(store)
+    else:
+        flights = data.load_parsed_segments(parse_segments_file(
+            'data/segments_small.csv', os.cpu_count() or 1))
     print("Flight Segments Created! Still Processing...")
-    customers = create_customers(input_data[2])
+    customers = data.load_customers(store.customer_rows() if store is not None
+                                    else input_data[2])
+    # the snapshot refers to flight segments by their row in the table, so
+    # its checksum must cover the file they were actually loaded from
+    inputs = ['data/airports.csv', 'data/customers.csv',
+              'data/segments_small.csv', 'data/trips_small.csv']
+    if store is not None:
+        store.close()
+        inputs.append('data/small.store')
     print("Customers Created! Still Processing...")
     print("Loading trips can take a while...")
-    trips = load_trips(input_data[3], customers, flights)
+    # the bookings are restored from the last snapshot, unless the input files
+    # have changed since it was written
+    checkpoint = Checkpoint('data/small.snapshot', 'data/small.journal',
+                            inputs)
+    trips = checkpoint.load_trips(data, 'data/trips_small.csv',
+                                  os.cpu_count() or 1)
+    if checkpoint.get_stale_file() is not None:
+        print("data/small.journal no longer matches the data; it was moved "
+              "to", checkpoint.get_stale_file())
     print("Trips Created! Opening Visualizer...\n")
 
     flights_len = 0
@@ -286,9 +252,10 @@ if __name__ == '__main__':
     print("Total flight segments in the dataset:", flights_len)
     print("Total customers in the dataset:", len(customers))
     print("Total trips in the dataset:", len(trips))
+    print("Malformed trips skipped:", len(data.rejected_trips))
     print("---------------------------------------------\n")
 
-    all_flights = [seg for tp in trips for seg in tp.get_flight_segments()]
+    all_flights = data.bookings.get_all_segments()
     all_customers = [customers[cid] for cid in customers]
 
     V = Visualizer()
@@ -296,20 +263,20 @@ if __name__ == '__main__':
 
     while not V.has_quit():
 
-        flights = V.handle_window_events(all_customers, all_flights)
-
-        all_flights = []
+        all_flights = V.handle_window_events(all_customers, all_flights)
 
-        for flt in flights:
-            all_flights.append(flt)
+        if V.needs_redraw():
+            V.draw(all_flights)
 
-        V.draw(all_flights)
+    V.close()
+    checkpoint.close()
 
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'csv', 'datetime', 'doctest',
-            'visualizer', 'customer', 'flight', 'airport'
+            'python_ta', 'typing', 'datetime', 'doctest', 'dataset',
+            'visualizer', 'customer', 'flight', 'airport', 'metrics', 'os',
+            'parsers', 'store', 'checkpoint'
         ],
         'max-nested-blocks': 6,
         'allowed-io': [
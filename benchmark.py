@@ -0,0 +1,245 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+
+# The renderer is benchmarked without opening a window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+import application
+from dataset import Dataset
+from filter import Filter, CustomerFilter, DateFilter, DurationFilter
+from filter import ExpressionFilter, LocationFilter, ResetFilter, TripFilter
+from filter import apply_filter
+from visualizer import Map, SCREEN_SIZE
+from generator import generate_dataset
+from metrics import METRICS
+from store import BinaryStore, write_store
+from checkpoint import input_checksum, restore_snapshot, write_snapshot
+
+""" ======================== Module Description ================================
+
+    This file times each stage of the application (reading the data files,
+    creating the airports, flight segments and customers, booking the trips,
+    applying each filter and rendering the map), and records the results as
+    JSON so that they can be compared between versions of the code.
+
+    Run it with:  python benchmark.py --output results.json
+    To also see how each stage scales, add synthetic datasets (see
+    generator.py) of some sizes relative to the shipped one:
+                  python benchmark.py --scales 1 5 10
+"""
+
+# DATASETS: the (airports, customers, segments, trips) files of each dataset.
+DATASETS = {"small": ('data/airports.csv', 'data/customers.csv',
+                      'data/segments_small.csv', 'data/trips_small.csv'),
+            "full": ('data/airports.csv', 'data/customers.csv',
+                     'data/segments.csv', 'data/trips.csv')}
+
+# FILTER_CASES: the filters that are benchmarked, with their filter strings.
+FILTER_CASES = [(ResetFilter, ""), (CustomerFilter, "915545"),
+                (DurationFilter, "L0300"), (DurationFilter, "G0600"),
+                (LocationFilter, "DYYZ"), (LocationFilter, "AJFK"),
+                (DateFilter, "2019-04-01/2019-06-30"),
+                (TripFilter, "X05B6"),
+                (ExpressionFilter, "DURATION<300 & DEP=YYZ")]
+
+# DEFAULT_REPEAT: the number of times each benchmark is run by default.
+DEFAULT_REPEAT = 3
+
+# Timing: the statistics recorded for each benchmark.
+Timing = Dict[str, Any]
+
+
+def time_call(fun: Callable[[Any], Any], repeat: int,
+              setup: Optional[Callable[[], Any]] = None) -> Timing:
+    """ Runs <fun> <repeat> times and returns the fastest and mean times taken
+        (in seconds). If a <setup> function is given, it is called (untimed)
+        before each run, and its result is passed to <fun>.
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        fun(argument)
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "mean": sum(times) / len(times),
+            "runs": repeat}
+
+
+def _load(files: Tuple[str, str, str, str]) \
+        -> Tuple[List[List[List[str]]], Dict, Any]:
+    """ Returns the rows of the <files>, along with the customers and flight
+        segments created from them, with no trips booked yet.
+    """
+    rows = application.import_data(*files)
+    application.create_airports(rows[0])
+    return (rows, application.create_customers(rows[2]),
+            application.create_flight_segments(rows[1]))
+
+
+def _load_store(filename: str) -> Dataset:
+    """ Returns the airports, customers and flight segments in the store file
+        <filename>, with no trips booked yet.
+    """
+    store = BinaryStore(filename)
+    data = Dataset()
+    data.load_airports(store.airport_rows())
+    data.load_stored_segments(store)
+    data.load_customers(store.customer_rows())
+    store.close()
+    return data
+
+
+def run_dataset(files: Tuple[str, str, str, str], repeat: int) \
+        -> Dict[str, Timing]:
+    """ Returns the timing of every benchmark on the dataset in <files>,
+        along with the metrics (see metrics.py) recorded while they ran.
+    """
+    METRICS.reset()
+    results = {}
+    rows = application.import_data(*files)
+    results["import_data"] = time_call(
+        lambda _: application.import_data(*files), repeat)
+    results["create_airports"] = time_call(
+        lambda _: application.create_airports(rows[0]), repeat)
+    results["create_flight_segments"] = time_call(
+        lambda _: application.create_flight_segments(rows[1]), repeat)
+    results["create_customers"] = time_call(
+        lambda _: application.create_customers(rows[2]), repeat)
+    results["load_trips"] = time_call(
+        lambda loaded: application.load_trips(loaded[0][3], loaded[1],
+                                              loaded[2]),
+        repeat, lambda: _load(files))
+    # a cold start, with the segments and trips parsed by one process and by
+    # one process per core
+    for workers in sorted({1, os.cpu_count() or 1}):
+        results["from_files(workers={})".format(workers)] = time_call(
+            lambda _, count=workers: Dataset.from_files(*files, count),
+            repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        store_file = os.path.join(directory, 'dataset.store')
+        results["write_store"] = time_call(
+            lambda _: write_store(store_file, *files[:3]), repeat)
+        results["load_store"] = time_call(lambda _: _load_store(store_file),
+                                          repeat)
+        # restoring the bookings of load_trips from a snapshot
+        checksum = input_checksum(files)
+        snapshot_file = os.path.join(directory, 'dataset.snapshot')
+        booked = _load_store(store_file)
+        booked.load_trips(rows[3])
+        write_snapshot(booked, snapshot_file, checksum)
+        results["restore_snapshot"] = time_call(
+            lambda data: restore_snapshot(data, snapshot_file, checksum),
+            repeat, lambda: _load_store(store_file))
+
+    _, customers, flights = _load(files)
+    trips = application.load_trips(rows[3], customers, flights)
+    all_customers = list(customers.values())
+    segments = [seg for trip in trips for seg in trip.get_flight_segments()]
+    results["load_trips"]["segments_booked"] = len(segments)
+    for filter_class, filter_string in FILTER_CASES:
+        f = filter_class()
+        name = "{}({})".format(filter_class.__name__, filter_string)
+        outputs = []
+        results[name] = time_call(
+            _filter_runner(f, all_customers, segments, filter_string,
+                           outputs), repeat)
+        # the size of what the timed runs returned, which is the same for
+        # every run
+        results[name]["output_size"] = len(outputs[-1])
+
+    pygame.init()
+    screen = pygame.Surface(SCREEN_SIZE)
+    results["render_objects"] = time_call(
+        lambda m: m.render_objects(segments, screen), repeat,
+        lambda: Map(SCREEN_SIZE))
+    results["get_current_view"] = time_call(
+        lambda m: m.get_current_view(), repeat, lambda: Map(SCREEN_SIZE))
+    results["metrics"] = METRICS.snapshot()
+    return results
+
+
+def _filter_runner(f: Filter, customers: List, segments: List,
+                   filter_string: str, outputs: List) -> Callable[[Any], Any]:
+    """ Returns a function which applies <f> to the <segments> with the
+        <filter_string>, recording its metrics, and appends the result of each
+        run to <outputs>.
+    """
+    return lambda _: outputs.append(apply_filter(f, customers, segments,
+                                                 filter_string))
+
+
+def run_benchmarks(datasets: List[str], repeat: int,
+                   scales: Optional[List[float]] = None) -> Dict[str, Any]:
+    """ Runs every benchmark on each of the <datasets> (keys of DATASETS)
+        <repeat> times, and returns the results along with a description of
+        the machine they were run on. A synthetic dataset is also benchmarked
+        for each of the <scales>, if any.
+    """
+    report = {"created": datetime.datetime.now().isoformat(),
+              "python": platform.python_version(),
+              "platform": platform.platform(), "repeat": repeat,
+              "results": {}}
+    for name in datasets:
+        report["results"][name] = run_dataset(DATASETS[name], repeat)
+    for scale in scales or []:
+        with tempfile.TemporaryDirectory() as directory:
+            report["results"]["synthetic-{}x".format(scale)] = run_dataset(
+                generate_dataset(directory, scale), repeat)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark the loading, booking, filters and rendering.")
+    parser.add_argument('--datasets', nargs='+', choices=list(DATASETS),
+                        default=list(DATASETS))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--scales', nargs='*', type=float, default=[],
+                        help="also benchmark synthetic datasets this many "
+                             "times the size of the shipped one (from 1 to "
+                             "about 439, see generator.py)")
+    parser.add_argument('--output', help="the JSON file to write the "
+                                         "results to (default: print them)")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    # the data files are found relative to this directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    output = json.dumps(run_benchmarks(args.datasets, args.repeat,
+                                       args.scales), indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'argparse', 'datetime', 'json',
+            'os', 'platform', 'tempfile', 'time', 'pygame', 'application',
+            'dataset', 'filter', 'visualizer', 'generator', 'metrics',
+            'store', 'checkpoint'
+        ],
+        'disable': ['C0413']
+    })
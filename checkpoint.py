@@ -0,0 +1,461 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, TextIO, \
+    Tuple
+import datetime
+import hashlib
+import json
+import os
+from dataset import Dataset
+from flight import FlightSegment, Trip
+from metrics import METRICS
+from parsers import NumberedTrip, parse_segments_file, parse_trips_file
+
+""" ======================== Module Description ================================
+
+    This file saves the bookings made by load_trips, so that they do not have
+    to be made again every time the application starts.
+
+    Booking the trips of a dataset always gives the same result, so once the
+    trips are booked, a snapshot of the booked state is written: the trips of
+    every customer, their miles, flight costs and frequent flyer status, the
+    manifest and seats sold of every flight segment, and the malformed rows of
+    the trips file. The snapshot records
+    a checksum of the input files, and is only used while they are unchanged.
+
+    The trips booked and canceled after that (through a Checkpoint) are
+    appended to a journal, one JSON line each, which is replayed on top of the
+    snapshot. The journal also records the checksum of the input files, since
+    it refers to flight segments by their row in the segments file.
+
+    Segments files added after loading (through a Checkpoint) are recorded in
+    the journal too, by their name and checksum, and are added again when the
+    journal is replayed, before the bookings that may use their rows.
+
+    A journal which can no longer be replayed, because the input files or a
+    segments file added through it have changed, is moved aside to a file
+    ending in STALE_SUFFIX before anything is loaded, and a new journal is
+    started.
+"""
+
+# SNAPSHOT_VERSION: the version of the format of snapshots and journals.
+SNAPSHOT_VERSION = 1
+
+# STALE_SUFFIX: added to the name of a journal which is moved aside because it
+#               can no longer be replayed.
+STALE_SUFFIX = ".stale"
+
+# CHECKSUM_BLOCK: the number of bytes of an input file hashed at a time.
+CHECKSUM_BLOCK = 1 << 20
+
+# Record: one booking, cancellation or added segments file in a journal.
+Record = Dict[str, Any]
+
+
+def input_checksum(files: Sequence[str]) -> str:
+    """ Returns a checksum of the contents of the <files>, in order. """
+    digest = hashlib.sha256(str(SNAPSHOT_VERSION).encode())
+    for filename in files:
+        with open(filename, 'rb') as file:
+            block = file.read(CHECKSUM_BLOCK)
+            while block:
+                digest.update(block)
+                block = file.read(CHECKSUM_BLOCK)
+        # the end of each file is marked, so that moving bytes from one file
+        # to the next changes the checksum
+        digest.update(b"\0" + str(os.path.getsize(filename)).encode())
+    return digest.hexdigest()
+
+
+@METRICS.timed("write_snapshot")
+def write_snapshot(data: Dataset, filename: str, checksum: str) -> None:
+    """ Writes a snapshot of the bookings of <data> to <filename>, for the
+        input files with the <checksum>.
+
+        The snapshot is written to a temporary file first, and then moved to
+        <filename>, so a snapshot is never left half written.
+
+        Precondition: no trip of <data> has been canceled, as the snapshot
+                      only holds the trips that are still booked.
+    """
+    table = data.flight_segments.table
+    trips = []
+    for trip, cus in data.bookings.get_trips():
+        trips.append([trip.get_reservation_id(), cus.get_id(),
+                      trip.trip_departure.toordinal(),
+                      [seg.get_row() for seg in trip.get_flight_segments()],
+                      cus.get_cost_of_trip(trip)])
+    snapshot = {
+        "version": SNAPSHOT_VERSION, "checksum": checksum, "trips": trips,
+        "customers": [[cid, data.customers[cid].get_miles(),
+                       data.customers[cid].get_total_flight_costs(),
+                       data.customers[cid].get_ff_status()]
+                      for cid in data.customers],
+        "manifests": [[row, list(table.manifests[row].items())]
+                      for row in range(len(table))
+                      if table.manifests[row] is not None],
+        "sold": {seat_class: [[row, count] for row, count in
+                              enumerate(table.sold[seat_class]) if count]
+                 for seat_class in table.sold},
+        "rejected": data.rejected_trips.get_rejections()}
+    with open(filename + ".tmp", 'w') as file:
+        json.dump(snapshot, file, separators=(',', ':'))
+    os.replace(filename + ".tmp", filename)
+
+
+@METRICS.timed("restore_snapshot")
+def restore_snapshot(data: Dataset, filename: str, checksum: str) -> bool:
+    """ Restores the bookings in the snapshot <filename> into <data>, and
+        returns True, if that snapshot was written for the input files with
+        the <checksum>. Otherwise, returns False and leaves <data> as it is.
+
+        Precondition: the airports, flight segments and customers of <data>
+                      are loaded from the same input files as the snapshot,
+                      and nothing is booked yet.
+    """
+    try:
+        with open(filename) as file:
+            snapshot = json.load(file)
+    except (OSError, ValueError):
+        return False
+    if snapshot.get("version") != SNAPSHOT_VERSION or \
+            snapshot.get("checksum") != checksum:
+        return False
+
+    table = data.flight_segments.table
+    for row, manifest in snapshot["manifests"]:
+        table.manifests[row] = {cid: seat_type for cid, seat_type in manifest}
+    for seat_class in snapshot["sold"]:
+        for row, count in snapshot["sold"][seat_class]:
+            table.sold[seat_class][row] = count
+
+    # the trips share the segments of the schedule, as they do when booked
+    # by load_trips
+    segments = {}
+    for date in data.flight_segments:
+        for seg in data.flight_segments[date]:
+            segments[seg.get_row()] = seg
+    booked = []
+    costs = {}
+    dates = {}
+    for rid, cid, ordinal, rows, cost in snapshot["trips"]:
+        if ordinal not in dates:
+            dates[ordinal] = datetime.date.fromordinal(ordinal)
+        trip = Trip(rid, cid, dates[ordinal], [segments[row] for row in rows])
+        booked.append((trip, data.customers[cid]))
+        costs.setdefault(cid, []).append((trip, cost))
+        if rows:
+            data.trips.append(trip)
+    for cid, miles, flight_costs, ff_status in snapshot["customers"]:
+        data.customers[cid].restore(costs.get(cid, []), miles, flight_costs,
+                                    ff_status)
+    data.bookings.add_trips(booked)
+    for line_number, reason, text in snapshot.get("rejected", []):
+        data.rejected_trips.add(line_number, reason, text)
+    return True
+
+
+class Checkpoint:
+    """ The snapshot and journal of the bookings made on a dataset.
+
+        Trips booked or canceled after loading the dataset must go through
+        book_trip and cancel_trip, and segments files added after loading must
+        go through load_segments, so that they are written to the journal.
+
+        Restoring the snapshot and replaying the journal give the same
+        bookings as making them again:
+
+    >>> import tempfile
+    >>> from dataset import read_rows
+    >>> directory = tempfile.mkdtemp()
+    >>> snapshot, journal = [os.path.join(directory, name)
+    ...                      for name in ['snapshot', 'journal']]
+    >>> files = ['data/airports.csv', 'data/customers.csv',
+    ...          'data/segments_small.csv', 'data/trips_small.csv']
+    >>> def load(inputs: List[str]) -> Tuple[Dataset, Checkpoint]:
+    ...     data = Dataset()
+    ...     _ = data.load_airports(read_rows(files[0]))
+    ...     _ = data.load_segments(read_rows(files[2]))
+    ...     _ = data.load_customers(read_rows(files[1]))
+    ...     checkpoint = Checkpoint(snapshot, journal, inputs)
+    ...     _ = checkpoint.load_trips(data, files[3])
+    ...     return data, checkpoint
+    >>> def state(data: Dataset) -> List[Any]:
+    ...     table = data.flight_segments.table
+    ...     return [[(trip.get_reservation_id(),
+    ...               [seg.get_row() for seg in trip.get_flight_segments()])
+    ...              for trip in data.trips],
+    ...             [(cus.get_miles(), cus.get_total_flight_costs(),
+    ...               cus.get_ff_status()) for cus in data.customers.values()],
+    ...             [list(table.sold[seat_class]) for seat_class in table.sold],
+    ...             list(table.manifests)]
+    >>> booked, checkpoint = load(files)
+    >>> checkpoint.close()
+    >>> restored, checkpoint = load(files)
+    >>> state(restored) == state(booked)
+    True
+    >>> trip, customer = restored.bookings.get_trips()[0]
+    >>> segments = [(seg, seg.check_seat_class(customer.get_id()))
+    ...             for seg in trip.get_flight_segments()]
+    >>> checkpoint.cancel_trip(restored, customer.get_id(), trip, segments)
+    >>> _ = checkpoint.book_trip(restored, customer.get_id(), 'NEW01',
+    ...                          segments, trip.trip_departure)
+    >>> checkpoint.close()
+    >>> replayed, checkpoint = load(files)
+    >>> checkpoint.close()
+    >>> state(replayed) == state(restored), state(replayed) == state(booked)
+    (True, False)
+
+        A journal written for other input files is moved aside:
+
+    >>> changed, checkpoint = load(files[:3])
+    >>> checkpoint.get_stale_file() == journal + STALE_SUFFIX
+    True
+    >>> state(changed) == state(booked), os.path.exists(journal)
+    (True, False)
+    """
+    # === Private Attributes ===
+    # _snapshot_file:
+    #     the name of the snapshot file.
+    # _journal_file:
+    #     the name of the journal file.
+    # _checksum:
+    #     the checksum of the input files.
+    # _journal:
+    #     the journal file, open for appending, or None if it is not open yet.
+    # _stale_file:
+    #     the file the journal was moved to because it could no longer be
+    #     replayed, or None if it was not moved.
+    _snapshot_file: str
+    _journal_file: str
+    _checksum: str
+    _journal: Optional[TextIO]
+    _stale_file: Optional[str]
+
+    def __init__(self, snapshot_file: str, journal_file: str,
+                 files: Sequence[str]) -> None:
+        """ Initialize a Checkpoint which keeps its snapshot in
+            <snapshot_file> and its journal in <journal_file>, for the
+            input <files> (see input_checksum).
+        """
+        self._snapshot_file = snapshot_file
+        self._journal_file = journal_file
+        self._checksum = input_checksum(files)
+        self._journal = None
+        self._stale_file = None
+
+    def get_stale_file(self) -> Optional[str]:
+        """ Returns the name of the file that load_trips moved the journal to,
+            because it could no longer be replayed, or None if it was not
+            moved.
+        """
+        return self._stale_file
+
+    def load_trips(self, data: Dataset, file_trips: str,
+                   workers: int = 1) -> List[Trip]:
+        """ Books the trips in the trips file <file_trips> for <data>, then
+            replays the journal, and returns the trips of <data>.
+
+            If the snapshot is up to date, the bookings are restored from it.
+            Otherwise, the trips are loaded (after parsing them with <workers>
+            processes), and a new snapshot is written.
+
+            The journal is checked first. If it was written for other input
+            files, or if a segments file recorded in it has changed since then,
+            it is moved aside (see get_stale_file) and nothing in it is
+            replayed.
+
+            Precondition: the airports, flight segments and customers of <data>
+                          are loaded, and nothing is booked yet.
+        """
+        records = self._read_journal()
+        if not restore_snapshot(data, self._snapshot_file, self._checksum):
+            data.load_parsed_trips(parse_trips_file(file_trips, workers,
+                                                    data.rejected_trips))
+            write_snapshot(data, self._snapshot_file, self._checksum)
+        for record in records:
+            self._replay(data, record)
+        return data.trips
+
+    def load_segments(self, data: Dataset, file_segments: str,
+                      workers: int = 1) -> range:
+        """ Adds the flight segments in the segments file <file_segments> to
+            <data> (after parsing them with <workers> processes), records it in
+            the journal, and returns the range of the rows of the table of
+            <data> that they were stored in.
+
+            The journal refers to <file_segments> by its name, so it must stay
+            where it is, unchanged, for as long as the journal is kept.
+        """
+        start = len(data.flight_segments.table)
+        record = {"ingest": file_segments, "first_row": start,
+                  "checksum": input_checksum([file_segments])}
+        data.load_parsed_segments(parse_segments_file(file_segments, workers))
+        self._append([record])
+        return range(start, len(data.flight_segments.table))
+
+    def book_trip(self, data: Dataset, customer_id: int, reservation_id: str,
+                  segments: List[Tuple[FlightSegment, str]],
+                  trip_date: datetime.date) -> Trip:
+        """ Books the trip <reservation_id> on the (FlightSegment, seat_type)
+            <segments> for the customer <customer_id> of <data>, and records
+            it in the journal. Returns the Trip, which is added to the trips
+            of <data> unless it has no <segments>.
+        """
+        record = {"book": reservation_id, "customer": customer_id,
+                  "date": trip_date.toordinal(),
+                  "segments": [[seg.get_row(), seat_type]
+                               for seg, seat_type in segments]}
+        trip = self._replay(data, record)
+        self._append([record])
+        return trip
+
+    def load_parsed_trips(self, data: Dataset,
+                          trips: Iterable[NumberedTrip]) -> List[Trip]:
+        """ Books the parsed <trips> (with their line numbers) for <data>, as
+            Dataset.load_parsed_trips does, and records every booking in the
+            journal. Returns the trips that were booked successfully.
+
+            The bookings are written to the journal together, once the
+            <trips> are booked, or once booking one of them fails.
+
+            Precondition: the flight segments used by the <trips> were loaded
+                          from the input files of this checkpoint, since the
+                          journal refers to them by their row.
+        """
+        records = []
+
+        def record(trip: Trip, seat_types: List[str]) -> None:
+            """ Records the booking of <trip>, with <seat_types>. """
+            records.append({"book": trip.get_reservation_id(),
+                            "customer": trip.customer_id,
+                            "date": trip.trip_departure.toordinal(),
+                            "segments": [[seg.get_row(), seat_type]
+                                         for seg, seat_type in zip(
+                                             trip.get_flight_segments(),
+                                             seat_types)]})
+
+        try:
+            return data.load_parsed_trips(trips, record)
+        finally:
+            if records:
+                self._append(records)
+
+    def cancel_trip(self, data: Dataset, customer_id: int, trip: Trip,
+                    segments: List[Tuple[FlightSegment, str]]) -> None:
+        """ Cancels the <trip> of the customer <customer_id> of <data>, with
+            the (FlightSegment, seat_type) <segments>, and records it in the
+            journal.
+
+            Precondition: the <trip> was booked by that customer.
+        """
+        reservations = data.bookings.get_reservations(trip.get_reservation_id())
+        record = {"cancel": trip.get_reservation_id(),
+                  "customer": customer_id,
+                  "trip": [booked for booked, _ in reservations].index(trip),
+                  "segments": [[seg.get_row(), seat_type]
+                               for seg, seat_type in segments]}
+        self._replay(data, record)
+        self._append([record])
+
+    def close(self) -> None:
+        """ Close the journal, if it is open. """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _read_journal(self) -> List[Record]:
+        """ Returns the records in the journal, or an empty list if there is
+            no journal. A journal which can no longer be replayed is moved to
+            its name followed by STALE_SUFFIX, replacing an older one, and an
+            empty list is returned.
+        """
+        if not _has_contents(self._journal_file):
+            return []
+        with open(self._journal_file) as file:
+            header = json.loads(file.readline() or "{}")
+            records = [json.loads(line) for line in file]
+        is_stale = header.get("version") != SNAPSHOT_VERSION or \
+            header.get("checksum") != self._checksum
+        for record in records:
+            if "ingest" in record and not is_stale:
+                is_stale = not os.path.exists(record["ingest"]) or \
+                    input_checksum([record["ingest"]]) != record["checksum"]
+        if not is_stale:
+            return records
+        self._stale_file = self._journal_file + STALE_SUFFIX
+        os.replace(self._journal_file, self._stale_file)
+        METRICS.count("checkpoint.stale_journals")
+        return []
+
+    @staticmethod
+    def _replay(data: Dataset, record: Record) -> Optional[Trip]:
+        """ Makes the booking or cancellation, or adds the segments file, in
+            the journal <record> on <data>, and returns the Trip booked, if any.
+        """
+        if "ingest" in record:
+            if len(data.flight_segments.table) != record["first_row"]:
+                raise ValueError("{} was added at row {}, not {}".format(
+                    record["ingest"], record["first_row"],
+                    len(data.flight_segments.table)))
+            data.load_parsed_segments(parse_segments_file(record["ingest"]))
+            return None
+        table = data.flight_segments.table
+        customer = data.customers[record["customer"]]
+        segments = [(FlightSegment.view(table, row), seat_type)
+                    for row, seat_type in record["segments"]]
+        if "book" in record:
+            trip = customer.book_trip(
+                record["book"], segments,
+                datetime.date.fromordinal(record["date"]))
+            if segments:
+                data.trips.append(trip)
+            return trip
+        trip = data.bookings.get_reservations(record["cancel"])[
+            record["trip"]][0]
+        customer.cancel_trip(trip, segments)
+        return None
+
+    def _append(self, records: List[Record]) -> None:
+        """ Appends the <records> to the journal, and makes sure they are on
+            disk. A new journal starts with the checksum of the input files.
+        """
+        if self._journal is None:
+            is_new = not _has_contents(self._journal_file)
+            self._journal = open(self._journal_file, 'a')
+            if is_new:
+                self._journal.write(json.dumps(
+                    {"version": SNAPSHOT_VERSION,
+                     "checksum": self._checksum}) + "\n")
+        for record in records:
+            self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+
+def _has_contents(filename: str) -> bool:
+    """ Returns True iff the file <filename> exists and is not empty. """
+    return os.path.exists(filename) and os.path.getsize(filename) > 0
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'datetime', 'hashlib', 'json',
+            'os', 'dataset', 'flight', 'metrics', 'parsers'
+        ],
+        'allowed-io': ['input_checksum', 'write_snapshot', 'restore_snapshot',
+                       'Checkpoint._read_journal', 'Checkpoint._append']
+    })
@@ -12,8 +12,14 @@ All of the files in this directory and all subdirectories are:
 Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
 """
 from __future__ import annotations
-from typing import List, Tuple, Dict, Optional
-from flight import Trip
+from typing import Iterator, List, Tuple, Dict, Optional, Union
+from collections import Counter
+from collections.abc import Sequence
+from array import array
+import itertools
+from flight import Trip, FlightSegment
+from segment_table import SegmentTable
+from metrics import METRICS
 
 """
     FF_Status: Dict[str, Tuple(int, int)] where the Tuple(status miles to reach, 
@@ -41,6 +47,274 @@ FREQUENT_FLYER_MULTIPLIER = {"Economy": 1, "Business": 5}
 CLASS_MULTIPLIER = {"Economy": 1, "Business": 2.5}
 
 
+class BookingIndex:
+    """ An index of the bookings made by a group of customers, which is kept
+        up to date as they book and cancel trips.
+
+        Customers created by the same Dataset share one BookingIndex, so that a
+        customer's flight segments, or the trip with a given reservation ID,
+        can be found without going through every customer and trip.
+    """
+    # === Private Attributes ===
+    # _trips:
+    #     the Customer of every trip recorded in this index and not canceled,
+    #     in the order they were booked.
+    # _booked:
+    #     the flight segments of each trip which are still booked, in the
+    #     order the trips were booked. Trips with no booked flight segments
+    #     are left out.
+    # _all:
+    #     every flight segment in _booked, in the order they were booked, or
+    #     None if it has to be built again because a trip was canceled.
+    # _rows:
+    #     the SegmentTable holding every flight segment in _all, with the row
+    #     of each one, in the same order, or None if they have to be found
+    #     again because a booking changed.
+    # _customer_trips:
+    #     the trips in _booked of each customer (indexed by their ID), in the
+    #     order they were booked.
+    # _reservations:
+    #     the (Trip, Customer) pairs for each reservation ID, in the order they
+    #     were booked, leaving out canceled trips. Reservation IDs are usually
+    #     unique, but the input dataset may reuse them.
+    # _airports:
+    #     for each IATA airport code, the number of booked flight segments
+    #     departing from or arriving at that airport, counting a segment once
+    #     for every trip which uses it. Airports with none are left out.
+    # _version:
+    #     the number of times the bookings in this index have changed.
+    _trips: Dict[Trip, Customer]
+    _booked: Dict[Trip, List[FlightSegment]]
+    _all: Optional[List[FlightSegment]]
+    _rows: Optional[Tuple[SegmentTable, array]]
+    _customer_trips: Dict[int, Dict[Trip, None]]
+    _reservations: Dict[str, List[Tuple[Trip, Customer]]]
+    _airports: Dict[str, int]
+    _version: int
+
+    def __init__(self) -> None:
+        """ Initialize an empty BookingIndex. """
+        self._version = 0
+        self._trips = {}
+        self._booked = {}
+        self._all = []
+        self._rows = None
+        self._customer_trips = {}
+        self._reservations = {}
+        self._airports = {}
+
+    @staticmethod
+    def for_customers(customers: List[Customer]) -> BookingIndex:
+        """ Returns a BookingIndex which covers every trip of <customers>.
+
+            If all of them share the same index, that index is returned.
+            Otherwise, a new one is built from their trips.
+        """
+        if customers:
+            index = customers[0].get_booking_index()
+            shared = True
+            for cus in customers:
+                if cus.get_booking_index() is not index:
+                    shared = False
+            if shared:
+                return index
+        index = BookingIndex()
+        for cus in customers:
+            for trip in cus.get_trips():
+                index.add_trip(trip, cus)
+        return index
+
+    def add_trip(self, trip: Trip, customer: Customer) -> None:
+        """ Records that <customer> has booked <trip>. """
+        self._record_trip(trip, customer)
+        for seg in trip.get_flight_segments():
+            self._count_airports(seg, 1)
+        self._version += 1
+
+    def add_trips(self, trips: List[Tuple[Trip, Customer]]) -> None:
+        """ Records that each customer has booked their trip in the (Trip,
+            Customer) pairs of <trips>, in order.
+
+            This is the same as calling add_trip for each pair, but each
+            booked flight segment is only counted once.
+        """
+        # the airports of each distinct segment are only looked up once
+        counts = Counter()
+        for trip, customer in trips:
+            self._record_trip(trip, customer)
+            counts.update(trip.get_flight_segments())
+        for seg in counts:
+            self._count_airports(seg, counts[seg])
+        self._version += 1
+
+    def _record_trip(self, trip: Trip, customer: Customer) -> None:
+        """ Records <trip> of <customer> in every attribute of this index
+            except _airports.
+        """
+        self._trips[trip] = customer
+        self._rows = None
+        if trip.get_flight_segments():
+            self._booked[trip] = list(trip.get_flight_segments())
+            if self._all is not None:
+                self._all.extend(trip.get_flight_segments())
+            if customer.get_id() not in self._customer_trips:
+                self._customer_trips[customer.get_id()] = {}
+            self._customer_trips[customer.get_id()][trip] = None
+        if trip.get_reservation_id() not in self._reservations:
+            self._reservations[trip.get_reservation_id()] = []
+        self._reservations[trip.get_reservation_id()].append((trip, customer))
+
+    def cancel_trip(self, trip: Trip, segments: List[FlightSegment]) -> None:
+        """ Records that <trip> is canceled, and that its customer is no longer
+            booked on the <segments> of it (once for each time a segment
+            appears in <segments>).
+        """
+        customer = self._trips.pop(trip, None)
+        if customer is not None:
+            reservations = self._reservations[trip.get_reservation_id()]
+            reservations.remove((trip, customer))
+            if not reservations:
+                del self._reservations[trip.get_reservation_id()]
+        booked = self._booked.get(trip, [])
+        for seg in segments:
+            if seg in booked:
+                booked.remove(seg)
+                self._all = None
+                self._rows = None
+                self._count_airports(seg, -1)
+        if trip in self._booked and not booked:
+            del self._booked[trip]
+            customer_trips = self._customer_trips[trip.customer_id]
+            del customer_trips[trip]
+            if not customer_trips:
+                del self._customer_trips[trip.customer_id]
+        self._version += 1
+
+    def get_version(self) -> int:
+        """ Returns a number which changes every time a booking is added to or
+            removed from this index.
+        """
+        return self._version
+
+    def get_trips(self) -> List[Tuple[Trip, Customer]]:
+        """ Returns every (Trip, Customer) pair recorded in this index and not
+            canceled, in the order they were booked.
+        """
+        return list(self._trips.items())
+
+    def get_segments(self, cid: int) -> List[FlightSegment]:
+        """ Returns the flight segments booked by the customer <cid>, in the
+            order they were booked.
+        """
+        final = []
+        for trip in self._customer_trips.get(cid, {}):
+            final.extend(self._booked[trip])
+        return final
+
+    def get_reservations(self, rid: str) -> List[Tuple[Trip, Customer]]:
+        """ Returns the (Trip, Customer) pairs with the reservation ID <rid>,
+            leaving out canceled trips.
+        """
+        return self._reservations.get(rid, [])
+
+    def is_known_airport(self, iata: str) -> bool:
+        """ Returns True iff a booked flight segment departs from or arrives at
+            the airport <iata>.
+        """
+        return iata in self._airports
+
+    def _count_airports(self, seg: FlightSegment, change: int) -> None:
+        """ Changes the number of bookings of the departure and arrival
+            airports of <seg> by <change>, dropping the airports which reach
+            zero.
+        """
+        for iata in [seg.get_dep(), seg.get_arr()]:
+            count = self._airports.get(iata, 0) + change
+            if count > 0:
+                self._airports[iata] = count
+            else:
+                self._airports.pop(iata, None)
+
+    def get_booked_list(self) -> List[FlightSegment]:
+        """ Returns every booked flight segment, in the order they were booked.
+            A segment appears once for every trip which uses it. The list must
+            not be changed.
+
+            The list is kept up to date as trips are booked. After a trip is
+            canceled, it is built again the next time it is asked for.
+        """
+        if self._all is None:
+            self._all = list(itertools.chain.from_iterable(
+                self._booked.values()))
+        return self._all
+
+    def get_booked_rows(self) -> Optional[Tuple[SegmentTable, array]]:
+        """ Returns the SegmentTable holding every booked flight segment, with
+            the row of each one, in the order of get_booked_list. Returns None
+            if no segment is booked, or if they are not all held by one table.
+            The rows must not be changed.
+
+            The rows are found again the first time they are asked for after
+            a booking changes.
+        """
+        if self._rows is None:
+            booked = self.get_booked_list()
+            if not booked:
+                return None
+            table = booked[0].get_table()
+            rows = array('i')
+            for seg in booked:
+                if seg.get_table() is not table:
+                    return None
+                rows.append(seg.get_row())
+            self._rows = (table, rows)
+        return self._rows
+
+    def get_all_segments(self) -> BookedSegments:
+        """ Returns a read-only view of every booked flight segment, in the
+            order they were booked, which stays up to date as bookings change.
+            A segment appears once for every trip which uses it.
+        """
+        return BookedSegments(self)
+
+
+class BookedSegments(Sequence):
+    """ A read-only view of the flight segments booked in a BookingIndex.
+
+        The view does not copy the segments: it always shows the current
+        bookings of its index, and cannot be used to change them.
+    """
+    # === Private Attributes ===
+    # _bookings:
+    #     the BookingIndex whose booked flight segments are shown.
+    _bookings: BookingIndex
+
+    def __init__(self, bookings: BookingIndex) -> None:
+        """ Initialize a view of the flight segments booked in <bookings>. """
+        self._bookings = bookings
+
+    def get_rows(self) -> Optional[Tuple[SegmentTable, array]]:
+        """ Returns the SegmentTable holding the booked flight segments, with
+            the row of each one, as BookingIndex.get_booked_rows does.
+        """
+        return self._bookings.get_booked_rows()
+
+    def __len__(self) -> int:
+        """ Returns the number of booked flight segments. """
+        return len(self._bookings.get_booked_list())
+
+    def __getitem__(self, i: Union[int, slice]) \
+            -> Union[FlightSegment, List[FlightSegment]]:
+        """ Returns the booked flight segment at position <i>, or a list of
+            them if <i> is a slice.
+        """
+        return self._bookings.get_booked_list()[i]
+
+    def __iter__(self) -> Iterator[FlightSegment]:
+        """ Returns an iterator over the booked flight segments. """
+        return iter(self._bookings.get_booked_list())
+
+
 class Customer:
     """ A Customer of Python Air.
 
@@ -72,6 +346,8 @@ class Customer:
     # _trips:
     #     this stores the dictionary of Trips and their
     #     corresponding costs.
+    # _bookings:
+    #     the BookingIndex that this customer's bookings are recorded in.
 
     name: str
     age: int
@@ -81,9 +357,15 @@ class Customer:
     _trips: Dict[Trip, float]
     _ff_status: str
     _miles: int
+    _bookings: BookingIndex
 
-    def __init__(self, cus_id: int, name: str, age: int, nat: str) -> None:
-        """ A Customer of Python Air. """
+    def __init__(self, cus_id: int, name: str, age: int, nat: str,
+                 bookings: Optional[BookingIndex] = None) -> None:
+        """ A Customer of Python Air.
+
+            The customer's bookings are recorded in <bookings>, or in a new
+            BookingIndex of their own if it is not given.
+        """
 
         self.name = name
         self.age = age
@@ -93,12 +375,21 @@ class Customer:
         self._trips = {}
         self._ff_status = ''
         self._miles = 0
+        if bookings is None:
+            bookings = BookingIndex()
+        self._bookings = bookings
 
     def get_id(self) -> int:
         """ Returns this customer's identification (ID). """
 
         return self._customer_id
 
+    def get_booking_index(self) -> BookingIndex:
+        """ Returns the BookingIndex this customer's bookings are recorded in.
+        """
+
+        return self._bookings
+
     def get_trips(self) -> List[Trip]:
         """ Returns a list of Trips booked for this customer. """
         final = []
@@ -176,8 +467,26 @@ class Customer:
         self.determine_ff_status()
         final = Trip(reservation_id, self._customer_id, trip_date, temp)
         self._trips[final] = cost
+        self._bookings.add_trip(final, self)
+        METRICS.count("book_trip.calls")
+        METRICS.count("book_trip.segments_booked", len(temp))
         return final
 
+    def restore(self, trips: List[Tuple[Trip, float]], miles: float,
+                costs: float, ff_status: str) -> None:
+        """ Restores the state of this customer after booking the <trips>
+            (with the cost recorded for each one), which gave them <miles>,
+            total flight <costs> and <ff_status>.
+
+            The seats of the <trips> are not booked, and the <trips> are not
+            recorded in this customer's BookingIndex.
+        """
+        for trip, cost in trips:
+            self._trips[trip] = cost
+        self._miles = miles
+        self.all_flight_costs = costs
+        self._ff_status = ff_status
+
     def cancel_trip(self, canceled_trip: Trip,
                     segments: List[Tuple[FlightSegment, str]]) -> None:
         """ Cancels this customer's Trip.
@@ -191,7 +500,7 @@ class Customer:
         temp = []
         percent = 0.0
         for flight in segments:
-            if flight in canceled_trip.get_flight_segments():
+            if flight[0] in canceled_trip.get_flight_segments():
                 temp.append(flight)
         for segi in temp:
             cost = segi[0].get_base_fare_cost() \
@@ -201,6 +510,10 @@ class Customer:
                 cost = cost * percent
             self.all_flight_costs -= cost + 100
             segi[0].cancel_seat(self._customer_id)
+        self._bookings.cancel_trip(canceled_trip,
+                                   [segi[0] for segi in temp])
+        METRICS.count("cancel_trip.trips_canceled")
+        METRICS.count("cancel_trip.segments_canceled", len(temp))
 
 
 if __name__ == '__main__':
@@ -212,6 +525,12 @@ if __name__ == '__main__':
             'doctest',
             'flight',
             '__future__',
+            'collections',
+            'collections.abc',
+            'itertools',
+            'array',
+            'segment_table',
+            'metrics',
         ],
-        'max-attributes': 8,
+        'max-attributes': 9,
     })
@@ -0,0 +1,283 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from __future__ import annotations
+from array import array
+import csv
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from airport import Airport
+from customer import BookingIndex, Customer
+from flight import Trip, FlightSchedule
+from metrics import METRICS
+from parsers import NumberedTrip, ParsedSegment, RejectionLog, SegmentParser, \
+    TripParser, format_trip, parse_segments_file, parse_trips_file
+from store import BinaryStore
+
+# DEFAULT_BASE_COST: Default rate per km for the base cost of a flight segment.
+DEFAULT_BASE_COST = 0.1225
+
+
+def read_rows(filename: str) -> Iterator[List[str]]:
+    """ Yields the rows of the CSV file <filename> one at a time, as lists of
+        strings. The file is only open while its rows are being read, and it
+        is closed once they run out (or the generator is discarded).
+
+        Precondition: the dataset file must be in CSV format.
+    """
+    with open(filename, newline='') as csv_file:
+        for row in csv.reader(csv_file):
+            yield row
+
+
+class Dataset:
+    """ All the airports, customers, flight segments and trips of the airline
+        system, built from the input dataset.
+
+        The airports are parsed once into a registry keyed by IATA code, and
+        the flight segments take their coordinates from that registry, so
+        every file only has to be read a single time.
+
+    === Public Attributes ===
+    airports:
+        the registry of every Airport, indexed by its IATA code.
+    customers:
+        every Customer, indexed by their customer ID.
+    bookings:
+        the index of the bookings made by every customer in customers.
+    flight_segments:
+        every FlightSegment, indexed by its departure date (and by route).
+    trips:
+        every Trip that was booked successfully, in the order of the input.
+    rejected_trips:
+        the malformed rows of the trips files, which were skipped.
+
+    === Representation Invariants ===
+        -  the departure and arrival airports of every segment in
+           flight_segments are in airports.
+    """
+    airports: Dict[str, Airport]
+    customers: Dict[int, Customer]
+    bookings: BookingIndex
+    flight_segments: FlightSchedule
+    trips: List[Trip]
+    rejected_trips: RejectionLog
+
+    def __init__(self) -> None:
+        """ Initialize an empty Dataset. """
+        self.airports = {}
+        self.customers = {}
+        self.bookings = BookingIndex()
+        self.flight_segments = FlightSchedule()
+        self.trips = []
+        self.rejected_trips = RejectionLog()
+
+    @staticmethod
+    def from_files(file_airports: str, file_customers: str,
+                   file_segments: str, file_trips: str,
+                   workers: int = 1) -> Dataset:
+        """ Returns a Dataset loaded from the given CSV files, reading each of
+            them exactly once. The segments and trips files are parsed by
+            <workers> processes, but the trips are always booked one at a
+            time, in the order of the file.
+
+            Precondition: the dataset files must be in CSV format.
+        """
+        data = Dataset()
+        data.load_airports(read_rows(file_airports))
+        data.load_parsed_segments(parse_segments_file(file_segments, workers))
+        data.load_customers(read_rows(file_customers))
+        data.load_parsed_trips(parse_trips_file(file_trips, workers,
+                                                data.rejected_trips))
+        return data
+
+    @METRICS.timed("load_airports")
+    def load_airports(self, log: Iterable[List[str]]) -> List[Airport]:
+        """ Adds the airports in the rows of <log> to the registry, and returns
+            them as a list in the order they were read.
+        """
+        final = []
+        for line in log:
+            airport = Airport(line[0], line[1], (float(line[2]),
+                                                 float(line[3])))
+            self.airports[line[0]] = airport
+            final.append(airport)
+        return final
+
+    @METRICS.timed("load_customers")
+    def load_customers(self, log: Iterable[List[str]]) -> Dict[int, Customer]:
+        """ Adds the customers in the rows of <log>, and returns a dictionary
+            of just those customers, indexed by their customer ID.
+        """
+        final = {}
+        for line in log:
+            final[int(line[0])] = Customer(int(line[0]), line[1],
+                                           int(line[2]), line[3],
+                                           self.bookings)
+        self.customers.update(final)
+        return final
+
+    def load_segments(self, log: Iterable[List[str]]) -> FlightSchedule:
+        """ Adds the flight segments in the rows of <log> to flight_segments,
+            and returns flight_segments.
+
+            Precondition: every airport used by the rows of <log> is already
+                          in the registry.
+        """
+        return self.load_parsed_segments(map(SegmentParser().parse, log))
+
+    @METRICS.timed("load_segments")
+    def load_parsed_segments(self, segments: Iterable[ParsedSegment]) \
+            -> FlightSchedule:
+        """ Adds the parsed flight <segments> to flight_segments, and returns
+            flight_segments.
+
+            Precondition: every airport used by the <segments> is already in
+                          the registry.
+        """
+        final = self.flight_segments
+        start = len(final.table)
+        for fid, dep, arr, _, dep_time, arr_time, duration, length \
+                in segments:
+            final.table.append_minutes(
+                fid, dep_time, arr_time, duration, length,
+                DEFAULT_BASE_COST * length, dep, arr,
+                (self.airports[dep].get_location(),
+                 self.airports[arr].get_location()))
+        # the route index is kept up to date by the schedule itself
+        final.add_rows(range(start, len(final.table)))
+        return final
+
+    @METRICS.timed("load_segments")
+    def load_stored_segments(self, store: BinaryStore) -> FlightSchedule:
+        """ Adds the flight segments in the <store> to flight_segments, and
+            returns flight_segments.
+
+            If no flight segment is loaded yet, the table of flight_segments
+            uses the columns of the <store> in place (see
+            SegmentTable.map_columns), and only the base fares are computed.
+            Otherwise, the columns are copied into the table. Either way, the
+            strings are interned in the same order as load_segments would.
+
+            Precondition: every airport used by the <store> is already in the
+                          registry.
+        """
+        final = self.flight_segments
+        table = final.table
+        is_empty = len(table) == 0 and not table.fids and not table.codes
+        fids = [table.intern_fid(store.get_string(position))
+                for position in store.get_column("segments.fids")]
+        codes = []
+        for position in store.get_column("segments.codes"):
+            code = store.get_string(position)
+            codes.append(table.intern_code(
+                code, self.airports[code].get_location()))
+        length = store.share_column("segments.length")
+        base_fare = array('d', [DEFAULT_BASE_COST * km for km in length])
+        if is_empty:
+            rows = table.map_columns(
+                *[store.share_column("segments." + name) for name in
+                  ["fid", "dep_loc", "arr_loc", "dep_time", "arr_time",
+                   "duration"]], length, base_fare)
+        else:
+            rows = table.extend_columns(
+                [fids[fid] for fid in store.get_column("segments.fid")],
+                [codes[code] for code in store.get_column("segments.dep_loc")],
+                [codes[code] for code in store.get_column("segments.arr_loc")],
+                store.get_column("segments.dep_time"),
+                store.get_column("segments.arr_time"),
+                store.get_column("segments.duration"), length, base_fare)
+        final.add_rows(rows)
+        return final
+
+    def load_trips(self, log: Iterable[List[str]]) -> List[Trip]:
+        """ Creates the Trip objects for the rows of <log> and makes the
+            bookings. Returns the trips that were booked successfully, which
+            are also added to trips.
+
+            The malformed rows, and the rows of unknown customers or
+            airports, are skipped and added to rejected_trips, with their
+            position in <log> as their line number.
+
+            Precondition: the flight segments used by the rows of <log> are
+                          already loaded.
+        """
+        # the itinerary column was split on its commas by the csv reader
+        return self.load_parsed_trips(TripParser().parse_lines(
+            (",".join(row) for row in log), self.rejected_trips))
+
+    @METRICS.timed("load_trips")
+    def load_parsed_trips(self, trips: Iterable[NumberedTrip],
+                          on_booked: Optional[Callable[[Trip, List[str]],
+                                                       None]] = None) \
+            -> List[Trip]:
+        """ Creates the Trip objects for the parsed <trips> (with their line
+            numbers) and makes the bookings, in order. Returns the trips that
+            were booked successfully, which are also added to trips.
+
+            A trip of a customer who is not loaded, or whose itinerary uses an
+            airport that no flight segment serves, is not booked: it is added
+            to rejected_trips instead. After each booking, <on_booked> (if it
+            is given) is called with the Trip and the seat type booked on each
+            of its flight segments.
+
+            Precondition: the flight segments used by the <trips> are already
+                          loaded.
+        """
+        final = []
+        for line_number, trip in trips:
+            booking_id, customer_id, dod, itinerary = trip
+            reason = self._find_unknown(customer_id, itinerary)
+            if reason is not None:
+                self.rejected_trips.add(line_number, reason, format_trip(trip))
+                continue
+            second_list = self.flight_segments.choose_flights(itinerary, dod)
+            imdone = self.customers[customer_id].book_trip(booking_id,
+                                                           second_list, dod)
+            if on_booked is not None:
+                on_booked(imdone, [seat_type for _, seat_type in second_list])
+            if second_list != []:
+                # added right away, so that it is kept even if a later trip
+                # cannot be booked
+                final.append(imdone)
+                self.trips.append(imdone)
+            else:
+                METRICS.count("load_trips.trips_rejected")
+        return final
+
+    def _find_unknown(self, customer_id: int,
+                      itinerary: List[Tuple[Tuple[str, str], str]]) \
+            -> Optional[str]:
+        """ Returns the reason why a trip of the customer <customer_id> on the
+            <itinerary> cannot be booked on this dataset, if it refers to a
+            customer or an airport which is unknown here, or None otherwise.
+        """
+        if customer_id not in self.customers:
+            return "unknown customer {}".format(customer_id)
+        for (dep, arr), _ in itinerary:
+            for iata in (dep, arr):
+                if not self.flight_segments.serves(iata):
+                    return "no flight segment serves airport {}".format(iata)
+        return None
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'csv', 'doctest', 'metrics',
+            'parsers', 'array', 'store',
+            '__future__', 'airport', 'customer', 'flight'
+        ],
+        'allowed-io': ['read_rows'],
+        'max-nested-blocks': 5
+    })
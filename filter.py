@@ -11,9 +11,52 @@ any changes, are expressly prohibited.
 All of the files in this directory and all subdirectories are:
 Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
 """
-from typing import List
-from customer import Customer
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, \
+    Union
+from collections import OrderedDict
+import datetime
+import re
+import numpy
+from customer import BookedSegments, BookingIndex, Customer
 from flight import FlightSegment
+from segment_table import MINUTES_PER_DAY, SegmentTable, to_days
+from metrics import METRICS
+
+# FILTER_CACHE_SIZE: the number of filter results a FilterCache remembers.
+FILTER_CACHE_SIZE = 16
+
+"""
+    EXPRESSION_FIELDS: the fields that an ExpressionFilter can test, and the
+                       comparisons allowed on each of them.
+"""
+EXPRESSION_FIELDS = {"customer": ["="], "trip": ["="],
+                     "duration": ["<", "<=", ">", ">=", "=", "!="],
+                     "date": ["=", "in"], "dep": ["=", "!="],
+                     "arr": ["=", "!="], "airport": ["=", "!="]}
+
+"""
+    COMPARISONS: the vectorized function for each comparison of a number.
+"""
+COMPARISONS = {"<": numpy.less, "<=": numpy.less_equal, ">": numpy.greater,
+               ">=": numpy.greater_equal, "=": numpy.equal,
+               "!=": numpy.not_equal}
+
+# CLAUSE_FORMAT: a single "field operator value" clause of an expression.
+CLAUSE_FORMAT = re.compile(r"^([a-z]+)\s*(<=|>=|!=|=|<|>|\s+in\s+)\s*(\S+)$")
+
+# DATE_FORMAT: a date, as it is written in an expression.
+DATE_FORMAT = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+
+# CLAUSE_COLUMNS: the SegmentTable columns that clauses are evaluated over.
+CLAUSE_COLUMNS = ["duration", "dep_time", "arr_time", "dep_loc", "arr_loc"]
+
+# Clause: a (field, comparison, value) clause of an expression.
+Clause = Tuple[str, str, Union[None, int, str, Tuple[int, ...]]]
+
+# Selector: chooses the positions of the rows matching some resolved clauses.
+Selector = Callable[[SegmentTable, numpy.ndarray, List[Clause]],
+                    numpy.ndarray]
 # from time import sleep
 
 
@@ -46,6 +89,17 @@ class Filter:
         """
         raise NotImplementedError
 
+    def to_clauses(self, customers: List[Customer], filter_string: str) \
+            -> Optional[List[Clause]]:
+        """ Returns the clauses of an expression (see ExpressionFilter) which
+            selects the same flight segments from the data as this filter does
+            with the <filter_string>.
+
+            Returns None if the <filter_string> is invalid, or if this filter
+            cannot be written as an expression.
+        """
+        return None
+
     def __str__(self) -> str:
         """ Returns a description of this filter to be displayed in the UI menu
         """
@@ -55,19 +109,15 @@ class Filter:
 class ResetFilter(Filter):
     """ A class for resetting all previously applied filters, if any. """
     def apply(self, customers: List[Customer], data: List[FlightSegment],
-              filter_string: str) -> List[FlightSegment]:
-        """ Reset all of the applied filters. Returns a List containing all the
-            flight segments corresponding to all trips of <customers>.
+              filter_string: str) -> Sequence[FlightSegment]:
+        """ Reset all of the applied filters. Returns a read-only view of all
+            the flight segments corresponding to all trips of <customers>, in
+            the order they were booked.
 
             The <data>, <customers>, and <filter_string> arguments for this
             type of filter are ignored.
         """
-        final = []
-        for cus in customers:
-            for trip in cus.get_trips():
-                for seg in trip.get_flight_segments():
-                    final.append(seg)
-        return final
+        return BookingIndex.for_customers(customers).get_all_segments()
 
     def __str__(self) -> str:
         """ Returns a description of this filter to be displayed in the UI menu.
@@ -92,21 +142,10 @@ class CustomerFilter(Filter):
               1. return the original list <data>, and
               2. ensure your code does not crash.
         """
-        NUMS = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-        for el in filter_string:
-            if el not in NUMS:
-                return data
-        final = []
-        temp_list = []
-        for cus in customers:
-            if cus.get_id() == int(filter_string):
-                for trip in cus.get_trips():
-                    for seg in trip.get_flight_segments():
-                        temp_list.append(seg)
-        for flight in data:
-            if flight in temp_list:
-                final.append(flight)
-        return final
+        clauses = self.to_clauses(customers, filter_string)
+        if clauses is None:
+            return data
+        return apply_clauses(customers, data, clauses)
 
     def __str__(self) -> str:
         """ Returns a description of this filter to be displayed in the UI menu.
@@ -114,6 +153,20 @@ class CustomerFilter(Filter):
         """
         return "Filter events based on customer ID"
 
+    def to_clauses(self, customers: List[Customer], filter_string: str) \
+            -> Optional[List[Clause]]:
+        """ Returns the clauses of an expression which selects the same flight
+            segments as this filter does with the <filter_string>, or None if
+            it is invalid.
+        """
+        NUMS = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+        if filter_string == '':
+            return None
+        for el in filter_string:
+            if el not in NUMS:
+                return None
+        return [("customer", "=", int(filter_string))]
+
 
 class DurationFilter(Filter):
     """ A class for selecting only the flight segments lasting either over or
@@ -135,29 +188,10 @@ class DurationFilter(Filter):
               1. return the original list <data>, and
               2. ensure your code does not crash.
         """
-        final = []
-        NUMS = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-        if ((filter_string[:1] != 'L') or (filter_string[:1] != 'G')) \
-                and len(filter_string[1:]) != 4:
+        clauses = self.to_clauses(customers, filter_string)
+        if clauses is None:
             return data
-        for el in filter_string[1:]:
-            if el not in NUMS:
-                return data
-        time = filter_string[:1]
-        mins = int(filter_string[1:])
-        if time == 'L':
-            for flight in data:
-                time2 = int(flight.get_duration().hour * 60 +
-                            flight.get_duration().minute)
-                if time2 < mins:
-                    final.append(flight)
-        elif time == 'G':
-            for flight in data:
-                time2 = int(flight.get_duration().hour * 60 +
-                            flight.get_duration().minute)
-                if time2 > mins:
-                    final.append(flight)
-        return final
+        return apply_clauses(customers, data, clauses)
 
     def __str__(self) -> str:
         """ Returns a description of this filter to be displayed in the UI menu
@@ -166,6 +200,23 @@ class DurationFilter(Filter):
                "L#### returns flight segments less than specified length, " \
                "G#### for greater "
 
+    def to_clauses(self, customers: List[Customer], filter_string: str) \
+            -> Optional[List[Clause]]:
+        """ Returns the clauses of an expression which selects the same flight
+            segments as this filter does with the <filter_string>, or None if
+            it is invalid.
+        """
+        NUMS = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+        if filter_string[:1] not in ['L', 'G'] \
+                or len(filter_string[1:]) != 4:
+            return None
+        for el in filter_string[1:]:
+            if el not in NUMS:
+                return None
+        if filter_string[:1] == 'L':
+            return [("duration", "<", int(filter_string[1:]))]
+        return [("duration", ">", int(filter_string[1:]))]
+
 
 class LocationFilter(Filter):
     """ A class for selecting only the flight segments which took place within
@@ -181,26 +232,18 @@ class LocationFilter(Filter):
             The <customers> list contains all customers from the input dataset.
 
             The filter string is valid if and only if it contains a valid
-            3-string IATA airport code. In the event of an invalid string:
+            3-string IATA airport code, optionally preceded by a D (only the
+            flight segments departing from that airport) or an A (only the
+            flight segments arriving at that airport). An airport code is valid
+            if a flight segment booked by one of the <customers> departs from or
+            arrives at that airport. In the event of an invalid string:
               1. return the original list <data>, and
               2. your code must not crash.
         """
-        final = []
-        airports = []
-        for cus in customers:
-            for trips in cus.get_trips():
-                for seg in trips.get_flight_segments():
-                    airports.append(seg.get_arr())
-                    airports.append(seg.get_dep())
-        for el in filter_string:
-            if not isinstance(el, str):
-                return data
-        if len(filter_string) == 3 and filter_string in airports:
-            for flight in data:
-                if flight.get_dep() == filter_string or flight.get_arr() == \
-                        filter_string:
-                    final.append(flight)
-        return final
+        clauses = self.to_clauses(customers, filter_string)
+        if clauses is None:
+            return data
+        return apply_clauses(customers, data, clauses)
 
     def __str__(self) -> str:
         """ Returns a description of this filter to be displayed in the UI menu.
@@ -208,7 +251,23 @@ class LocationFilter(Filter):
         """
         return "Filter flight segments based on an airport location;\n" \
                "DXXX returns flight segments that depart airport XXX,\n"\
-               "AXXX returns flight segments that arrive at airport XXX\n"
+               "AXXX returns flight segments that arrive at airport XXX,\n"\
+               "XXX returns flight segments that do either\n"
+
+    def to_clauses(self, customers: List[Customer], filter_string: str) \
+            -> Optional[List[Clause]]:
+        """ Returns the clauses of an expression which selects the same flight
+            segments as this filter does with the <filter_string>, or None if
+            it is invalid.
+        """
+        field = 'airport'
+        if len(filter_string) == 4 and filter_string[:1] in ['D', 'A']:
+            field = 'dep' if filter_string[:1] == 'D' else 'arr'
+            filter_string = filter_string[1:]
+        if len(filter_string) != 3 or not BookingIndex.for_customers(
+                customers).is_known_airport(filter_string):
+            return None
+        return [(field, "=", filter_string)]
 
 
 class DateFilter(Filter):
@@ -233,6 +292,24 @@ class DateFilter(Filter):
               1. return the original list <data>, and
               2. ensure your code does not crash.
         """
+        clauses = self.to_clauses(customers, filter_string)
+        if clauses is None:
+            return data
+        return apply_clauses(customers, data, clauses)
+
+    def __str__(self) -> str:
+        """ Returns a description of this filter to be displayed in the UI menu.
+            Unlike other __str__ methods, this one is required!
+        """
+        return "Filter flight segments based on dates; " \
+               "'YYYY-MM-DD/YYYY-MM-DD' or 'YYYY-MM-DD,YYYY-MM-DD'"
+
+    def to_clauses(self, customers: List[Customer], filter_string: str) \
+            -> Optional[List[Clause]]:
+        """ Returns the clauses of an expression which selects the same flight
+            segments as this filter does with the <filter_string>, or None if
+            it is invalid.
+        """
         ints = [[filter_string[:4], filter_string[5:7], filter_string[8:10],
                  filter_string[11:15], filter_string[16:18],
                  filter_string[19:]],
@@ -240,38 +317,25 @@ class DateFilter(Filter):
         for el in ints[0]:
             for num in el:
                 if num not in ints[1]:
-                    return data
+                    return None
         if not((filter_string[4:5] == '-' or ' ') and
                (filter_string[7:8] == '-' or ' ') and
                (filter_string[10:11] == '/' or ',' or ' ') and
                (filter_string[15:16] == '-' or ' ') and
                (filter_string[18:19] == '-' or ' ')):
-            return data
+            return None
 
-        import datetime
-        final = []
-        date1 = datetime.date(int(filter_string[:4]), int(filter_string[5:7]),
-                              int(filter_string[8:10]))
-        date2 = datetime.date(int(filter_string[11:15]),
-                              int(filter_string[16:18]),
-                              int(filter_string[19:]))
-        for flights in data:
-            aar = datetime.date(flights.get_times()[1].year,
-                                flights.get_times()[1].month,
-                                flights.get_times()[1].day)
-            dep = datetime.date(flights.get_times()[0].year,
-                                flights.get_times()[0].month,
-                                flights.get_times()[0].day)
-            if date1 <= aar <= date2 or date1 <= dep <= date2:
-                final.append(flights)
-        return final
-
-    def __str__(self) -> str:
-        """ Returns a description of this filter to be displayed in the UI menu.
-            Unlike other __str__ methods, this one is required!
-        """
-        return "Filter flight segments based on dates; " \
-               "'YYYY-MM-DD/YYYY-MM-DD' or 'YYYY-MM-DD,YYYY-MM-DD'"
+        try:
+            date1 = datetime.date(int(filter_string[:4]),
+                                  int(filter_string[5:7]),
+                                  int(filter_string[8:10]))
+            date2 = datetime.date(int(filter_string[11:15]),
+                                  int(filter_string[16:18]),
+                                  int(filter_string[19:]))
+        except ValueError:
+            # a part of a date is missing, or out of range
+            return None
+        return [("date", "in", (to_days(date1), to_days(date2)))]
 
 
 class TripFilter(Filter):
@@ -290,28 +354,412 @@ class TripFilter(Filter):
               1. return the original list <data>, and
               2. ensure your code does not crash.
         """
+        clauses = self.to_clauses(customers, filter_string)
+        if clauses is None:
+            return data
+        return apply_clauses(customers, data, clauses)
+
+    def __str__(self) -> str:
+        """ Returns a description of this filter to be displayed in the UI menu.
+            Unlike other __str__ methods, this one is required!
+        """
+        return "Filter events based on a reservation ID"
+
+    def to_clauses(self, customers: List[Customer], filter_string: str) \
+            -> Optional[List[Clause]]:
+        """ Returns the clauses of an expression which selects the same flight
+            segments as this filter does with the <filter_string>, or None if
+            it is invalid.
+        """
         allowed = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L',
                    'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X',
                    'Y', 'Z', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
         for el in filter_string:
             if el not in allowed:
-                return data
-        final = []
-        temp = []
-        for cus in customers:
-            for trips in cus.get_trips():
-                if trips.get_reservation_id() == filter_string:
-                    temp += trips.get_flight_segments()
-        for segment in data:
-            if segment in temp:
-                final.append(segment)
-        return final
+                return None
+        return [("trip", "=", filter_string)]
+
+
+class ExpressionFilter(Filter):
+    """ A class for selecting the flight segments which match every clause of
+        an expression, such as
+        "customer=123456 & duration<600 & date in 2019-01-01..2019-02-01 &
+        dep=YYZ".
+
+        The whole expression is evaluated at once, as NumPy boolean masks over
+        the columns of the SegmentTable holding the flight segments.
+    """
+    def apply(self, customers: List[Customer], data: List[FlightSegment],
+              filter_string: str) -> List[FlightSegment]:
+        """ Returns a list of all flight segments from <data> which match every
+            clause of the expression in <filter_string>.
+
+            The <customers> list contains all customers from the input dataset.
+
+            The filter string is valid if and only if it is one or more
+            clauses joined by "&", each one a field, a comparison and a value
+            (in any case):
+              - customer=ID: booked by the customer with that ID
+              - trip=ID: part of the trip with that reservation ID
+              - duration<MINUTES (or <=, >, >=, =, !=)
+              - date=YYYY-MM-DD or date in YYYY-MM-DD..YYYY-MM-DD: departing or
+                arriving on that date, or within that range of dates
+              - dep=XXX, arr=XXX, airport=XXX (or !=): departing from,
+                arriving at, or either, the airport XXX
+
+            If the filter string is invalid, do the following:
+              1. return the original list <data>, and
+              2. ensure your code does not crash.
+        """
+        clauses = self.to_clauses(customers, filter_string)
+        if clauses is None:
+            return data
+        return apply_clauses(customers, data, clauses)
+
+    def to_clauses(self, customers: List[Customer], filter_string: str) \
+            -> Optional[List[Clause]]:
+        """ Returns the clauses of the expression in <filter_string>, or None
+            if it is invalid.
+        """
+        return _parse_expression(filter_string)
 
     def __str__(self) -> str:
         """ Returns a description of this filter to be displayed in the UI menu.
-            Unlike other __str__ methods, this one is required!
         """
-        return "Filter events based on a reservation ID"
+        return "Filter flight segments with clauses joined by '&', e.g. " \
+               "'customer=123456 & duration<600 & " \
+               "date in 2019-01-01..2019-02-01 & dep=YYZ'"
+
+
+class SelectedSegments(list):
+    """ The flight segments chosen by apply_clauses, which remember the
+        SegmentTable holding them and their rows, so that filtering them again
+        does not need to go through them.
+
+        The list must not be changed, since its rows would no longer match.
+
+        === Public Attributes ===
+        table: the SegmentTable holding the flight segments.
+        rows: the row of each flight segment in <table>, in order.
+    """
+    table: SegmentTable
+    rows: numpy.ndarray
+
+    def __init__(self, segments: Iterable[FlightSegment], table: SegmentTable,
+                 rows: numpy.ndarray) -> None:
+        list.__init__(self, segments)
+        self.table = table
+        self.rows = rows
+
+
+class FilterCache:
+    """ A cache of the most recently used filter results.
+
+        A result is reused when the same type of filter is applied again, with
+        the same filter string (ignoring case and spacing), to the same list
+        of flight segments, and no booking has changed since. When the cache
+        is full, the least recently used result is forgotten.
+
+        Lists are told apart by their identity, not their contents, so a list
+        given to a FilterCache must not be changed afterwards. (The view of
+        the booked segments of a BookingIndex does change, but only along with
+        the version of the index, which is part of the key.)
+    """
+    # === Private Attributes ===
+    # _capacity:
+    #     the number of results this cache remembers.
+    # _entries:
+    #     the (data, result) of each remembered filter application, indexed by
+    #     (filter type, normalized filter string, id of data, booking version),
+    #     from the least to the most recently used. Keeping <data> alive means
+    #     its id cannot be given to another list while it is remembered.
+    _capacity: int
+    _entries: OrderedDict
+
+    def __init__(self, capacity: int = FILTER_CACHE_SIZE) -> None:
+        """ Initialize an empty FilterCache which remembers up to <capacity>
+            results.
+        """
+        self._capacity = capacity
+        self._entries = OrderedDict()
+
+    def apply(self, f: Filter, customers: List[Customer],
+              data: List[FlightSegment], filter_string: str,
+              compute: Optional[Callable[[List[Customer], List[FlightSegment],
+                                          str], List[FlightSegment]]] = None) \
+            -> List[FlightSegment]:
+        """ Returns the result of applying the filter <f> to <data> with the
+            <filter_string>, reusing a remembered result if there is one.
+
+            The <filter_string> is normalized first: it is converted to upper
+            case, and every run of spaces becomes a single space (leading and
+            trailing spaces are dropped). If there is no remembered result, it
+            is computed by calling <compute> (by default, <f>.apply) with the
+            <customers>, <data> and normalized filter string, and remembered.
+        """
+        if compute is None:
+            compute = f.apply
+        filter_string = " ".join(filter_string.upper().split())
+        data_id = None
+        if not isinstance(f, ResetFilter):
+            # a reset does not depend on the data it is applied to
+            data_id = id(data)
+        key = (type(f).__name__, filter_string, data_id,
+               BookingIndex.for_customers(customers).get_version())
+        if key in self._entries and (data_id is None or
+                                     self._entries[key][0] is data):
+            self._entries.move_to_end(key)
+            METRICS.count("filter_cache.hits")
+            return self._entries[key][1]
+        METRICS.count("filter_cache.misses")
+        final = compute(customers, data, filter_string)
+        self._entries[key] = (data, final)
+        if len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+        return final
+
+    def clear(self) -> None:
+        """ Forget every remembered result. """
+        self._entries.clear()
+
+
+def apply_filter(f: Filter, customers: List[Customer],
+                 data: List[FlightSegment], filter_string: str,
+                 select: Optional[Selector] = None) -> List[FlightSegment]:
+    """ Returns the result of applying the filter <f> to <data> with the
+        <filter_string>, which is the same as <f>.apply(customers, data,
+        filter_string), and records how long it took and the sizes of <data>
+        and of the result in METRICS.
+
+        A filter which can be written as an expression (see Filter.to_clauses)
+        is evaluated as NumPy masks over the columns of the SegmentTables
+        holding the flight segments, by <select> (see apply_clauses).
+    """
+    name = "filter." + type(f).__name__
+    METRICS.observe(name + ".input_size", len(data))
+    with METRICS.time_stage(name):
+        clauses = f.to_clauses(customers, filter_string)
+        if clauses is None:
+            final = f.apply(customers, data, filter_string)
+        else:
+            final = apply_clauses(customers, data, clauses, select)
+    METRICS.observe(name + ".output_size", len(final))
+    return final
+
+
+def apply_clauses(customers: List[Customer], data: List[FlightSegment],
+                  clauses: List[Clause], select: Optional[Selector] = None) \
+        -> List[FlightSegment]:
+    """ Returns the flight segments of <data> (in order) which match every one
+        of the <clauses> of an expression, for the bookings of <customers>.
+
+        When the flight segments of <data> are all held by one SegmentTable,
+        the matching ones are chosen by calling <select> (by default,
+        select_rows) with that table, the rows of <data> and the resolved
+        clauses, and they are returned as SelectedSegments.
+    """
+    if select is None:
+        select = select_rows
+    index = BookingIndex.for_customers(customers)
+    located = segment_rows(data)
+    if located is None:
+        def mask_of(table: SegmentTable) -> numpy.ndarray:
+            """ Returns the mask of the rows of <table> which match. """
+            return clause_mask(table_columns(table),
+                               resolve_clauses(table, clauses, index),
+                               numpy.arange(len(table)))
+
+        return select_segments(data, mask_of)
+    table, rows = located
+    positions = select(table, rows, resolve_clauses(table, clauses, index))
+    segments = data if isinstance(data, list) else list(data)
+    return SelectedSegments(map(segments.__getitem__, positions.tolist()),
+                            table, rows[positions])
+
+
+def select_rows(table: SegmentTable, rows: numpy.ndarray,
+                clauses: List[Clause]) -> numpy.ndarray:
+    """ Returns the positions in <rows>, in order, of the rows of <table> which
+        match every one of the resolved <clauses> (see resolve_clauses).
+    """
+    return numpy.flatnonzero(clause_mask(table_columns(table), clauses, rows))
+
+
+def segment_rows(data: Sequence[FlightSegment]) \
+        -> Optional[Tuple[SegmentTable, numpy.ndarray]]:
+    """ Returns the SegmentTable holding every flight segment of <data>, with
+        the row of each one, in order. Returns None if <data> is empty, or if
+        its flight segments are not all held by one table.
+
+        The rows of SelectedSegments, and of the view of the booked segments of
+        a BookingIndex, are already known. Any other <data> is gone through.
+    """
+    if isinstance(data, SelectedSegments):
+        return data.table, data.rows
+    if isinstance(data, BookedSegments):
+        located = data.get_rows()
+        if located is None:
+            return None
+        return located[0], numpy.frombuffer(located[1],
+                                            dtype=located[1].typecode)
+    if not data:
+        return None
+    table = data[0].get_table()
+    rows = array('i')
+    for seg in data:
+        if seg.get_table() is not table:
+            return None
+        rows.append(seg.get_row())
+    return table, numpy.frombuffer(rows, dtype=rows.typecode)
+
+
+def _parse_expression(filter_string: str) -> Optional[List[Clause]]:
+    """ Returns the (field, comparison, value) clauses of the expression in
+        <filter_string>, or None if it is not a valid expression. Dates are
+        given as (first day, last day) in days since EPOCH, durations and
+        customer IDs as ints, and airport codes and reservation IDs as
+        upper-case strings.
+
+    >>> _parse_expression("DURATION<600 & DEP=yyz")
+    [('duration', '<', 600), ('dep', '=', 'YYZ')]
+    >>> _parse_expression("date in 1970-01-01..1970-01-03")
+    [('date', 'in', (0, 2))]
+    >>> _parse_expression("duration in 600") is None
+    True
+    """
+    final = []
+    for clause in filter_string.split("&"):
+        match = CLAUSE_FORMAT.match(clause.strip().lower())
+        if match is None:
+            return None
+        field, op, value = match.group(1), match.group(2).strip(), \
+            match.group(3)
+        if op not in EXPRESSION_FIELDS.get(field, []):
+            return None
+        if field in ["customer", "duration"]:
+            if not value.isdigit():
+                return None
+            final.append((field, op, int(value)))
+        elif field == "date":
+            days = []
+            for part in value.split(".."):
+                day = _parse_date(part)
+                if day is None:
+                    return None
+                days.append(day)
+            if len(days) != (2 if op == "in" else 1):
+                return None
+            final.append((field, op, (days[0], days[-1])))
+        elif field == "trip":
+            if not value.isalnum():
+                return None
+            final.append((field, op, value.upper()))
+        else:
+            if len(value) != 3 or not value.isalpha():
+                return None
+            final.append((field, op, value.upper()))
+    return final
+
+
+def _parse_date(text: str) -> Optional[int]:
+    """ Returns the date "YYYY-MM-DD" in <text> in days since EPOCH, or None if
+        it is not a valid date.
+    """
+    match = DATE_FORMAT.match(text)
+    if match is None:
+        return None
+    try:
+        return to_days(datetime.date(int(match.group(1)),
+                                     int(match.group(2)),
+                                     int(match.group(3))))
+    except ValueError:
+        return None
+
+
+def resolve_clauses(table: SegmentTable, clauses: List[Clause],
+                    index: BookingIndex) -> List[Clause]:
+    """ Returns the <clauses> rewritten in terms of the rows of <table>, so
+        that they can be evaluated by clause_mask.
+
+        The customer and trip clauses are looked up in <index>, and become
+        ("rows", "=", rows) clauses listing the rows of <table> they match.
+        The airport codes are replaced by the integers standing for them in
+        <table>, or by None if no row of <table> uses that airport.
+    """
+    final = []
+    for field, op, value in clauses:
+        if field in ["customer", "trip"]:
+            if field == "customer":
+                segments = index.get_segments(value)
+            else:
+                segments = []
+                for trip, _ in index.get_reservations(value):
+                    segments.extend(trip.get_flight_segments())
+            final.append(("rows", op, tuple(seg.get_row() for seg in segments
+                                            if seg.get_table() is table)))
+        elif field in ["dep", "arr", "airport"]:
+            final.append((field, op, table.find_code(value)))
+        else:
+            final.append((field, op, value))
+    return final
+
+
+def clause_mask(columns: Dict[str, numpy.ndarray], clauses: List[Clause],
+                rows: numpy.ndarray) -> numpy.ndarray:
+    """ Returns a boolean mask over the <rows>, which is True for the rows
+        matching every one of the resolved <clauses> (see resolve_clauses).
+
+        The <columns> hold the CLAUSE_COLUMNS of the SegmentTable, indexed by
+        their names.
+    """
+    final = numpy.ones(len(rows), dtype=bool)
+    for field, op, value in clauses:
+        if field == "duration":
+            final &= COMPARISONS[op](columns["duration"][rows], value)
+        elif field == "date":
+            dep = columns["dep_time"][rows] // MINUTES_PER_DAY
+            arr = columns["arr_time"][rows] // MINUTES_PER_DAY
+            final &= ((value[0] <= dep) & (dep <= value[1])) | \
+                ((value[0] <= arr) & (arr <= value[1]))
+        elif field == "rows":
+            final &= numpy.isin(rows, numpy.array(value, dtype=numpy.int64))
+        else:
+            mask = numpy.zeros(len(rows), dtype=bool)
+            if value is not None and field in ["dep", "airport"]:
+                mask |= columns["dep_loc"][rows] == value
+            if value is not None and field in ["arr", "airport"]:
+                mask |= columns["arr_loc"][rows] == value
+            final &= ~mask if op == "!=" else mask
+    return final
+
+
+def table_columns(table: SegmentTable) -> Dict[str, numpy.ndarray]:
+    """ Returns the CLAUSE_COLUMNS of <table> as NumPy arrays, indexed by their
+        names. The arrays share the memory of the columns.
+
+        The arrays must not outlive the call they were made in, since the
+        columns cannot grow while the arrays exist.
+    """
+    return {name: numpy.asarray(getattr(table, name))
+            for name in CLAUSE_COLUMNS}
+
+
+def select_segments(data: List[FlightSegment],
+                    mask_of: Callable[[SegmentTable], numpy.ndarray]) \
+        -> List[FlightSegment]:
+    """ Returns the flight segments of <data> (in order) whose row is True in
+        the mask of their SegmentTable. The mask of each table is computed
+        once, by calling <mask_of>.
+    """
+    masks = {}
+    final = []
+    for flight in data:
+        table = flight.get_table()
+        if id(table) not in masks:
+            masks[id(table)] = mask_of(table).tolist()
+        if masks[id(table)][flight.get_row()]:
+            final.append(flight)
+    return final
 
 
 if __name__ == '__main__':
@@ -319,7 +767,8 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-import-modules': [
             'python_ta', 'typing', 'datetime', 'doctest',
-            'customer', 'flight', 'time'
+            'customer', 'flight', 'time', 'segment_table', 're',
+            'numpy', 'collections', 'metrics', 'array'
         ],
         'max-nested-blocks': 5,
         'allowed-io': ['apply', '__str__']
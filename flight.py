@@ -12,23 +12,63 @@ All of the files in this directory and all subdirectories are:
 Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
 """
 from __future__ import annotations
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from collections.abc import MutableMapping
+import bisect
 import datetime
+from segment_table import MINUTES_PER_DAY, SegmentTable, from_days, \
+    from_minutes
+from metrics import METRICS
 
 # Global Airplane Seat Type capacity
 AIRPLANE_CAPACITY = {"Economy": 150, "Business": 22}
 
 
+def segment_duration(dep_day: int, dep_hour: int, dep_minute: int,
+                     arr_day: int, arr_hour: int, arr_minute: int) -> int:
+    """ Returns the duration, in minutes, recorded for a flight departing at
+        <dep_hour>:<dep_minute> on the day of the month <dep_day>, and
+        arriving at <arr_hour>:<arr_minute> on the day of the month <arr_day>.
+
+        This is the duration the airline system has always used: it counts
+        whole hours between the two times, plus the difference between their
+        minutes, and is 0 for flights landing in the next month.
+
+    >>> segment_duration(1, 9, 40, 1, 19, 45)
+    605
+    >>> segment_duration(2, 22, 42, 3, 9, 0)
+    702
+    """
+    if arr_day == dep_day:
+        # if they are in the same day
+        if arr_hour < dep_hour:
+            raise ValueError("the flight arrives before it departs")
+        hours = arr_hour - dep_hour
+    elif arr_day > dep_day and not arr_hour == dep_hour:
+        # if they are in two different days and not 24
+        hours = (24 - dep_hour) + arr_hour
+    elif arr_day > dep_day:
+        # if they add up to 24
+        hours = 23
+    else:
+        return 0
+    return hours * 60 + abs(arr_minute - dep_minute)
+
+
 class FlightSegment:
     """ A FlightSegment offered by the airline system.
 
+        A FlightSegment is a lightweight view over one row of a SegmentTable,
+        which stores the data of many segments in compact columns.
+
     === Public Attributes ===
     seat_capacity:
         the class of seat and total number of seats available on a specific
         segment.
     seat_availability:
         the class of seat and number of seats still available on a specific
-        segment.
+        segment. It reads and writes the seats sold in the segment's row, so
+        changing it changes the segment.
 
     === Representation Invariants ===
         -  the keys in seat_availability.keys() must all be >= 0
@@ -36,164 +76,408 @@ class FlightSegment:
     """
 
     # === Private Attributes ===
-    # _flight_id:
-    #     a unique identifier for this flight.
-    # _time:
-    #     a tuple containing the departure and arrival time of a segment.
-    # _manifest:
-    #      a list of tuples containing all customers' ID and type of flight
-    #      class that they've taken (e.g. economy).
-    # _base_fare_cost:
-    #     the base cost of the fare (e.g., $0.1225/km).
-    # _flight_duration:
-    #     the total time it takes for the flight segment to complete.
-    # _flight_length:
-    #     the number of kilometres between the departure and arrival locations.
-    # _dep_loc:
-    #     the unique 3-digit (IATA) airport identifier of where the flight
-    #     segment is departing (i.e. leaving from).
-    # _arr_loc:
-    #     the unique 3-digit (IATA) airport identifier of where the flight
-    #     segment is landing (i.e. arriving to).
-    # _long_lat:
-    #     a tuple of tuples, containing the longitude and latitude of the
-    #     departure and arrival destinations.
+    # _table:
+    #     the SegmentTable holding the data of this flight segment: its
+    #     identifier, departure and arrival airports and times, duration,
+    #     length, base fare cost, the seats sold and its manifest (the seat_type
+    #     booked by each customer, indexed by their ID).
+    # _row:
+    #     the row of <_table> which belongs to this flight segment.
     #
     # === Representation Invariants ===
-    #     -  _flight_length >= 0
-    #     -  _dep_loc and _arr_loc must be exactly three characters [A-Z]
-    #        and are assumed to be valid and distinct IATA airport codes.
-
-    seat_capacity: Dict[str, int]  # str: class, int: seats_available
-    seat_availability: Dict[str, int]  # str: class, int: seats_available
-    _flight_id: str
-    _time: Tuple[datetime.datetime, datetime.datetime]
-    _base_fare_cost: float
-    _flight_duration: datetime.time
-    _flight_length: float
-    _dep_loc: str
-    _arr_loc: str
-    _long_lat: Tuple[Tuple[float, float], Tuple[float, float]]
-    _manifest: List[Tuple[int, str]]  # (customer_id, seat_type)
+    #     -  the length of the row is >= 0
+    #     -  the departure and arrival airports of the row must be exactly
+    #        three characters [A-Z] and are assumed to be valid and distinct
+    #        IATA airport codes.
+
+    __slots__ = ('_table', '_row')
+    _table: SegmentTable
+    _row: int
 
     def __init__(self, fid: str, dep: datetime.datetime, arr: datetime.datetime,
                  base_cost: float, length: float, dep_loc: str, arr_loc: str,
                  long_lat: Tuple[Tuple[float, float],
-                                 Tuple[float, float]]) -> None:
+                                 Tuple[float, float]],
+                 table: Optional[SegmentTable] = None) -> None:
         """ Initialize a FlightSegment object based on the parameters specified.
+
+            The segment is added as a new row of <table>. If no <table> is
+            given, the segment gets a table of its own.
         """
-        self.seat_availability = {"Business": 0, "Economy": 0}
-        self.seat_capacity = AIRPLANE_CAPACITY
-        self._flight_id = fid
-        self._time = (dep, arr)
-        self._base_fare_cost = (base_cost * length)
-        self._dep_loc = dep_loc
-        self._arr_loc = arr_loc
-        self._long_lat = long_lat
-        if arr.day == dep.day:
-            # if they are in the same day
-            self._flight_duration =\
-                datetime.time(arr.hour-dep.hour, abs(arr.minute-dep.minute),
-                              abs(arr.second - dep.second))
-        elif arr.day > dep.day and not (24 - dep.hour) + arr.hour == 24:
-            # if they are in two different days and not 24]
-            self._flight_duration = \
-                datetime.time((24 - dep.hour) +
-                              arr.hour, abs(arr.minute - dep.minute),
-                              abs(arr.second - dep.second))
-        elif arr.day > dep.day and (24 - dep.hour) + arr.hour == 24:
-            # if they don't add up to 24
-            self._flight_duration = \
-                datetime.time(23, abs(arr.minute - dep.minute),
-                              abs(arr.second - dep.second))
-        else:
-            self._flight_duration = datetime.time()
-        self._flight_length = length
-        self._manifest = []
+        duration = segment_duration(dep.day, dep.hour, dep.minute, arr.day,
+                                    arr.hour, arr.minute)
+        if table is None:
+            table = SegmentTable(list(AIRPLANE_CAPACITY))
+        self._table = table
+        self._row = table.append(fid, dep, arr, duration, length,
+                                 base_cost * length, dep_loc, arr_loc,
+                                 long_lat)
+
+    @staticmethod
+    def view(table: SegmentTable, row: int) -> FlightSegment:
+        """ Returns a FlightSegment for the existing <row> of <table>. """
+        segment = object.__new__(FlightSegment)
+        segment._table = table
+        segment._row = row
+        return segment
+
+    def __eq__(self, other: object) -> bool:
+        """ Returns True iff <other> is a view of the same row of the same
+            SegmentTable.
+        """
+        return isinstance(other, FlightSegment) and \
+            self._table is other._table and self._row == other._row
+
+    def __hash__(self) -> int:
+        return hash((id(self._table), self._row))
+
+    @property
+    def seat_capacity(self) -> Dict[str, int]:
+        """ The class of seat and total number of seats on this segment. """
+        return AIRPLANE_CAPACITY
+
+    @property
+    def seat_availability(self) -> SeatCounts:
+        """ The class of seat and number of seats booked on this segment. """
+        return SeatCounts(self._table, self._row)
+
+    def get_table(self) -> SegmentTable:
+        """ Returns the SegmentTable that stores this flight segment. """
+
+        return self._table
+
+    def get_row(self) -> int:
+        """ Returns the row of the SegmentTable that stores this segment. """
+
+        return self._row
 
     def __repr__(self) -> str:
-        return ("[" + str(self._flight_id) + "]:" + str(self._dep_loc) + "->" +
-                str(self._arr_loc))
+        return ("[" + self.get_fid() + "]:" + self.get_dep() + "->" +
+                self.get_arr())
 
     def get_length(self) -> float:
         """ Returns the length, in KMs, of this flight segment. """
 
-        return self._flight_length
+        return self._table.length[self._row]
 
     def get_times(self) -> Tuple[datetime.datetime, datetime.datetime]:
         """ Returns the (departure, arrival) time of this flight segment. """
 
-        return self._time
+        return (from_minutes(self._table.dep_time[self._row]),
+                from_minutes(self._table.arr_time[self._row]))
 
     def get_arr(self) -> str:
         """ Returns the arrival airport (i.e. the IATA). """
 
-        return self._arr_loc
+        return self._table.codes[self._table.arr_loc[self._row]]
 
     def get_dep(self) -> str:
         """ Returns the departure airport (i.e. the IATA). """
 
-        return self._dep_loc
+        return self._table.codes[self._table.dep_loc[self._row]]
 
     def get_fid(self) -> str:
         """ Returns the flight identifier. """
 
-        return self._flight_id
+        return self._table.fids[self._table.fid[self._row]]
 
     def get_long_lat(self) -> Tuple[Tuple[float, float], Tuple[float, float]]:
         """ Returns the longitude and latitude of a FlightSegment,
             specifically like this: ((LON1, LAT1), (LON2, LAT2)).
         """
 
-        return self._long_lat
+        return (self._table.locations[self._table.dep_loc[self._row]],
+                self._table.locations[self._table.arr_loc[self._row]])
 
     def get_duration(self) -> datetime.time:
         """ Returns the duration of the flight. """
 
-        return self._flight_duration
+        minutes = self._table.duration[self._row]
+        return datetime.time(minutes // 60, minutes % 60)
 
     def get_base_fare_cost(self) -> float:
         """ Returns the base fare cost for this flight segment. """
 
-        return self._base_fare_cost
+        return self._table.base_fare[self._row]
 
     def check_manifest(self, cid: int) -> bool:
         """ Returns True if a certain customer <cid> has booked a seat
             on this specific flight, otherwise False.
         """
-        for cus in self._manifest:
-            if cus[0] == cid:
-                return True
-        return False
+        manifest = self._table.manifests[self._row]
+        return manifest is not None and cid in manifest
 
     def check_seat_class(self, cid: int) -> Optional[str]:
         """ Checks the manifest to see what class of cabin a certain customer
             (based on their <cid>) has booked. None is returned in the event
             there is no seat booked for that <cid>.
         """
-        for cus in self._manifest:
-            if cus[0] == cid:
-                return cus[1]
-        return None
+        manifest = self._table.manifests[self._row]
+        if manifest is None:
+            return None
+        return manifest.get(cid)
+
+    def get_manifest(self) -> List[Tuple[int, str]]:
+        """ Returns the (customer_id, seat_type) pairs of every customer booked
+            on this flight segment, in the order they booked.
+        """
+        manifest = self._table.manifests[self._row]
+        if manifest is None:
+            return []
+        return list(manifest.items())
 
     def book_seat(self, cid: int, seat_type: str) -> None:
         """ Book a seat of the given <seat_type> for the customer <cid>.
             If that customer is already booked, do nothing. If the seat
             type is different, and it is available, make the change.
         """
-        if not self.seat_availability[seat_type] \
-               == self.seat_capacity[seat_type]:
-            self._manifest.append((cid, seat_type))
-            self.seat_availability[seat_type] += 1
+        manifest = self._table.manifests[self._row]
+        if manifest is None:
+            manifest = {}
+            self._table.manifests[self._row] = manifest
+        booked = manifest.get(cid)
+        sold = self._table.sold[seat_type]
+        if booked != seat_type and \
+                not sold[self._row] == self.seat_capacity[seat_type]:
+            if booked is not None:
+                # give up the seat of the other type
+                self._table.sold[booked][self._row] -= 1
+            manifest[cid] = seat_type
+            sold[self._row] += 1
 
     def cancel_seat(self, cid: int) -> None:
         """	If a seat has already been booked by <cid>, cancel the booking
             and restore the seat's availability. Otherwise, do nothing and
             return None.
         """
-        for i in range(len(self._manifest)-1):
-            if self._manifest[i][0] == cid:
-                self._manifest.pop(i)
+        manifest = self._table.manifests[self._row]
+        if manifest is not None and cid in manifest:
+            self._table.sold[manifest.pop(cid)][self._row] -= 1
+
+
+# ------------------------------------------------------------------------------
+class SeatCounts(MutableMapping):
+    """ The number of seats booked in each class of seat on one flight segment,
+        read from and written to the seats sold in its row of a SegmentTable.
+
+        The classes of seat are those of the table, so none can be added or
+        removed.
+
+    >>> table = SegmentTable(["Economy", "Business"])
+    >>> row = table.append_minutes("AC1", 0, 60, 60, 500.0, 61.25, "YYZ",
+    ...                            "YUL", ((0.0, 0.0), (0.0, 0.0)))
+    >>> seats = FlightSegment.view(table, row).seat_availability
+    >>> seats["Economy"] += 1
+    >>> seats, list(table.sold["Economy"])
+    ({'Economy': 1, 'Business': 0}, [1])
+    """
+    # === Private Attributes ===
+    # _table:
+    #     the SegmentTable holding the seats sold.
+    # _row:
+    #     the row of the flight segment in <_table>.
+    _table: SegmentTable
+    _row: int
+
+    def __init__(self, table: SegmentTable, row: int) -> None:
+        """ Initialize the seat counts of the <row> of <table>. """
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, seat_class: str) -> int:
+        return self._table.sold[seat_class][self._row]
+
+    def __setitem__(self, seat_class: str, count: int) -> None:
+        """ Set the number of seats booked in <seat_class> to <count>.
+
+            Raises KeyError if <seat_class> is not a class of seat of the
+            table.
+        """
+        if seat_class not in self._table.sold:
+            raise KeyError(seat_class)
+        self._table.sold[seat_class][self._row] = count
+
+    def __delitem__(self, seat_class: str) -> None:
+        """ Raises TypeError, since no class of seat can be removed. """
+        raise TypeError("the classes of seat of a flight segment cannot be "
+                        "removed")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.sold)
+
+    def __len__(self) -> int:
+        return len(self._table.sold)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class FlightSchedule(Dict[datetime.date, List[FlightSegment]]):
+    """ All FlightSegments offered by the airline system, indexed by their
+        departure date, together with an index of the segments flying each
+        route on each date.
+
+    === Public Attributes ===
+    table:
+        the SegmentTable storing the data of the segments added to this
+        schedule.
+    route_index:
+        maps a (departure IATA, arrival IATA, departure date) key to a list of
+        (departure time, position, segment) entries sorted by departure time,
+        where the departure time is in minutes since EPOCH, and position is
+        the segment's index in the list for that date.
+
+    === Representation Invariants ===
+        -  every segment stored in this schedule appears in route_index
+           exactly once, under its own route and departure date.
+    """
+    # === Private Attributes ===
+    # _airports:
+    #     the IATA code of every airport which a segment of this schedule
+    #     departs from or arrives at.
+    table: SegmentTable
+    route_index: Dict[Tuple[str, str, datetime.date],
+                      List[Tuple[int, int, FlightSegment]]]
+    _airports: Set[str]
+
+    def __init__(self) -> None:
+        """ Initialize an empty FlightSchedule. """
+        dict.__init__(self)
+        self.table = SegmentTable(list(AIRPLANE_CAPACITY))
+        self.route_index = {}
+        self._airports = set()
+
+    def add_segment(self, date: datetime.date, segment: FlightSegment) -> None:
+        """ Add <segment> to the end of the segments departing on <date>,
+            and record it in the route index.
+        """
+        if date not in self:
+            self[date] = []
+        key = (segment.get_dep(), segment.get_arr(), date)
+        if key not in self.route_index:
+            self.route_index[key] = []
+            self._airports.update(key[:2])
+        bisect.insort(self.route_index[key],
+                      (segment.get_table().dep_time[segment.get_row()],
+                       len(self[date]), segment))
+        self[date].append(segment)
+
+    def add_row(self, date: datetime.date, row: int) -> FlightSegment:
+        """ Add the segment stored in <row> of this schedule's table to the
+            end of the segments departing on <date>, and return it.
+        """
+        segment = FlightSegment.view(self.table, row)
+        self.add_segment(date, segment)
+        return segment
+
+    def add_rows(self, rows: Iterable[int]) -> None:
+        """ Add the segments stored in the <rows> of this schedule's table, in
+            order, to the end of the segments departing on the day each one
+            departs.
+
+            This is the same as calling add_row for each row, but the entries
+            of each route are sorted once at the end, instead of one by one.
+        """
+        table = self.table
+        dates = {}
+        changed = set()
+        for row in rows:
+            day = table.dep_time[row] // MINUTES_PER_DAY
+            if day not in dates:
+                dates[day] = from_days(day)
+            date = dates[day]
+            if date not in self:
+                self[date] = []
+            key = (table.codes[table.dep_loc[row]],
+                   table.codes[table.arr_loc[row]], date)
+            if key not in self.route_index:
+                self.route_index[key] = []
+            segment = FlightSegment.view(table, row)
+            self.route_index[key].append((table.dep_time[row], len(self[date]),
+                                          segment))
+            changed.add(key)
+            self[date].append(segment)
+        for key in changed:
+            # the positions on a date are unique, so no two entries are equal
+            self.route_index[key].sort()
+            self._airports.update(key[:2])
+
+    @staticmethod
+    def from_dict(flight_segments: Dict[datetime.date, List[FlightSegment]]) \
+            -> FlightSchedule:
+        """ Returns a FlightSchedule holding the same segments as
+            <flight_segments>, in the same order.
+        """
+        schedule = FlightSchedule()
+        for date in flight_segments:
+            for segment in flight_segments[date]:
+                schedule.add_segment(date, segment)
+        return schedule
+
+    def serves(self, iata: str) -> bool:
+        """ Returns True iff a segment of this schedule departs from or
+            arrives at the airport <iata>.
+        """
+        return iata in self._airports
+
+    def departures_after(self, dep: str, arr: str, date: datetime.date,
+                         earliest: Optional[int]) \
+            -> List[Tuple[int, int, FlightSegment]]:
+        """ Returns the route index entries for the flights from <dep> to
+            <arr> on <date> that depart no earlier than <earliest> (in minutes
+            since EPOCH), sorted by departure time. If <earliest> is None,
+            every entry is returned.
+        """
+        entries = self.route_index.get((dep, arr, date), [])
+        if earliest is None:
+            return entries
+        return entries[bisect.bisect_left(entries, (earliest,)):]
+
+    def choose_flights(self, temp_inter: List[Tuple[Tuple[str, str], str]],
+                       date: datetime.date) -> List[Tuple[FlightSegment, str]]:
+        """ Returns the (FlightSegment, seat_type) pairs booked for the
+            itinerary legs in <temp_inter>, searching day by day starting from
+            <date>. The legs that get booked are removed from <temp_inter>. If
+            the whole itinerary cannot be booked before running out of
+            flights, return [].
+
+            On each day, the segments are considered in the order they are
+            stored for that day: the first one flying a remaining leg is
+            booked, and after that a segment is only booked if it departs after
+            the last booked one arrives.
+        """
+        final = []
+        examined = 0
+        days = 0
+        while temp_inter:
+            if date not in self:
+                final = []
+                break
+            days += 1
+            # the position (within this day) and arrival of the last booking
+            position = -1
+            arrival = None
+            while True:
+                best = None
+                for segs in temp_inter:
+                    for entry in self.departures_after(segs[0][0], segs[0][1],
+                                                       date, arrival):
+                        examined += 1
+                        if entry[1] > position and \
+                                (best is None or entry[1] < best[0][1]):
+                            best = (entry, segs)
+                if best is None:
+                    # nothing else can be booked on this day
+                    break
+                position = best[0][1]
+                arrival = best[0][2].get_table().arr_time[
+                    best[0][2].get_row()]
+                final.append((best[0][2], best[1][1]))
+                temp_inter.remove(best[1])
+            date += datetime.timedelta(days=1)
+        METRICS.observe("choose_flights.segments_examined", examined)
+        METRICS.observe("choose_flights.days_searched", days)
+        return final
 
 
 # ------------------------------------------------------------------------------
@@ -263,8 +547,9 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-import-modules': [
             'python_ta', 'typing', 'doctest',
-            'datetime', '__future__'
+            'datetime', '__future__', 'bisect', 'segment_table', 'metrics',
+            'collections.abc'
         ],
         'max-attributes': 11,
-        'max-args': 9
+        'max-args': 10
     })
@@ -0,0 +1,332 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from typing import Dict, List, Tuple
+import argparse
+import csv
+import datetime
+import itertools
+import math
+import os
+import random
+from dataset import read_rows
+
+""" ======================== Module Description ================================
+
+    This file generates synthetic datasets, in the same format as the files in
+    data/, which are larger than the shipped ones. The airline flies a hub and
+    spoke network: every hub is connected to every other hub, and every spoke
+    airport is connected to its nearest hubs. Each trip is a walk through that
+    network, starting early enough that load_trips can book all of its legs.
+    When the airports file does not have enough airports for the spokes, the
+    missing ones are made up, each near a real airport.
+
+    Run it with:  python generator.py --scale 10 --output-dir data/x10
+"""
+
+# DEFAULT_SEED: the seed of the random numbers, unless another is given.
+DEFAULT_SEED = 148
+
+# START_DATE: the first day of the generated flight schedule.
+START_DATE = datetime.date(2019, 1, 1)
+
+# HUBS: the number of hub airports.
+HUBS = 20
+
+# SPOKES_PER_SCALE: the number of spoke airports at a scale of 1.
+SPOKES_PER_SCALE = 40
+
+# CODE_LETTERS: the letters of an IATA airport code.
+CODE_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# MADE_UP_SPREAD: how far (in degrees of longitude and latitude) a made-up
+#                 airport can be from the real airport it is placed near.
+MADE_UP_SPREAD = 3.0
+
+# HUBS_PER_SPOKE: the number of (nearest) hubs each spoke airport flies to.
+HUBS_PER_SPOKE = 2
+
+# CUSTOMERS_PER_SCALE: the number of customers at a scale of 1.
+CUSTOMERS_PER_SCALE = 2200
+
+# TRIPS_PER_SCALE: the number of trips at a scale of 1.
+TRIPS_PER_SCALE = 42000
+
+# MAX_LEGS: the most legs in the itinerary of a trip.
+MAX_LEGS = 5
+
+# BUSINESS_SHARE: the fraction of legs booked in Business class.
+BUSINESS_SHARE = 0.2
+
+# CRUISE_SPEED: the average speed of a flight, in km per hour, not counting
+#               the TAXI_MINUTES spent on the ground.
+CRUISE_SPEED = 800
+TAXI_MINUTES = 30
+
+# EARTH_RADIUS: the radius of the Earth, in km.
+EARTH_RADIUS = 6371
+
+FIRST_NAMES = ["Olive", "Patty", "Paddy", "Barb", "Sal", "Ray", "Wanda",
+               "Ella", "Will", "Anita", "Bill", "Chris", "Dee", "Justin"]
+LAST_NAMES = ["Yew", "O'Furniture", "Dwyer", "Monella", "Sun", "Tuck",
+              "Vator", "Power", "Board", "Lott", "Cross", "Case", "Time"]
+NATIONALITIES = ["Canadian", "Japanese", "Brazilian", "French", "Indian",
+                 "Kenyan", "Mexican", "Australian", "German", "Chilean"]
+
+
+def distance(start: Tuple[float, float], end: Tuple[float, float]) -> int:
+    """ Returns the great circle distance (in whole km) between the <start>
+        and <end> (longitude, latitude) locations.
+
+    >>> distance((0.0, 0.0), (0.0, 90.0))
+    10008
+    """
+    lon1, lat1, lon2, lat2 = map(math.radians, start + end)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return round(2 * EARTH_RADIUS * math.asin(math.sqrt(a)))
+
+
+def build_network(airports: Dict[str, Tuple[float, float]], spokes: int,
+                  rng: random.Random) -> Tuple[List[str], Dict[str, List[str]]]:
+    """ Returns the hubs and the routes of a hub and spoke network over some
+        of the <airports> (IATA codes mapped to their locations). The routes
+        are the airports that can be flown to from each airport in the
+        network. The network has HUBS hubs and (at most) <spokes> spoke
+        airports, chosen with <rng>.
+    """
+    codes = rng.sample(sorted(airports), min(len(airports), HUBS + spokes))
+    hubs = codes[:HUBS]
+    routes = {}
+    for hub in hubs:
+        routes[hub] = [other for other in hubs if other != hub]
+    for spoke in codes[HUBS:]:
+        nearest = sorted(hubs, key=lambda hub: distance(airports[spoke],
+                                                        airports[hub]))
+        routes[spoke] = nearest[:HUBS_PER_SPOKE]
+        for hub in routes[spoke]:
+            routes[hub].append(spoke)
+    return hubs, routes
+
+
+def generate_dataset(directory: str, scale: float = 1.0,
+                     seed: int = DEFAULT_SEED, days: int = 181,
+                     airports_file: str = 'data/airports.csv') \
+        -> Tuple[str, str, str, str]:
+    """ Writes a synthetic dataset into <directory>, about <scale> times the
+        size of the shipped one, and returns the names of its (airports,
+        customers, segments, trips) files. The same <seed> always gives the
+        same dataset. The flight schedule covers <days> days, starting on
+        START_DATE, and the airports are taken from <airports_file>, along
+        with made-up ones if it does not have enough (see add_airports).
+
+        Every route between hubs is flown <scale> times a day on average, and
+        every other route once a day.
+
+        Raises ValueError if <days> is less than 1, or if <scale> is less than
+        1 (every route is flown at least once a day, so that every trip can
+        be booked) or more than max_scale() (there are not enough airport
+        codes for the spokes).
+    """
+    if days < 1:
+        raise ValueError("days must be at least 1")
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    files = tuple(os.path.join(directory, name) for name in
+                  ['airports.csv', 'customers.csv', 'segments.csv',
+                   'trips.csv'])
+    rows = {}
+    locations = {}
+    for row in read_rows(airports_file):
+        rows[row[0]] = row
+        locations[row[0]] = (float(row[2]), float(row[3]))
+    if not 1 <= scale <= max_scale():
+        raise ValueError("scale must be between 1 and {:g}".format(
+            max_scale()))
+    add_airports(rows, locations, HUBS + round(SPOKES_PER_SCALE * scale), rng)
+    hubs, routes = build_network(locations,
+                                 round(SPOKES_PER_SCALE * scale), rng)
+
+    with open(files[0], 'w', newline='') as file:
+        csv.writer(file).writerows(rows[code] for code in routes)
+    customer_ids = _write_customers(files[1],
+                                    max(1, round(CUSTOMERS_PER_SCALE * scale)),
+                                    rng)
+    _write_segments(files[2], hubs, routes, locations, scale, days, rng)
+    _write_trips(files[3], routes, customer_ids,
+                 max(1, round(TRIPS_PER_SCALE * scale)), days, rng)
+    return files
+
+
+def max_scale() -> float:
+    """ Returns the largest scale a dataset can be generated at, where every
+        three letter airport code is used by a hub or a spoke.
+
+    >>> round(max_scale(), 1)
+    438.9
+    """
+    return (len(CODE_LETTERS) ** 3 - HUBS) / SPOKES_PER_SCALE
+
+
+def add_airports(rows: Dict[str, List[str]],
+                 locations: Dict[str, Tuple[float, float]], count: int,
+                 rng: random.Random) -> None:
+    """ Makes up airports until there are at least <count> of them, adding
+        their rows (as in an airports file) to <rows> and their locations to
+        <locations>, both indexed by their IATA codes. Each made-up airport
+        has an unused code, and is placed at most MADE_UP_SPREAD degrees away
+        from a real airport chosen with <rng>.
+
+    >>> rows = {"YYZ": ["YYZ", "Pearson", "-79.6", "43.7"]}
+    >>> locations = {"YYZ": (-79.6, 43.7)}
+    >>> add_airports(rows, locations, 3, random.Random(1))
+    >>> len(rows), len(locations), rows["YYZ"][1]
+    (3, 3, 'Pearson')
+    >>> all(abs(locations[code][0] + 79.6) <= MADE_UP_SPREAD for code in rows)
+    True
+    """
+    if len(locations) >= count:
+        return
+    real = sorted(locations)
+    codes = ["".join(letters) for letters in
+             itertools.product(CODE_LETTERS, repeat=3)
+             if "".join(letters) not in locations]
+    for code in rng.sample(codes, count - len(locations)):
+        near = locations[rng.choice(real)]
+        lon = near[0] + rng.uniform(-MADE_UP_SPREAD, MADE_UP_SPREAD)
+        lat = near[1] + rng.uniform(-MADE_UP_SPREAD, MADE_UP_SPREAD)
+        lon = (lon + 180) % 360 - 180
+        lat = max(-89.0, min(89.0, lat))
+        rows[code] = [code, "Made-up Airport " + code,
+                      "{:.6f}".format(lon), "{:.6f}".format(lat)]
+        locations[code] = (float(rows[code][2]), float(rows[code][3]))
+
+
+def _write_customers(filename: str, count: int, rng: random.Random) \
+        -> List[int]:
+    """ Writes <count> customers with unique IDs to <filename>, and returns
+        their IDs.
+    """
+    customer_ids = rng.sample(range(100000, 1000000), count)
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        for cid in customer_ids:
+            writer.writerow([cid, "{} {}".format(rng.choice(FIRST_NAMES),
+                                                 rng.choice(LAST_NAMES)),
+                             rng.randint(18, 90), rng.choice(NATIONALITIES)])
+    return customer_ids
+
+
+def _write_segments(filename: str, hubs: List[str],
+                    routes: Dict[str, List[str]],
+                    locations: Dict[str, Tuple[float, float]], scale: float,
+                    days: int, rng: random.Random) -> None:
+    """ Writes the flight segments flying the <routes> on each of the <days>
+        to <filename>. Routes between two of the <hubs> are flown <scale>
+        times a day on average: int(<scale>) flights every day, and one more
+        flight on a random share of the days given by the fraction of <scale>.
+
+        Precondition: scale >= 1
+    """
+    extra_share = scale - int(scale)
+    flights = []
+    for dep in routes:
+        for arr in routes[dep]:
+            if dep in hubs and arr in hubs:
+                flights.extend([(dep, arr, 1.0)] * int(scale))
+                if extra_share > 0:
+                    flights.append((dep, arr, extra_share))
+            else:
+                flights.append((dep, arr, 1.0))
+
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        for number, (dep, arr, share) in enumerate(flights):
+            fid = "PA-{:03d}".format(number + 1)
+            length = distance(locations[dep], locations[arr])
+            # at least an hour, so that the loader never mistakes a flight
+            # landing later the same hour for one landing the next day
+            duration = max(60, min(20 * 60, TAXI_MINUTES +
+                                   round(length / CRUISE_SPEED * 60)))
+            for day in range(days):
+                if share < 1 and rng.random() >= share:
+                    continue
+                date = START_DATE + datetime.timedelta(days=day)
+                dep_time = datetime.datetime.combine(
+                    date, datetime.time(rng.randrange(24), rng.randrange(60)))
+                arr_time = dep_time + datetime.timedelta(minutes=duration)
+                writer.writerow([fid, dep, arr, date.strftime("%Y:%m:%d"),
+                                 dep_time.strftime("%H:%M"),
+                                 arr_time.strftime("%H:%M"), length])
+
+
+def _write_trips(filename: str, routes: Dict[str, List[str]],
+                 customer_ids: List[int], count: int, days: int,
+                 rng: random.Random) -> None:
+    """ Writes <count> trips, each one booked by one of the <customer_ids>,
+        to <filename>. Every itinerary follows the <routes>, and starts early
+        enough in the <days> of the schedule that all of its legs can be
+        booked, since at least one leg is booked every day.
+    """
+    codes = sorted(routes)
+    reservation_ids = set()
+    with open(filename, 'w') as file:
+        while len(reservation_ids) < count:
+            rid = "".join(rng.choice("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+                          for _ in range(5))
+            if rid in reservation_ids:
+                continue
+            reservation_ids.add(rid)
+            legs = rng.randint(1, min(MAX_LEGS, days - 1)) \
+                if days > 1 else 1
+            stops = [rng.choice(codes)]
+            for _ in range(legs):
+                options = [code for code in routes[stops[-1]]
+                           if len(stops) < 2 or code != stops[-2]]
+                stops.append(rng.choice(options or routes[stops[-1]]))
+            date = START_DATE + datetime.timedelta(
+                days=rng.randrange(max(1, days - legs)))
+            itinerary = ["('{}','{}')".format(
+                code, "Business" if rng.random() < BUSINESS_SHARE
+                else "Economy") for code in stops[:-1]]
+            itinerary.append("('{}','')".format(stops[-1]))
+            file.write("{},{},{},[{}]\n".format(rid, rng.choice(customer_ids),
+                                                date.isoformat(),
+                                                ",".join(itinerary)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic airline dataset.")
+    parser.add_argument(
+        '--scale', type=float, default=1.0,
+        help="the size of the dataset relative to the shipped one, from 1 to "
+             "{:g}".format(max_scale()))
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--days', type=int, default=181)
+    parser.add_argument('--output-dir', default='data/synthetic')
+    args = parser.parse_args()
+    for name in generate_dataset(args.output_dir, args.scale, args.seed,
+                                 args.days):
+        print("Wrote", name)
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'argparse', 'csv', 'datetime',
+            'itertools', 'math', 'os', 'random', 'dataset'
+        ],
+        'allowed-io': ['_write_customers', '_write_segments', '_write_trips',
+                       'generate_dataset'],
+        'max-args': 7
+    })
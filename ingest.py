@@ -0,0 +1,277 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from typing import Iterable, Iterator, List, Optional, Tuple
+import os
+import time
+from checkpoint import Checkpoint
+from dataset import Dataset
+from flight import Trip
+from metrics import METRICS
+from parsers import NumberedTrip, TripParser, parse_segments_file, \
+    parse_trips_file
+
+""" ======================== Module Description ================================
+
+    This file adds new segments and trips files to a Dataset which is already
+    loaded, such as the files of each new day, without loading the earlier
+    ones again.
+
+    The new flight segments are appended to the table and the schedule of the
+    dataset, and only the routes and dates they fly are indexed again. The new
+    trips are booked against the seats already sold, in the order of the file,
+    just as if they had been at the end of the trips file loaded first. The
+    work done is proportional to the number of new rows.
+
+    A trips file which is still being written can be followed with a
+    TripTail, which books its new lines in batches of bounded size.
+
+    When the bookings of the dataset are kept by a Checkpoint, it must be
+    given to ingest_segments, ingest_trips and TripTail, so that the new
+    segments files and trips are written to its journal. Otherwise, the new
+    trips are lost the next time the bookings are restored from the
+    checkpoint, and so are the new flight segments, which the journal refers
+    to by their rows.
+"""
+
+# DEFAULT_BATCH_SIZE: the most trips a TripTail books at a time.
+DEFAULT_BATCH_SIZE = 1000
+
+# POLL_INTERVAL: the seconds a TripTail waits before looking at its file
+#                again, when it has no new trips.
+POLL_INTERVAL = 1.0
+
+
+@METRICS.timed("ingest_segments")
+def ingest_segments(data: Dataset, file_segments: str, workers: int = 1,
+                    checkpoint: Optional[Checkpoint] = None) -> range:
+    """ Adds the flight segments in the segments file <file_segments> to
+        <data>, and returns the range of the rows of its table that they were
+        stored in. The file is parsed by <workers> processes. The file is
+        recorded in the journal of the <checkpoint>, if it is given.
+
+        Precondition: every airport used by <file_segments> is already in the
+                      registry of <data>.
+
+        The trips booked on ingested segments are restored by the checkpoint:
+
+    >>> import tempfile
+    >>> from dataset import read_rows
+    >>> directory = tempfile.mkdtemp()
+    >>> first, second, empty, snapshot, journal = [
+    ...     os.path.join(directory, name) for name in
+    ...     ['first.csv', 'second.csv', 'empty.csv', 'snapshot', 'journal']]
+    >>> with open('data/segments_small.csv') as file:
+    ...     lines = file.readlines()
+    >>> with open(first, 'w') as file:
+    ...     file.writelines(lines[:len(lines) // 2])
+    >>> with open(second, 'w') as file:
+    ...     file.writelines(lines[len(lines) // 2:])
+    >>> open(empty, 'w').close()
+    >>> def load() -> Tuple[Dataset, Checkpoint]:
+    ...     data = Dataset()
+    ...     _ = data.load_airports(read_rows('data/airports.csv'))
+    ...     _ = data.load_segments(read_rows(first))
+    ...     _ = data.load_customers(read_rows('data/customers.csv'))
+    ...     checkpoint = Checkpoint(snapshot, journal, [
+    ...         'data/airports.csv', 'data/customers.csv', first])
+    ...     _ = checkpoint.load_trips(data, empty)
+    ...     return data, checkpoint
+    >>> def booked(data: Dataset) -> List[Tuple[str, List[int]]]:
+    ...     return [(trip.get_reservation_id(),
+    ...              [seg.get_row() for seg in trip.get_flight_segments()])
+    ...             for trip in data.trips]
+    >>> data, checkpoint = load()
+    >>> ingest_segments(data, second, checkpoint=checkpoint)
+    range(5890, 11780)
+    >>> len(ingest_trips(data, 'data/trips_small.csv',
+    ...                  checkpoint=checkpoint))
+    7107
+    >>> checkpoint.close()
+    >>> restored, checkpoint = load()
+    >>> checkpoint.close()
+    >>> booked(restored) == booked(data)
+    True
+    """
+    start = len(data.flight_segments.table)
+    if checkpoint is None:
+        data.load_parsed_segments(parse_segments_file(file_segments, workers))
+    else:
+        checkpoint.load_segments(data, file_segments, workers)
+    METRICS.count("ingest.segments_added",
+                  len(data.flight_segments.table) - start)
+    return range(start, len(data.flight_segments.table))
+
+
+@METRICS.timed("ingest_trips")
+def ingest_trips(data: Dataset, file_trips: str, workers: int = 1,
+                 checkpoint: Optional[Checkpoint] = None) -> List[Trip]:
+    """ Books the trips in the trips file <file_trips> for <data>, and returns
+        the ones that were booked successfully. The file is parsed by
+        <workers> processes, and its malformed rows are added to the rejected
+        trips of <data>. The bookings are recorded in the journal of the
+        <checkpoint>, if it is given.
+
+        Precondition: the flight segments used by <file_trips> are already
+                      loaded.
+    """
+    final = _book(data, parse_trips_file(file_trips, workers,
+                                         data.rejected_trips), checkpoint)
+    METRICS.count("ingest.trips_booked", len(final))
+    return final
+
+
+def _book(data: Dataset, trips: Iterable[NumberedTrip],
+          checkpoint: Optional[Checkpoint]) -> List[Trip]:
+    """ Books the parsed <trips> for <data>, through the <checkpoint> if it is
+        given, and returns the ones that were booked successfully.
+    """
+    if checkpoint is None:
+        return data.load_parsed_trips(trips)
+    return checkpoint.load_parsed_trips(data, trips)
+
+
+class TripTail:
+    """ A trips file which is still being written to, whose new trips are
+        booked for a Dataset as they are added.
+
+        Only whole lines are read: a last line without a newline is left in
+        the file until it is finished. Each poll books at most a batch of
+        trips, so the trips are only read as fast as they are asked for. The
+        malformed lines are added to the rejected trips of the Dataset.
+
+        The position in the file only moves past a line once its trip has
+        been booked, or the line has been rejected, so a line is never
+        skipped because booking an earlier one failed.
+    """
+    # === Private Attributes ===
+    # _data:
+    #     the Dataset the trips are booked for.
+    # _filename:
+    #     the name of the trips file.
+    # _batch_size:
+    #     the most trips booked by one poll.
+    # _position:
+    #     the byte offset in the file of the first line not read yet.
+    # _line:
+    #     the line number of the first line not read yet.
+    # _parser:
+    #     the parser of the lines of the file.
+    # _checkpoint:
+    #     the Checkpoint whose journal the bookings are recorded in, or None.
+    _data: Dataset
+    _filename: str
+    _batch_size: int
+    _position: int
+    _line: int
+    _parser: TripParser
+    _checkpoint: Optional[Checkpoint]
+
+    def __init__(self, data: Dataset, filename: str,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 position: int = 0, line: int = 1,
+                 checkpoint: Optional[Checkpoint] = None) -> None:
+        """ Initialize a TripTail which books the trips in the trips file
+            <filename> for <data>, at most <batch_size> at a time, starting
+            with the line at the byte offset <position>, which is line number
+            <line> of the file. The bookings are recorded in the journal of
+            the <checkpoint>, if it is given.
+
+            Precondition: <batch_size> > 0, and <position> is the start of a
+                          line of the file.
+        """
+        self._data = data
+        self._filename = filename
+        self._batch_size = batch_size
+        self._position = position
+        self._line = line
+        self._parser = TripParser()
+        self._checkpoint = checkpoint
+
+    def get_position(self) -> int:
+        """ Returns the byte offset of the first line of the file which has
+            not been read yet. A later TripTail can start from there.
+        """
+        return self._position
+
+    def get_line(self) -> int:
+        """ Returns the line number of the first line of the file which has
+            not been read yet.
+        """
+        return self._line
+
+    def poll(self) -> List[Trip]:
+        """ Books the trips on the next whole lines of the file (at most a
+            batch of them), and returns the ones that were booked
+            successfully. Returns [] if there is no new whole line.
+
+            Raises ValueError if the file is now shorter than the lines read.
+        """
+        if os.path.getsize(self._filename) < self._position:
+            raise ValueError("{} was truncated".format(self._filename))
+        lines = []
+        with open(self._filename, 'rb') as file:
+            file.seek(self._position)
+            while len(lines) < self._batch_size:
+                line = file.readline()
+                if not line.endswith(b"\n"):
+                    # the line has not been finished yet
+                    break
+                lines.append(line)
+        METRICS.observe("trip_tail.batch_size", len(lines))
+        final = _book(self._data, self._read_lines(lines), self._checkpoint)
+        METRICS.count("ingest.trips_booked", len(final))
+        return final
+
+    def _read_lines(self, lines: List[bytes]) -> Iterator[NumberedTrip]:
+        """ Yields the trips on the <lines>, which are the next lines of the
+            file, with their line numbers. The position in the file only moves
+            past a line once the trip on it has been booked, which is when the
+            next one is asked for, or once the line has been rejected.
+        """
+        for line in lines:
+            yield from self._parser.parse_lines(
+                [line.decode()], self._data.rejected_trips, self._line)
+            self._position += len(line)
+            self._line += 1
+
+    def follow(self, interval: float = POLL_INTERVAL,
+               idle: Optional[float] = None) -> Iterator[List[Trip]]:
+        """ Yields the trips booked by each poll which found new lines. When
+            there are none, waits <interval> seconds before polling again,
+            and stops once nothing new has been found for <idle> seconds (or
+            never, if <idle> is None).
+
+            The next batch is only read once the one before it is used.
+        """
+        waited = 0.0
+        while idle is None or waited < idle:
+            start = self._position
+            trips = self.poll()
+            if self._position != start:
+                waited = 0.0
+                yield trips
+            else:
+                time.sleep(interval)
+                waited += interval
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'os', 'time', 'checkpoint',
+            'dataset', 'flight', 'metrics', 'parsers'
+        ],
+        'allowed-io': ['TripTail.poll']
+    })
@@ -0,0 +1,200 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from dataset import Dataset, read_rows
+
+""" ======================== Module Description ================================
+
+    This file reports how much memory each stage of loading a dataset uses,
+    with tracemalloc, and checks it against a budget for each stage.
+
+    The stages are: reading the rows of every file, then creating the
+    airports, the flight segments, the customers, and the trips (with their
+    bookings), in the same order as application.py. For each stage, the
+    report gives the memory it added and its peak, the memory added by each
+    type of object (for the objects tracked by the garbage collector) and by
+    each source file, and for the segments stage, the cost of each flight
+    segment.
+
+    Run it with:  python memory.py --budget segments=40000000
+    It exits with status 1 if a stage goes over its budget.
+"""
+
+# STAGES: the loading stages, in the order they run.
+STAGES = ["rows", "airports", "segments", "customers", "trips"]
+
+# DEFAULT_BUDGETS: the most bytes each stage may add while loading the full
+#                  shipped dataset, and the most bytes per flight segment.
+DEFAULT_BUDGETS = {"rows": 85000000, "airports": 500000,
+                   "segments": 40000000, "customers": 1000000,
+                   "trips": 60000000, "per_segment": 600}
+
+# TOP_ENTRIES: the number of object types and source files listed per stage.
+TOP_ENTRIES = 10
+
+# Report: the memory used by one loading stage.
+Report = Dict[str, Any]
+
+
+def _count_objects() -> Dict[str, Tuple[int, int]]:
+    """ Returns the number and total (shallow) size of the objects of each type
+        tracked by the garbage collector, except those of tracemalloc itself.
+    """
+    gc.collect()
+    final = {}
+    for obj in gc.get_objects():
+        if type(obj).__module__ == 'tracemalloc':
+            continue
+        name = type(obj).__name__
+        count, size = final.get(name, (0, 0))
+        final[name] = (count + 1, size + sys.getsizeof(obj))
+    return final
+
+
+def measure_stage(name: str, stage: Callable[[], Any]) -> Tuple[Any, Report]:
+    """ Runs <stage>, and returns its result along with a report of the
+        memory it used, named <name>.
+
+        Precondition: tracemalloc is tracing.
+    """
+    objects_before = _count_objects()
+    snapshot_before = tracemalloc.take_snapshot()
+    current_before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+
+    result = stage()
+
+    current, peak = tracemalloc.get_traced_memory()
+    by_file = {}
+    for stat in tracemalloc.take_snapshot().compare_to(snapshot_before,
+                                                       'filename'):
+        if stat.size_diff > 0:
+            by_file[stat.traceback[0].filename] = stat.size_diff
+    # the snapshots are large lists, which must not be counted as objects
+    # created by the stage
+    del snapshot_before
+    objects_after = _count_objects()
+
+    by_type = {}
+    for type_name in objects_after:
+        count, size = objects_after[type_name]
+        old_count, old_size = objects_before.get(type_name, (0, 0))
+        if count != old_count:
+            by_type[type_name] = {"objects": count - old_count,
+                                  "bytes": size - old_size}
+    return result, {
+        "stage": name, "added": current - current_before,
+        "peak": peak - current_before,
+        "by_type": dict(sorted(by_type.items(),
+                               key=lambda item: -item[1]["bytes"])
+                        [:TOP_ENTRIES]),
+        "by_file": dict(sorted(by_file.items(), key=lambda item: -item[1])
+                        [:TOP_ENTRIES])}
+
+
+def measure_load(files: Tuple[str, str, str, str]) -> List[Report]:
+    """ Loads the dataset in the (airports, customers, segments, trips) <files>
+        and returns the memory report of each of the STAGES.
+    """
+    data = Dataset()
+    rows = []
+    stages = {"rows": lambda: rows.extend(list(read_rows(name))
+                                          for name in files),
+              "airports": lambda: data.load_airports(rows[0]),
+              "segments": lambda: data.load_segments(rows[2]),
+              "customers": lambda: data.load_customers(rows[1]),
+              "trips": lambda: data.load_trips(rows[3])}
+    tracemalloc.start()
+    try:
+        reports = [measure_stage(name, stages[name])[1] for name in STAGES]
+    finally:
+        tracemalloc.stop()
+    segments = reports[STAGES.index("segments")]
+    segments["segments"] = len(data.flight_segments.table)
+    segments["per_segment"] = segments["added"] / max(1, len(
+        data.flight_segments.table))
+    return reports
+
+
+def check_budgets(reports: List[Report], budgets: Dict[str, float]) \
+        -> List[str]:
+    """ Returns a description of every way the <reports> go over the
+        <budgets>: the most bytes each stage may add, indexed by its name, and
+        the most bytes per flight segment, indexed by "per_segment". Stages
+        without a budget are not checked.
+    """
+    final = []
+    for report in reports:
+        if report["stage"] in budgets and \
+                report["added"] > budgets[report["stage"]]:
+            final.append("{} added {} bytes (budget: {})".format(
+                report["stage"], report["added"], budgets[report["stage"]]))
+        if "per_segment" in report and "per_segment" in budgets and \
+                report["per_segment"] > budgets["per_segment"]:
+            final.append("each flight segment uses {:.0f} bytes (budget: {})"
+                         .format(report["per_segment"],
+                                 budgets["per_segment"]))
+    return final
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Report the memory used by each stage of loading.")
+    parser.add_argument('--files', nargs=4,
+                        metavar=('AIRPORTS', 'CUSTOMERS', 'SEGMENTS', 'TRIPS'),
+                        default=['data/airports.csv', 'data/customers.csv',
+                                 'data/segments.csv', 'data/trips.csv'])
+    parser.add_argument('--budgets', help="a JSON file of budgets, which "
+                                          "replace the default ones")
+    parser.add_argument('--budget', action='append', default=[],
+                        metavar='STAGE=BYTES', help="the budget of one stage")
+    parser.add_argument('--output', help="the JSON file to write the report "
+                                         "to (default: print it)")
+    args = parser.parse_args()
+
+    budget_limits = dict(DEFAULT_BUDGETS)
+    if args.budgets:
+        with open(args.budgets) as budget_file:
+            budget_limits = json.load(budget_file)
+    for entry in args.budget:
+        stage_name, limit = entry.split('=')
+        budget_limits[stage_name] = float(limit)
+
+    memory_reports = measure_load(tuple(args.files))
+    over_budget = check_budgets(memory_reports, budget_limits)
+    output = json.dumps({"files": args.files, "budgets": budget_limits,
+                         "stages": memory_reports,
+                         "over_budget": over_budget}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    for problem in over_budget:
+        print("OVER BUDGET:", problem, file=sys.stderr)
+    if over_budget:
+        sys.exit(1)
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'argparse', 'gc', 'json', 'sys',
+            'tracemalloc', 'dataset'
+        ]
+    })
@@ -0,0 +1,228 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+import atexit
+import functools
+import itertools
+import json
+import os
+import time
+
+
+# ITERATOR_BATCH: the number of items time_iterator produces at a time.
+ITERATOR_BATCH = 1024
+
+# METRICS_FILE_VARIABLE: the environment variable which, when it is set, names
+#                        the file that dump_at_exit writes the metrics to.
+METRICS_FILE_VARIABLE = "PAIR_METRICS_FILE"
+
+
+class Metrics:
+    """ Measurements of the work done by each stage of the application.
+
+        There are three kinds of measurement, each one named by a string:
+        -  stages, which record how many times a piece of code ran and the
+           wall time it took (see time_stage, timed and time_iterator);
+        -  counters, which add up how many times something happened;
+        -  observations, which record how many values were observed, their
+           total and the largest one (for example, the number of segments
+           examined by each call to choose_flights).
+        Names are dotted, starting with the stage they belong to, such as
+        "choose_flights.segments_examined".
+    """
+    # === Private Attributes ===
+    # _stages:
+    #     the number of runs and total seconds taken by each stage.
+    # _counters:
+    #     the value of each counter.
+    # _observations:
+    #     the number of values, their total and their maximum, for each
+    #     observation.
+    _stages: Dict[str, Dict[str, float]]
+    _counters: Dict[str, int]
+    _observations: Dict[str, Dict[str, float]]
+
+    def __init__(self) -> None:
+        """ Initialize a Metrics with nothing measured yet. """
+        self._stages = {}
+        self._counters = {}
+        self._observations = {}
+
+    @contextmanager
+    def time_stage(self, name: str) -> Iterator[None]:
+        """ Records the wall time taken by the body of a with statement as one
+            run of the stage <name>:
+
+            >>> metrics = Metrics()
+            >>> with metrics.time_stage("load_trips"):
+            ...     pass
+            >>> metrics.get_stage("load_trips")["runs"]
+            1
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_run(name, time.perf_counter() - start)
+
+    def time_iterator(self, name: str, items: Iterable[Any]) \
+            -> Iterator[Any]:
+        """ Yields the <items>, and records the wall time taken to produce
+            them as one run of the stage <name>, once they run out or this
+            iterator is closed. The items are produced ITERATOR_BATCH at a
+            time, so the time spent by the caller between batches is not
+            counted.
+
+            >>> metrics = Metrics()
+            >>> list(metrics.time_iterator("parse_trips", iter([1, 2])))
+            [1, 2]
+            >>> metrics.get_stage("parse_trips")["runs"]
+            1
+        """
+        iterator = iter(items)
+        seconds = 0.0
+        try:
+            batch = [None]
+            while batch:
+                start = time.perf_counter()
+                batch = list(itertools.islice(iterator, ITERATOR_BATCH))
+                seconds += time.perf_counter() - start
+                yield from batch
+        finally:
+            self._add_run(name, seconds)
+
+    def timed(self, name: str) -> Callable[[Callable], Callable]:
+        """ Returns a decorator which records each call of the function it
+            decorates as one run of the stage <name>.
+        """
+        def decorator(fun: Callable) -> Callable:
+            """ Returns <fun>, timed as the stage <name>. """
+            @functools.wraps(fun)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                """ Calls <fun> with the <args> and <kwargs>. """
+                with self.time_stage(name):
+                    return fun(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """ Adds <amount> to the counter <name>.
+
+        >>> metrics = Metrics()
+        >>> metrics.count("load_trips.trips_rejected")
+        >>> metrics.get_counter("load_trips.trips_rejected")
+        1
+        """
+        self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        """ Records one <value> of the observation <name>.
+
+        >>> metrics = Metrics()
+        >>> metrics.observe("filter.output_size", 3)
+        >>> metrics.observe("filter.output_size", 5)
+        >>> metrics.get_observation("filter.output_size")
+        {'count': 2, 'total': 8, 'max': 5}
+        """
+        if name not in self._observations:
+            self._observations[name] = {"count": 0, "total": 0, "max": value}
+        observation = self._observations[name]
+        observation["count"] += 1
+        observation["total"] += value
+        observation["max"] = max(observation["max"], value)
+
+    def _add_run(self, name: str, seconds: float) -> None:
+        """ Records one run of the stage <name>, which took <seconds>. """
+        if name not in self._stages:
+            self._stages[name] = {"runs": 0, "seconds": 0.0}
+        self._stages[name]["runs"] += 1
+        self._stages[name]["seconds"] += seconds
+
+    def get_stage(self, name: str) -> Dict[str, float]:
+        """ Returns the number of runs and total seconds taken by the stage
+            <name>.
+        """
+        return dict(self._stages.get(name, {"runs": 0, "seconds": 0.0}))
+
+    def get_counter(self, name: str) -> int:
+        """ Returns the value of the counter <name>. """
+        return self._counters.get(name, 0)
+
+    def get_observation(self, name: str) -> Dict[str, float]:
+        """ Returns the number of values, their total and their maximum for the
+            observation <name>.
+        """
+        return dict(self._observations.get(name,
+                                           {"count": 0, "total": 0, "max": 0}))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ Returns a copy of everything measured so far, which can be
+            converted to JSON.
+        """
+        return {"stages": {name: dict(self._stages[name])
+                           for name in self._stages},
+                "counters": dict(self._counters),
+                "observations": {name: dict(self._observations[name])
+                                 for name in self._observations}}
+
+    def to_json(self) -> str:
+        """ Returns everything measured so far, as JSON. """
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def dump(self, filename: str) -> None:
+        """ Writes everything measured so far to the file <filename>, as JSON.
+        """
+        with open(filename, 'w') as file:
+            file.write(self.to_json() + "\n")
+
+    def reset(self) -> None:
+        """ Forget everything measured so far. """
+        self._stages = {}
+        self._counters = {}
+        self._observations = {}
+
+
+# METRICS: the measurements of the running application, which every module
+#          records into.
+METRICS = Metrics()
+
+
+def dump_at_exit(metrics: Metrics) -> Optional[str]:
+    """ If the environment variable METRICS_FILE_VARIABLE is set, arranges for
+        <metrics> to be written (see Metrics.dump) to the file it names when
+        the program exits, even if it exits with an error, and returns the
+        full name of that file. Otherwise, returns None.
+
+    >>> os.environ.pop(METRICS_FILE_VARIABLE, None) and None
+    >>> dump_at_exit(Metrics()) is None
+    True
+    """
+    filename = os.environ.get(METRICS_FILE_VARIABLE)
+    if not filename:
+        return None
+    filename = os.path.abspath(filename)
+    atexit.register(metrics.dump, filename)
+    return filename
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'atexit', 'contextlib',
+            'functools', 'itertools', 'json', 'os', 'time'
+        ],
+        'allowed-io': ['dump']
+    })
@@ -0,0 +1,217 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy
+from filter import CLAUSE_COLUMNS, Clause, clause_mask, select_rows
+from segment_table import SegmentTable
+
+""" ======================== Module Description ================================
+A FilterPool chooses the flight segments matching the clauses of a filter with
+a pool of worker processes. It is passed to filter.apply_filter as the selector
+of the rows of a SegmentTable (see filter.apply_clauses).
+
+The CLAUSE_COLUMNS of the table and the rows being filtered are copied into
+shared memory, so the workers only receive the bounds of their chunk of the
+rows and the resolved clauses. Each worker returns the positions of the
+matching rows of its chunk, and the chunks are merged back in order.
+"""
+
+# MIN_CHUNK_ROWS: the fewest rows given to one worker. Fewer rows than two
+#                 chunks are filtered in this process, since handing them to
+#                 the workers would take longer.
+MIN_CHUNK_ROWS = 250000
+
+# BlockSpec: the (shared memory block name, dtype, number of items) of an array
+#            in shared memory.
+BlockSpec = Tuple[str, str, int]
+
+# _ATTACHED: in a worker process, the shared memory blocks it is attached to,
+#            indexed by their names.
+_ATTACHED: Dict[str, shared_memory.SharedMemory] = {}
+
+
+class SharedArray:
+    """ An array in shared memory, which worker processes can read without it
+        being sent to them.
+
+    === Public Attributes ===
+    array:
+        the shared array.
+    spec:
+        the description of the shared array, which is sent to the workers.
+    """
+    # === Private Attributes ===
+    # _block:
+    #     the shared memory block holding the array.
+    array: numpy.ndarray
+    spec: BlockSpec
+    _block: shared_memory.SharedMemory
+
+    def __init__(self, source: numpy.ndarray) -> None:
+        """ Copy the one-dimensional array <source> into shared memory. """
+        self._block = shared_memory.SharedMemory(
+            create=True, size=max(1, source.nbytes))
+        self.array = numpy.ndarray(source.shape, dtype=source.dtype,
+                                   buffer=self._block.buf)
+        self.array[:] = source
+        self.spec = (self._block.name, source.dtype.str, len(source))
+
+    def close(self) -> None:
+        """ Release the shared memory of this array. """
+        del self.array
+        self._block.close()
+        self._block.unlink()
+
+
+class FilterPool:
+    """ Chooses the rows of a SegmentTable matching some resolved clauses with
+        a pool of worker processes.
+
+        The workers are started with the "spawn" method the first time they
+        are needed, so they do not inherit the windows of the Visualizer.
+    """
+    # === Private Attributes ===
+    # _workers:
+    #     the number of worker processes.
+    # _min_chunk:
+    #     the fewest rows given to one worker.
+    # _pool:
+    #     the pool of worker processes, or None if it has not been started.
+    # _table:
+    #     the SegmentTable whose columns are shared, or None if there is none.
+    # _columns:
+    #     the shared CLAUSE_COLUMNS of <_table>, indexed by their names.
+    # _rows:
+    #     the shared memory holding the rows being filtered, or None.
+    _workers: int
+    _min_chunk: int
+    _pool: Optional[ProcessPoolExecutor]
+    _table: Optional[SegmentTable]
+    _columns: Dict[str, SharedArray]
+    _rows: Optional[SharedArray]
+
+    def __init__(self, workers: int, min_chunk_rows: int = MIN_CHUNK_ROWS) \
+            -> None:
+        """ Initialize a pool of <workers> worker processes, each of which is
+            given at least <min_chunk_rows> rows to filter.
+        """
+        self._workers = max(1, workers)
+        self._min_chunk = max(1, min_chunk_rows)
+        self._pool = None
+        self._table = None
+        self._columns = {}
+        self._rows = None
+
+    def get_workers(self) -> int:
+        """ Returns the number of worker processes of this pool. """
+        return self._workers
+
+    def select(self, table: SegmentTable, rows: numpy.ndarray,
+               clauses: List[Clause]) -> numpy.ndarray:
+        """ Returns the positions in <rows>, in order, of the rows of <table>
+            which match every one of the resolved <clauses>, which is the same
+            as filter.select_rows(table, rows, clauses).
+        """
+        chunks = min(self._workers, len(rows) // self._min_chunk)
+        if chunks <= 1:
+            return select_rows(table, rows, clauses)
+        columns = self._share_columns(table)
+        rows_spec = self._share_rows(rows)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self._workers,
+                                             mp_context=get_context("spawn"))
+        step = -(-len(rows) // chunks)
+        futures = []
+        for start in range(0, len(rows), step):
+            futures.append(self._pool.submit(
+                _select_chunk, columns, rows_spec, start,
+                min(start + step, len(rows)), clauses))
+        return numpy.concatenate([future.result() for future in futures])
+
+    def close(self) -> None:
+        """ Stop the worker processes and release all shared memory. """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for shared in self._columns.values():
+            shared.close()
+        self._columns = {}
+        self._table = None
+        if self._rows is not None:
+            self._rows.close()
+            self._rows = None
+
+    def _share_columns(self, table: SegmentTable) -> Dict[str, BlockSpec]:
+        """ Returns the description of the shared CLAUSE_COLUMNS of <table>,
+            copying them into shared memory unless they are already there.
+        """
+        if self._table is not table or \
+                len(self._columns["duration"].array) != len(table):
+            for shared in self._columns.values():
+                shared.close()
+            self._columns = {}
+            for name in CLAUSE_COLUMNS:
+                self._columns[name] = SharedArray(
+                    numpy.asarray(getattr(table, name)))
+            self._table = table
+        return {name: self._columns[name].spec for name in self._columns}
+
+    def _share_rows(self, rows: numpy.ndarray) -> BlockSpec:
+        """ Returns the description of a shared copy of <rows>. """
+        if self._rows is not None and self._rows.array.dtype == rows.dtype \
+                and len(self._rows.array) >= len(rows):
+            self._rows.array[:len(rows)] = rows
+        else:
+            if self._rows is not None:
+                self._rows.close()
+            self._rows = SharedArray(rows)
+        return self._rows.spec[0], self._rows.spec[1], len(rows)
+
+
+def _attach(spec: BlockSpec) -> numpy.ndarray:
+    """ In a worker process, returns the shared array described by <spec>. """
+    name, dtype, length = spec
+    if name not in _ATTACHED:
+        _ATTACHED[name] = shared_memory.SharedMemory(name=name)
+    return numpy.ndarray((length,), dtype=dtype, buffer=_ATTACHED[name].buf)
+
+
+def _select_chunk(columns: Dict[str, BlockSpec], rows: BlockSpec, start: int,
+                  stop: int, clauses: List[Clause]) -> numpy.ndarray:
+    """ In a worker process, returns the positions from <start> (inclusive) to
+        <stop> (exclusive) of the shared <rows> whose rows of the shared
+        <columns> match every one of the resolved <clauses>.
+    """
+    current = [spec[0] for spec in columns.values()] + [rows[0]]
+    for name in list(_ATTACHED):
+        if name not in current:
+            # the arrays were shared again, so this copy is out of date
+            _ATTACHED.pop(name).close()
+    shared = {name: _attach(columns[name]) for name in columns}
+    mask = clause_mask(shared, clauses, _attach(rows)[start:stop])
+    return numpy.flatnonzero(mask) + start
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', '__future__',
+            'concurrent.futures', 'multiprocessing', 'numpy', 'filter',
+            'segment_table'
+        ]
+    })
@@ -0,0 +1,478 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, \
+    Optional, Tuple
+import csv
+import datetime
+import io
+import itertools
+import os
+import re
+from flight import AIRPLANE_CAPACITY, segment_duration
+from metrics import METRICS
+from segment_table import MINUTES_PER_DAY, to_days
+
+"""
+    ParsedSegment: the (flight identifier, departure IATA, arrival IATA,
+                   departure date, departure time, arrival time, duration,
+                   length) of a row of a segments file. The times are in
+                   minutes since segment_table.EPOCH, and the duration is in
+                   minutes.
+"""
+ParsedSegment = Tuple[str, str, str, datetime.date, int, int, int, float]
+
+"""
+    ParsedTrip: the (reservation ID, customer ID, departure date, itinerary)
+                of a row of a trips file. The itinerary is in the format taken
+                by FlightSchedule.choose_flights.
+"""
+ParsedTrip = Tuple[str, int, datetime.date, List[Tuple[Tuple[str, str], str]]]
+
+"""
+    NumberedTrip: the line number of a row of a trips file, and the trip parsed
+                  from it. Line numbers start at 1.
+"""
+NumberedTrip = Tuple[int, ParsedTrip]
+
+"""
+    Rejection: the (line number, reason, text) of a malformed row of a file.
+               Line numbers start at 1.
+"""
+Rejection = Tuple[int, str, str]
+
+# DATE: the dates of a trips file.
+DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# ITINERARY_STOP: one airport of an itinerary, and the seat type booked from
+#                 there, such as ('YYZ','Economy'); the groups are the IATA
+#                 code and the seat type.
+ITINERARY_STOP = re.compile(r"\('([A-Z]{3})','([A-Za-z]*)'\)")
+
+# ITINERARY_LEG: one leg of an itinerary, flown in a known seat type; the
+#                groups are the departure IATA code, the seat type and the
+#                arrival IATA code. The next stop is only looked at, so that
+#                it can start the next leg.
+ITINERARY_LEG = re.compile(r"\('([A-Z]{3})','("
+                           + "|".join(map(re.escape, AIRPLANE_CAPACITY))
+                           + r")'\),(?=\('([A-Z]{3})',)")
+
+# ITINERARY: a whole itinerary, which is a list of one or more stops.
+ITINERARY = re.compile(r"\[\('[A-Z]{3}','[A-Za-z]*'\)"
+                       r"(?:,\('[A-Z]{3}','[A-Za-z]*'\))*\]")
+
+# TRIP_ROW: a whole row of a trips file; the groups are the reservation ID,
+#           customer ID, departure date and itinerary.
+TRIP_ROW = re.compile(r"([^,]*),(\d+),(\d{4}-\d{2}-\d{2}),"
+                      r"(\[\('[A-Z]{3}','[A-Za-z]*'\)"
+                      r"(?:,\('[A-Z]{3}','[A-Za-z]*'\))*\])")
+
+
+class SegmentParser:
+    """ A parser for the rows of a segments file, such as:
+
+            PA-001,YYZ,CDG,2019:01:01,09:40,19:45,9143
+
+        A schedule uses only a few hundred dates and at most 1440 times of
+        day, so each distinct date and time is parsed once, and remembered.
+        The strings for airport codes and flight identifiers are interned, so
+        that every row flying the same route shares them.
+
+        A flight is taken to land the next day if it departs in the same hour
+        of the day as it arrives, or later.
+    """
+    # === Private Attributes ===
+    # _dates:
+    #     for each date that has been parsed, the date, the minutes from EPOCH
+    #     to the start of that date, and the day of the month of that date and
+    #     of the next day.
+    # _times:
+    #     the (hour, minute) of each time of day that has been parsed.
+    # _strings:
+    #     the interned airport codes and flight identifiers.
+    _dates: Dict[str, Tuple[datetime.date, int, int, int]]
+    _times: Dict[str, Tuple[int, int]]
+    _strings: Dict[str, str]
+
+    def __init__(self) -> None:
+        """ Initialize a parser which has not parsed anything yet. """
+        self._dates = {}
+        self._times = {}
+        self._strings = {}
+
+    def parse(self, row: List[str]) -> ParsedSegment:
+        """ Returns the flight segment in the <row> of a segments file.
+
+        >>> parser = SegmentParser()
+        >>> parser.parse(['PA-001', 'YYZ', 'CDG', '2019:01:31', '22:42',
+        ...               '09:00', '9143'])[3:]
+        (datetime.date(2019, 1, 31), 25816242, 25816860, 0, 9143.0)
+        """
+        date, start, day, next_day = self._parse_date(row[3])
+        dep_hour, dep_minute = self._parse_time(row[4])
+        arr_hour, arr_minute = self._parse_time(row[5])
+        dep = start + dep_hour * 60 + dep_minute
+        arr = start + arr_hour * 60 + arr_minute
+        arr_day = day
+        if dep_hour >= arr_hour:
+            # the flight lands the next day
+            arr += MINUTES_PER_DAY
+            arr_day = next_day
+        return (self._intern(row[0]), self._intern(row[1]),
+                self._intern(row[2]), date, dep, arr,
+                segment_duration(day, dep_hour, dep_minute, arr_day, arr_hour,
+                                 arr_minute), float(row[6]))
+
+    def _parse_date(self, text: str) -> Tuple[datetime.date, int, int, int]:
+        """ Returns the date written as YYYY:MM:DD in <text>, the minutes from
+            EPOCH to its start, and the day of the month of that date and of
+            the next day.
+        """
+        if text not in self._dates:
+            date = datetime.date(int(text[:4]), int(text[5:7]), int(text[8:]))
+            self._dates[text] = (
+                date, to_days(date) * MINUTES_PER_DAY, date.day,
+                (date + datetime.timedelta(days=1)).day)
+        return self._dates[text]
+
+    def _parse_time(self, text: str) -> Tuple[int, int]:
+        """ Returns the (hour, minute) of the time of day written as HH:MM in
+            <text>.
+        """
+        if text not in self._times:
+            self._times[text] = (int(text[:2]), int(text[3:]))
+        return self._times[text]
+
+    def _intern(self, text: str) -> str:
+        """ Returns the one string equal to <text> that this parser keeps. """
+        return self._strings.setdefault(text, text)
+
+
+def tokenize_itinerary(text: str) -> List[Tuple[str, str, str]]:
+    """ Returns the (departure IATA, arrival IATA, seat type) legs of the
+        itinerary <text>, written as in the last column of a trips file.
+
+        Raises ValueError if <text> is not such an itinerary, if it has fewer
+        than two airports, or if a leg has an unknown seat type. The seat type
+        of the last airport is not used.
+
+    >>> tokenize_itinerary("[('YYZ','Economy'),('CDG','Business'),('NRT','')]")
+    [('YYZ', 'CDG', 'Economy'), ('CDG', 'NRT', 'Business')]
+    >>> tokenize_itinerary("[('YYZ','Economy')('CDG','')]")
+    Traceback (most recent call last):
+    ...
+    ValueError: malformed itinerary
+    """
+    if ITINERARY.fullmatch(text) is None:
+        raise ValueError("malformed itinerary")
+    return [(dep, arr, seat_type) for dep, seat_type, arr in _legs(text, 0)]
+
+
+def _legs(text: str, start: int) -> List[Tuple[str, str, str]]:
+    """ Returns the (departure IATA, seat type, arrival IATA) legs of the
+        itinerary which starts at <start> in <text>.
+
+        Raises ValueError if it has fewer than two airports, or if a leg has
+        an unknown seat type.
+
+        Precondition: the itinerary matches ITINERARY.
+    """
+    legs = ITINERARY_LEG.findall(text, start)
+    # every stop opens one parenthesis, and all but the last start a leg
+    if legs and len(legs) == text.count("(", start) - 1:
+        return legs
+    stops = ITINERARY_STOP.findall(text, start)
+    if len(stops) < 2:
+        raise ValueError("itinerary has fewer than two airports")
+    seat_type = [seat for _, seat in stops[:-1]
+                 if seat not in AIRPLANE_CAPACITY][0]
+    raise ValueError("unknown seat type {!r}".format(seat_type))
+
+
+class RejectionLog:
+    """ The malformed rows of the input files, which were skipped instead of
+        being loaded.
+    """
+    # === Private Attributes ===
+    # _rejections:
+    #     every malformed row, in the order they were found.
+    _rejections: List[Rejection]
+
+    def __init__(self) -> None:
+        """ Initialize an empty RejectionLog. """
+        self._rejections = []
+
+    def __len__(self) -> int:
+        """ Returns the number of rows in this log. """
+        return len(self._rejections)
+
+    def add(self, line_number: int, reason: str, text: str) -> None:
+        """ Records that the row <text>, on line <line_number> of its file,
+            was skipped for the <reason>.
+        """
+        self._rejections.append((line_number, reason, text))
+        METRICS.count("parse_trips.rows_rejected")
+
+    def get_rejections(self) -> List[Rejection]:
+        """ Returns the (line number, reason, text) of every row in this log,
+            in the order they were found.
+        """
+        return self._rejections
+
+    def write(self, filename: str) -> None:
+        """ Writes every row in this log to the file <filename>, one per line.
+        """
+        with open(filename, 'w') as file:
+            for line_number, reason, text in self._rejections:
+                file.write("line {}: {}: {}\n".format(line_number, reason,
+                                                      text))
+
+
+class TripParser:
+    """ A parser for the rows of a trips file, such as:
+
+            X05B6,985327,2019-01-01,[('SCL','Business'),('FCO','')]
+
+        Each row is checked against TRIP_ROW, and its legs are found by
+        ITINERARY_LEG, so the itinerary is read by compiled regular
+        expressions rather than by splitting it on its commas. A trips
+        file uses only a few hundred dates, so each distinct date is parsed
+        once, and remembered.
+    """
+    # === Private Attributes ===
+    # _dates:
+    #     each date that has been parsed.
+    _dates: Dict[str, datetime.date]
+
+    def __init__(self) -> None:
+        """ Initialize a parser which has not parsed anything yet. """
+        self._dates = {}
+
+    def parse(self, line: str) -> ParsedTrip:
+        """ Returns the trip in the <line> of a trips file.
+
+            Raises ValueError, with the reason, if the <line> is malformed.
+
+        >>> TripParser().parse("RES01,915545,2019-01-02,"
+        ...                    "[('YYZ','Economy'),('CDG','')]")
+        ('RES01', 915545, datetime.date(2019, 1, 2), [(('YYZ', 'CDG'), \
+'Economy')])
+        """
+        match = TRIP_ROW.fullmatch(line)
+        if match is None:
+            raise ValueError(_diagnose(line))
+        rid, cid, text = match.group(1, 2, 3)
+        if text not in self._dates:
+            self._dates[text] = datetime.date(int(text[:4]), int(text[5:7]),
+                                              int(text[8:]))
+        return (rid, int(cid), self._dates[text],
+                [((dep, arr), seat_type) for dep, seat_type, arr in
+                 _legs(line, match.start(4))])
+
+    def parse_lines(self, lines: Iterable[str], rejections: RejectionLog,
+                    first_line: int = 1) -> Iterator[NumberedTrip]:
+        """ Yields the trips in the <lines> of a trips file, with their line
+            numbers, the first line being line number <first_line> of the
+            file. The malformed lines are added to <rejections>, and blank
+            lines are skipped.
+        """
+        for line_number, line in enumerate(lines, first_line):
+            line = line.rstrip("\r\n")
+            if line:
+                try:
+                    yield line_number, self.parse(line)
+                except ValueError as error:
+                    rejections.add(line_number, str(error), line)
+
+
+def format_trip(trip: ParsedTrip) -> str:
+    """ Returns the <trip> written as a row of a trips file, which TripParser
+        parses back into the same trip. The seat type of the last airport,
+        which is not used, is left empty.
+
+    >>> format_trip(('RES01', 915545, datetime.date(2019, 1, 2),
+    ...              [(('YYZ', 'CDG'), 'Economy')]))
+    "RES01,915545,2019-01-02,[('YYZ','Economy'),('CDG','')]"
+    """
+    rid, cid, date, itinerary = trip
+    stops = ["('{}','{}')".format(dep, seat_type)
+             for (dep, _), seat_type in itinerary]
+    if itinerary:
+        stops.append("('{}','')".format(itinerary[-1][0][1]))
+    return "{},{},{},[{}]".format(rid, cid, date.isoformat(), ",".join(stops))
+
+
+def _diagnose(line: str) -> str:
+    """ Returns the reason why the <line> of a trips file does not match
+        TRIP_ROW.
+    """
+    fields = line.split(",", 3)
+    if len(fields) < 4:
+        return "expected 4 fields"
+    if not fields[1].isdigit():
+        return "customer ID is not a number"
+    if DATE.fullmatch(fields[2]) is None:
+        return "date is not YYYY-MM-DD"
+    return "malformed itinerary"
+
+
+def file_chunks(filename: str, count: int) -> List[Tuple[int, int]]:
+    """ Returns the (start, stop) byte offsets of at most <count> chunks of
+        about the same size which cover the file <filename>, in order. Every
+        chunk starts at the beginning of a line and ends after a newline (or
+        at the end of the file).
+    """
+    size = os.path.getsize(filename)
+    offsets = [0]
+    with open(filename, 'rb') as file:
+        for i in range(1, count):
+            file.seek(max(offsets[-1], size * i // count))
+            # the chunk boundary moves forward to the start of the next line
+            file.readline()
+            if offsets[-1] < file.tell() < size:
+                offsets.append(file.tell())
+    offsets.append(size)
+    return [(offsets[i], offsets[i + 1]) for i in range(len(offsets) - 1)
+            if offsets[i] < offsets[i + 1]]
+
+
+def parse_segments_file(filename: str, workers: int = 1) \
+        -> Iterable[ParsedSegment]:
+    """ Returns the flight segments in the segments file <filename>, in the
+        order of the file, parsed by <workers> processes. The time taken is
+        recorded as the stage "parse_segments".
+
+        With a single worker, the rows are parsed lazily as they are read, so
+        the time taken is only recorded once they have all been used, and it
+        leaves out the time spent by the caller between rows.
+    """
+    chunks = file_chunks(filename, workers) if workers > 1 else []
+    if len(chunks) < 2:
+        return METRICS.time_iterator("parse_segments",
+                                     _read_segments(filename))
+    with METRICS.time_stage("parse_segments"):
+        parts = _map_chunks(filename, chunks, _parse_segment_chunk)
+        return list(itertools.chain.from_iterable(parts))
+
+
+def parse_trips_file(filename: str, workers: int = 1,
+                     rejections: Optional[RejectionLog] = None) \
+        -> Iterable[NumberedTrip]:
+    """ Returns the trips in the trips file <filename>, with their line
+        numbers, in the order of the file, parsed by <workers> processes. The
+        malformed rows are skipped, and added to <rejections> (if it is given)
+        with their line numbers. The time taken is recorded as the stage
+        "parse_trips".
+
+        With a single worker, the rows are parsed lazily as they are read, so
+        the time taken is only recorded once they have all been used, and it
+        leaves out the time spent by the caller between rows.
+    """
+    if rejections is None:
+        rejections = RejectionLog()
+    chunks = file_chunks(filename, workers) if workers > 1 else []
+    if len(chunks) < 2:
+        return METRICS.time_iterator("parse_trips",
+                                     _read_trips(filename, rejections))
+    with METRICS.time_stage("parse_trips"):
+        final = []
+        lines = 0
+        for trips, rejected, count in _map_chunks(filename, chunks,
+                                                  _parse_trip_chunk):
+            # the line numbers of each chunk start from 1
+            final.extend((lines + line_number, trip)
+                         for line_number, trip in trips)
+            for line_number, reason, text in rejected:
+                rejections.add(lines + line_number, reason, text)
+            lines += count
+        return final
+
+
+def _map_chunks(filename: str, chunks: List[Tuple[int, int]],
+                parse_chunk: Callable[[str, int, int], Any]) -> List[Any]:
+    """ Returns the result of <parse_chunk> on each of the (start, stop)
+        <chunks> of the file <filename>, in order.
+
+        Each chunk is read and parsed by its own worker process, which sends
+        back the parsed tuples. They are joined in the order of the chunks,
+        so the result is the same as parsing the file from start to end.
+    """
+    with ProcessPoolExecutor(len(chunks)) as pool:
+        parts = list(pool.map(parse_chunk, itertools.repeat(filename),
+                              [start for start, _ in chunks],
+                              [stop for _, stop in chunks]))
+    METRICS.observe("parse.chunks", len(parts))
+    return parts
+
+
+def _read_segments(filename: str) -> Iterator[ParsedSegment]:
+    """ Yields the flight segments in the segments file <filename>, one at a
+        time.
+    """
+    with open(filename, newline='') as file:
+        yield from map(SegmentParser().parse, csv.reader(file))
+
+
+def _read_trips(filename: str, rejections: RejectionLog) \
+        -> Iterator[NumberedTrip]:
+    """ Yields the trips in the trips file <filename>, with their line
+        numbers, one at a time, adding its malformed rows to <rejections>.
+    """
+    with open(filename) as file:
+        yield from TripParser().parse_lines(file, rejections)
+
+
+def _read_chunk(filename: str, start: int, stop: int) -> str:
+    """ Returns the text from the byte <start> to the byte <stop> of the file
+        <filename>.
+    """
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        return file.read(stop - start).decode()
+
+
+def _parse_segment_chunk(filename: str, start: int, stop: int) \
+        -> List[ParsedSegment]:
+    """ Returns the flight segments in the lines from the byte <start> to the
+        byte <stop> of the segments file <filename>.
+    """
+    text = _read_chunk(filename, start, stop)
+    return list(map(SegmentParser().parse,
+                    csv.reader(io.StringIO(text, newline=''))))
+
+
+def _parse_trip_chunk(filename: str, start: int, stop: int) \
+        -> Tuple[List[NumberedTrip], List[Rejection], int]:
+    """ Returns the trips in the lines from the byte <start> to the byte
+        <stop> of the trips file <filename> and the malformed lines among
+        them (both numbered from 1 at <start>), and the number of lines.
+    """
+    # read as the whole file is by _read_trips, with universal newlines
+    lines = io.StringIO(_read_chunk(filename, start, stop)).readlines()
+    rejections = RejectionLog()
+    trips = list(TripParser().parse_lines(lines, rejections))
+    return trips, rejections.get_rejections(), len(lines)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'concurrent.futures', 'csv',
+            'datetime', 'io', 'itertools', 'os', 're', 'flight', 'metrics',
+            'segment_table'
+        ],
+        'allowed-io': ['file_chunks', 'RejectionLog.write', '_read_segments',
+                       '_read_trips', '_read_chunk']
+    })
@@ -0,0 +1,318 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import datetime
+
+# EPOCH: the moment that all of the times in a SegmentTable are counted from.
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# MINUTES_PER_DAY: the number of minutes in one day.
+MINUTES_PER_DAY = 24 * 60
+
+# Column: a column of a SegmentTable; either a typed array, or a read-only
+#         memoryview of one (see SegmentTable.map_columns).
+Column = Union[array, memoryview]
+
+# MAPPED_COLUMNS: the columns of a SegmentTable which map_columns can use in
+#                 place.
+MAPPED_COLUMNS = ["fid", "dep_loc", "arr_loc", "dep_time", "arr_time",
+                  "duration", "length", "base_fare"]
+
+
+def to_minutes(moment: datetime.datetime) -> int:
+    """ Returns the number of whole minutes from EPOCH to <moment>.
+
+    >>> to_minutes(datetime.datetime(1970, 1, 2, 0, 30))
+    1470
+    """
+    return (moment - EPOCH) // datetime.timedelta(minutes=1)
+
+
+def from_minutes(minutes: int) -> datetime.datetime:
+    """ Returns the moment <minutes> minutes after EPOCH.
+
+    >>> from_minutes(1470)
+    datetime.datetime(1970, 1, 2, 0, 30)
+    """
+    return EPOCH + datetime.timedelta(minutes=minutes)
+
+
+def to_days(day: datetime.date) -> int:
+    """ Returns the number of days from EPOCH to <day>.
+
+    >>> to_days(datetime.date(1970, 1, 2))
+    1
+    """
+    return (day - EPOCH.date()).days
+
+
+def from_days(days: int) -> datetime.date:
+    """ Returns the day <days> days after EPOCH.
+
+    >>> from_days(1)
+    datetime.date(1970, 1, 2)
+    """
+    return EPOCH.date() + datetime.timedelta(days=days)
+
+
+class SegmentTable:
+    """ A column store for the data of many flight segments.
+
+        Each flight segment is one row of the table, and every attribute of
+        the segments is kept in its own typed array (a column), instead of
+        in one Python object per segment. Strings are interned: the airport
+        codes and flight identifiers are stored as small integers, which index
+        into <codes> and <fids> respectively.
+
+        The MAPPED_COLUMNS of an empty table can be replaced by memoryviews of
+        columns held elsewhere, such as in a store file (see map_columns).
+        They are copied into arrays the first time a row is added.
+
+    === Public Attributes ===
+    codes:
+        the interned IATA airport codes.
+    locations:
+        the (longitude, latitude) of each interned airport code, or None if it
+        is not known.
+    fids:
+        the interned flight identifiers.
+    fid:
+        the column of interned flight identifiers.
+    dep_loc:
+        the column of interned departure airport codes.
+    arr_loc:
+        the column of interned arrival airport codes.
+    dep_time:
+        the column of departure times, in minutes since EPOCH.
+    arr_time:
+        the column of arrival times, in minutes since EPOCH.
+    duration:
+        the column of flight durations, in minutes.
+    length:
+        the column of flight lengths, in kilometres.
+    base_fare:
+        the column of base fare costs.
+    sold:
+        a column of seats sold for each class of seat.
+    manifests:
+        the manifest of each row (a dictionary mapping the ID of each booked
+        customer to their seat_type, in the order they booked), or None if
+        nobody has booked that row yet.
+
+    === Representation Invariants ===
+        -  every column, and manifests, has exactly len(self) entries.
+        -  the times have a resolution of one minute.
+    """
+    codes: List[str]
+    locations: List[Optional[Tuple[float, float]]]
+    fids: List[str]
+    fid: Column
+    dep_loc: Column
+    arr_loc: Column
+    dep_time: Column
+    arr_time: Column
+    duration: Column
+    length: Column
+    base_fare: Column
+    sold: Dict[str, array]
+    manifests: List[Optional[Dict[int, str]]]
+
+    # === Private Attributes ===
+    # _code_ids:
+    #     the position of each interned airport code in <codes>.
+    # _fid_ids:
+    #     the position of each interned flight identifier in <fids>.
+    _code_ids: Dict[str, int]
+    _fid_ids: Dict[str, int]
+
+    def __init__(self, seat_classes: List[str]) -> None:
+        """ Initialize an empty SegmentTable, which keeps track of the seats
+            sold for each of the <seat_classes>.
+        """
+        self.codes = []
+        self.locations = []
+        self.fids = []
+        self._code_ids = {}
+        self._fid_ids = {}
+        self.fid = array('I')
+        self.dep_loc = array('H')
+        self.arr_loc = array('H')
+        self.dep_time = array('i')
+        self.arr_time = array('i')
+        self.duration = array('H')
+        self.length = array('d')
+        self.base_fare = array('d')
+        self.sold = {}
+        for seat_class in seat_classes:
+            self.sold[seat_class] = array('H')
+        self.manifests = []
+
+    def __len__(self) -> int:
+        """ Returns the number of rows in this table. """
+        return len(self.fid)
+
+    def intern_code(self, code: str,
+                    location: Optional[Tuple[float, float]] = None) -> int:
+        """ Returns the integer standing for the airport <code>, adding it to
+            the table if it is new. If a <location> is given, it is recorded as
+            the location of that airport.
+        """
+        if code not in self._code_ids:
+            self._code_ids[code] = len(self.codes)
+            self.codes.append(code)
+            self.locations.append(None)
+        code_id = self._code_ids[code]
+        if location is not None:
+            self.locations[code_id] = location
+        return code_id
+
+    def find_code(self, code: str) -> Optional[int]:
+        """ Returns the integer standing for the airport <code>, or None if
+            no row of the table uses that airport.
+        """
+        return self._code_ids.get(code)
+
+    def intern_fid(self, fid: str) -> int:
+        """ Returns the integer standing for the flight identifier <fid>,
+            adding it to the table if it is new.
+        """
+        if fid not in self._fid_ids:
+            self._fid_ids[fid] = len(self.fids)
+            self.fids.append(fid)
+        return self._fid_ids[fid]
+
+    def append(self, fid: str, dep: datetime.datetime,
+               arr: datetime.datetime, duration: int, length: float,
+               base_fare: float, dep_loc: str, arr_loc: str,
+               long_lat: Tuple[Tuple[float, float],
+                               Tuple[float, float]]) -> int:
+        """ Adds a row for a flight segment with no seats sold, and returns
+            the index of that row. The <duration> is in minutes.
+        """
+        return self.append_minutes(fid, to_minutes(dep), to_minutes(arr),
+                                   duration, length, base_fare, dep_loc,
+                                   arr_loc, long_lat)
+
+    def append_minutes(self, fid: str, dep: int, arr: int, duration: int,
+                       length: float, base_fare: float, dep_loc: str,
+                       arr_loc: str,
+                       long_lat: Tuple[Tuple[float, float],
+                                       Tuple[float, float]]) -> int:
+        """ Adds a row for a flight segment with no seats sold, and returns
+            the index of that row. The <dep> and <arr> times are in minutes
+            since EPOCH, and the <duration> is in minutes.
+        """
+        if not isinstance(self.fid, array):
+            self._copy_columns()
+        self.fid.append(self.intern_fid(fid))
+        self.dep_loc.append(self.intern_code(dep_loc, long_lat[0]))
+        self.arr_loc.append(self.intern_code(arr_loc, long_lat[1]))
+        self.dep_time.append(dep)
+        self.arr_time.append(arr)
+        self.duration.append(duration)
+        self.length.append(length)
+        self.base_fare.append(base_fare)
+        for seat_class in self.sold:
+            self.sold[seat_class].append(0)
+        self.manifests.append(None)
+        return len(self.fid) - 1
+
+    def extend_columns(self, fid: Iterable[int], dep_loc: Iterable[int],
+                       arr_loc: Iterable[int], dep_time: Iterable[int],
+                       arr_time: Iterable[int], duration: Iterable[int],
+                       length: Iterable[float],
+                       base_fare: Iterable[float]) -> range:
+        """ Adds a row with no seats sold for each flight segment in the given
+            columns, and returns the range of the new rows. The flight
+            identifiers and airport codes must already be interned, and the
+            times are in minutes since EPOCH.
+
+            Precondition: all of the columns have the same length.
+        """
+        if not isinstance(self.fid, array):
+            self._copy_columns()
+        start = len(self.fid)
+        self.fid.extend(fid)
+        self.dep_loc.extend(dep_loc)
+        self.arr_loc.extend(arr_loc)
+        self.dep_time.extend(dep_time)
+        self.arr_time.extend(arr_time)
+        self.duration.extend(duration)
+        self.length.extend(length)
+        self.base_fare.extend(base_fare)
+        count = len(self.fid) - start
+        for seat_class in self.sold:
+            self.sold[seat_class].extend(bytes(count))
+        self.manifests.extend([None] * count)
+        return range(start, len(self.fid))
+
+    def map_columns(self, fid: memoryview, dep_loc: memoryview,
+                    arr_loc: memoryview, dep_time: memoryview,
+                    arr_time: memoryview, duration: memoryview,
+                    length: memoryview, base_fare: Column) -> range:
+        """ Uses the given columns as the MAPPED_COLUMNS of this table, without
+            copying them, and returns the range of its rows, which have no
+            seats sold. The columns are only read, until a row is added, when
+            they are copied into arrays.
+
+            Precondition: the table has no rows, the flight identifiers and
+                          airport codes are already interned, the columns
+                          all have the same length, and each one has the
+                          type code of the column it replaces.
+
+        >>> table = SegmentTable(["Economy"])
+        >>> _ = table.intern_fid("AC1"), table.intern_code("YYZ")
+        >>> table.map_columns(*[memoryview(array(typecode, [0]))
+        ...                     for typecode in "IHHiiHdd"])
+        range(0, 1)
+        >>> table.append_minutes("AC1", 60, 120, 60, 500.0, 61.25, "YYZ",
+        ...                      "YYZ", ((0.0, 0.0), (0.0, 0.0)))
+        1
+        >>> table.dep_time, list(table.sold["Economy"])
+        (array('i', [0, 60]), [0, 0])
+        """
+        for name, column in zip(MAPPED_COLUMNS, [fid, dep_loc, arr_loc,
+                                                 dep_time, arr_time, duration,
+                                                 length, base_fare]):
+            setattr(self, name, column)
+        count = len(self.fid)
+        for seat_class in self.sold:
+            self.sold[seat_class] = array(
+                self.sold[seat_class].typecode,
+                bytes(count * self.sold[seat_class].itemsize))
+        self.manifests = [None] * count
+        return range(count)
+
+    def _copy_columns(self) -> None:
+        """ Replace each of the MAPPED_COLUMNS which is not an array with an
+            array holding a copy of it.
+        """
+        for name in MAPPED_COLUMNS:
+            column = getattr(self, name)
+            if not isinstance(column, array):
+                copy = array(column.format)
+                copy.frombytes(column.cast('B'))
+                setattr(self, name, copy)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'datetime', 'array'
+        ],
+        'max-attributes': 15,
+        'max-args': 10
+    })
@@ -0,0 +1,381 @@
+"""
+UTM:CSC148, Winter 2020
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
+"""
+from array import array
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import struct
+import sys
+from parsers import parse_segments_file
+
+""" ======================== Module Description ================================
+
+    This file converts the airports, customers and segments files of a
+    dataset into one binary store file, and reads it back without parsing
+    any text.
+
+    A store file starts with a fixed-size header: the MAGIC bytes, the format
+    VERSION and the length of a JSON directory which follows it. The directory
+    gives the type code (as in the array module), the offset (from the start
+    of the columns, at the first multiple of COLUMN_ALIGNMENT bytes after the
+    directory) and the number of items of every column. Each column is an
+    array of fixed-width numbers, in the byte order of the machine that wrote
+    it, and starts at a multiple of COLUMN_ALIGNMENT bytes. All of the strings
+    (codes, names and flight identifiers) are kept once each in a string
+    table, made of the columns "strings.data" (their UTF-8 bytes, one after
+    another) and "strings.offsets" (where each one starts and ends), and the
+    other columns refer to them by their position. The directory also records
+    the SHA-256 checksum of each CSV file the store was made from, so that a
+    store which no longer matches them is not used.
+
+    The store is opened with mmap, and its columns are memoryviews of the
+    mapped file, so reading a column only touches the pages it uses.
+
+    The columns of the segments are kept as a SegmentTable keeps them: the
+    flight identifiers and airport codes are numbered in the order a
+    SegmentTable would intern them (see "segments.fids" and "segments.codes"),
+    so that an empty SegmentTable can use the mapped columns in place (see
+    SegmentTable.map_columns), without copying them.
+
+    The rows of the airports and customers can be given to create_airports
+    and create_customers, and the store itself to create_flight_segments (or
+    Dataset.load_stored_segments), in place of the rows of the CSV files.
+
+    Convert a dataset with:  python store.py --output data/small.store
+"""
+
+# MAGIC: the bytes every store file starts with.
+MAGIC = b"PAIRSTOR"
+
+# VERSION: the version of the format written by write_store.
+VERSION = 2
+
+# HEADER: the layout of the fixed-size header (magic, version, directory
+#         length).
+HEADER = struct.Struct("<8sII")
+
+# COLUMN_ALIGNMENT: every column starts at a multiple of this many bytes.
+COLUMN_ALIGNMENT = 8
+
+# CHECKSUM_BLOCK: the number of bytes of a source file hashed at a time.
+CHECKSUM_BLOCK = 1 << 20
+
+# SOURCES: the parts of a dataset a store is made from, in the order their
+#          files are given to write_store.
+SOURCES = ["airports", "customers", "segments"]
+
+# COLUMNS: the type code of every column of a store, and the part of the
+#          dataset it belongs to.
+COLUMNS = {"strings.offsets": 'I', "strings.data": 'B',
+           "airports.code": 'I', "airports.name": 'I',
+           "airports.longitude": 'd', "airports.latitude": 'd',
+           "customers.id": 'I', "customers.name": 'I', "customers.age": 'H',
+           "customers.nationality": 'I',
+           "segments.fids": 'I', "segments.codes": 'I',
+           "segments.fid": 'I', "segments.dep_loc": 'H',
+           "segments.arr_loc": 'H', "segments.dep_time": 'i',
+           "segments.arr_time": 'i', "segments.duration": 'H',
+           "segments.length": 'd'}
+
+
+class BinaryStore:
+    """ A store file written by write_store, mapped into memory.
+
+        The store must be closed once it is no longer needed. The columns
+        returned by get_column must not be used after that, but the ones
+        returned by share_column can be.
+    """
+    # === Private Attributes ===
+    # _file:
+    #     the open store file.
+    # _map:
+    #     the memory map of the whole store file.
+    # _buffer:
+    #     a memoryview of the whole store file, which the columns are cut
+    #     from.
+    # _directory:
+    #     the (type code, offset in the file, number of items) of every
+    #     column.
+    # _columns:
+    #     every column that has been returned, by name.
+    # _strings:
+    #     each string of the string table that has been decoded, by position.
+    # _sources:
+    #     the checksum of the file each part of the dataset was read from, or
+    #     {} if the store does not record them.
+    # _shared:
+    #     whether share_column has returned a column, so that the file must
+    #     stay mapped after the store is closed.
+    _file: BinaryIO
+    _map: mmap.mmap
+    _buffer: memoryview
+    _directory: Dict[str, Tuple[str, int, int]]
+    _columns: Dict[str, memoryview]
+    _strings: Dict[int, str]
+    _sources: Dict[str, str]
+    _shared: bool
+
+    def __init__(self, filename: str) -> None:
+        """ Open the store in the file <filename>.
+
+            Raises ValueError if <filename> is not a store file, or was
+            written in another version of the format or on a machine with
+            another byte order.
+        """
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._map)
+        self._columns = {}
+        self._strings = {}
+        self._shared = False
+        magic, version, size = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not a version {} store file".format(
+                filename, VERSION))
+        directory = json.loads(
+            self._map[HEADER.size:HEADER.size + size].decode())
+        if directory["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError("{} was written on a {} endian machine".format(
+                filename, directory["byteorder"]))
+        self._sources = directory.get("sources", {})
+        start = _align(HEADER.size + size)
+        self._directory = {}
+        for name in directory["columns"]:
+            typecode, offset, count = directory["columns"][name]
+            self._directory[name] = (typecode, start + offset, count)
+
+    def __len__(self) -> int:
+        """ Returns the number of flight segments in this store. """
+        return self._directory["segments.fid"][2]
+
+    def is_built_from(self, file_airports: str, file_customers: str,
+                      file_segments: str) -> bool:
+        """ Returns True iff this store was written from the files
+            <file_airports>, <file_customers> and <file_segments>, as they are
+            now. A store which does not record the checksums of its files is
+            never up to date.
+        """
+        if not self._sources:
+            return False
+        for part, filename in zip(SOURCES, [file_airports, file_customers,
+                                            file_segments]):
+            if self._sources.get(part) != file_checksum(filename):
+                return False
+        return True
+
+    def get_column(self, name: str) -> memoryview:
+        """ Returns the column <name> of this store, without copying it. """
+        if name not in self._columns:
+            typecode, offset, count = self._directory[name]
+            self._columns[name] = self._buffer[
+                offset:offset + count * array(typecode).itemsize].cast(typecode)
+        return self._columns[name]
+
+    def share_column(self, name: str) -> memoryview:
+        """ Returns the column <name> of this store, without copying it. The
+            column stays usable after the store is closed: the file stays
+            mapped until every column returned by this method is gone.
+        """
+        typecode, offset, count = self._directory[name]
+        self._shared = True
+        return self._buffer[
+            offset:offset + count * array(typecode).itemsize].cast(typecode)
+
+    def get_string(self, position: int) -> str:
+        """ Returns the string at <position> in the string table. """
+        if position not in self._strings:
+            _, offset, _ = self._directory["strings.data"]
+            offsets = self.get_column("strings.offsets")
+            self._strings[position] = self._map[
+                offset + offsets[position]:
+                offset + offsets[position + 1]].decode()
+        return self._strings[position]
+
+    def airport_rows(self) -> Iterator[List[str]]:
+        """ Yields the rows of the airports file this store was made from. """
+        columns = [self.get_column("airports." + name)
+                   for name in ["code", "name", "longitude", "latitude"]]
+        for code, name, longitude, latitude in zip(*columns):
+            yield [self.get_string(code), self.get_string(name),
+                   repr(longitude), repr(latitude)]
+
+    def customer_rows(self) -> Iterator[List[str]]:
+        """ Yields the rows of the customers file this store was made from. """
+        columns = [self.get_column("customers." + name)
+                   for name in ["id", "name", "age", "nationality"]]
+        for cid, name, age, nationality in zip(*columns):
+            yield [str(cid), self.get_string(name), str(age),
+                   self.get_string(nationality)]
+
+    def close(self) -> None:
+        """ Close this store, and release every column returned by get_column.
+        """
+        for name in self._columns:
+            self._columns[name].release()
+        self._columns = {}
+        self._buffer.release()
+        if not self._shared:
+            self._map.close()
+        self._file.close()
+
+
+class _StringTable:
+    """ The strings of a store being written, each one kept once. """
+    # === Private Attributes ===
+    # _positions:
+    #     the position of each string in the table.
+    # _data:
+    #     the UTF-8 bytes of every string, one after another.
+    # _offsets:
+    #     where the bytes of each string start, followed by the end of the
+    #     last one.
+    _positions: Dict[str, int]
+    _data: bytearray
+    _offsets: array
+
+    def __init__(self) -> None:
+        """ Initialize an empty string table. """
+        self._positions = {}
+        self._data = bytearray()
+        self._offsets = array('I', [0])
+
+    def add(self, text: str) -> int:
+        """ Returns the position of <text> in the table, adding it if it is
+            new.
+        """
+        if text not in self._positions:
+            self._positions[text] = len(self._positions)
+            self._data.extend(text.encode())
+            self._offsets.append(len(self._data))
+        return self._positions[text]
+
+    def get_columns(self) -> Dict[str, array]:
+        """ Returns the columns of the string table. """
+        return {"strings.offsets": self._offsets,
+                "strings.data": array('B', self._data)}
+
+
+def write_store(filename: str, file_airports: str, file_customers: str,
+                file_segments: str, workers: int = 1) -> None:
+    """ Writes the airports, customers and flight segments in the CSV files
+        <file_airports>, <file_customers> and <file_segments> to the store
+        file <filename>. The segments are parsed by <workers> processes.
+
+        Precondition: the dataset files must be in CSV format.
+    """
+    strings = _StringTable()
+    columns = {name: array(COLUMNS[name]) for name in COLUMNS}
+    with open(file_airports, newline='') as file:
+        for row in csv.reader(file):
+            columns["airports.code"].append(strings.add(row[0]))
+            columns["airports.name"].append(strings.add(row[1]))
+            columns["airports.longitude"].append(float(row[2]))
+            columns["airports.latitude"].append(float(row[3]))
+    with open(file_customers, newline='') as file:
+        for row in csv.reader(file):
+            columns["customers.id"].append(int(row[0]))
+            columns["customers.name"].append(strings.add(row[1]))
+            columns["customers.age"].append(int(row[2]))
+            columns["customers.nationality"].append(strings.add(row[3]))
+    # numbered in the order SegmentTable.append_minutes interns them
+    fids = {}
+    codes = {}
+    for fid, dep, arr, _, dep_time, arr_time, duration, length in \
+            parse_segments_file(file_segments, workers):
+        columns["segments.fid"].append(fids.setdefault(fid, len(fids)))
+        columns["segments.dep_loc"].append(codes.setdefault(dep, len(codes)))
+        columns["segments.arr_loc"].append(codes.setdefault(arr, len(codes)))
+        columns["segments.dep_time"].append(dep_time)
+        columns["segments.arr_time"].append(arr_time)
+        columns["segments.duration"].append(duration)
+        columns["segments.length"].append(length)
+    columns["segments.fids"].extend(strings.add(fid) for fid in fids)
+    columns["segments.codes"].extend(strings.add(code) for code in codes)
+    columns.update(strings.get_columns())
+    _write_columns(filename, columns,
+                   {part: file_checksum(source) for part, source in
+                    zip(SOURCES, [file_airports, file_customers,
+                                  file_segments])})
+
+
+def file_checksum(filename: str) -> str:
+    """ Returns the SHA-256 checksum of the contents of the file <filename>.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        block = file.read(CHECKSUM_BLOCK)
+        while block:
+            digest.update(block)
+            block = file.read(CHECKSUM_BLOCK)
+    return digest.hexdigest()
+
+
+def _write_columns(filename: str, columns: Dict[str, array],
+                   sources: Dict[str, str]) -> None:
+    """ Writes the <columns> to the store file <filename>, after its header
+        and directory, which records the checksums of the <sources>.
+    """
+    directory = {"byteorder": sys.byteorder, "sources": sources,
+                 "columns": {}}
+    offset = 0
+    for name in columns:
+        directory["columns"][name] = [columns[name].typecode, offset,
+                                      len(columns[name])]
+        offset = _align(offset + len(columns[name]) * columns[name].itemsize)
+    text = json.dumps(directory).encode()
+    with open(filename, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(text)))
+        file.write(text)
+        for name in columns:
+            # every offset above is a multiple of COLUMN_ALIGNMENT, so each
+            # column starts at one
+            file.write(bytes(_align(file.tell()) - file.tell()))
+            columns[name].tofile(file)
+
+
+def _align(offset: int) -> int:
+    """ Returns the first multiple of COLUMN_ALIGNMENT at or after <offset>.
+
+    >>> _align(9)
+    16
+    """
+    return -(-offset // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Convert the CSV files of a dataset into a store file.")
+    parser.add_argument('--files', nargs=3,
+                        metavar=('AIRPORTS', 'CUSTOMERS', 'SEGMENTS'),
+                        default=['data/airports.csv', 'data/customers.csv',
+                                 'data/segments_small.csv'])
+    parser.add_argument('--output', default='data/small.store')
+    args = parser.parse_args()
+    write_store(args.output, *args.files)
+    print("Wrote", args.output)
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'doctest', 'array', 'argparse', 'csv',
+            'hashlib', 'json', 'mmap', 'struct', 'sys', 'parsers'
+        ],
+        'allowed-io': ['BinaryStore.__init__', 'write_store', 'file_checksum',
+                       '_write_columns']
+    })
@@ -12,16 +12,20 @@ All of the files in this directory and all subdirectories are:
 Copyright (c) 2020 Bogdan Simion, Michael Liut, Paul Vrbik
 """
 import os
-import threading
 import math
 import time
-from typing import List, Tuple, Any, Union, Callable
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple, Any, Union, \
+    Callable
 from tkinter import *
 import pygame
-from customer import Customer
+from customer import BookingIndex, Customer
 from flight import FlightSegment
 from filter import CustomerFilter, DateFilter, DurationFilter
-from filter import LocationFilter, ResetFilter, TripFilter
+from filter import ExpressionFilter, LocationFilter, ResetFilter, TripFilter
+from filter import FilterCache, apply_filter
+from parallel import FilterPool
+from metrics import METRICS
 
 """ ======================== Module Description ================================
 
@@ -47,9 +51,26 @@ MAP_MAX = (180.0, -90.0)
 # Window Size
 SCREEN_SIZE = (1000, 700)
 
+# The widest line used to draw a route, when routes are weighted by frequency
+MAX_ROUTE_WIDTH = 6
+
+# The number of fixed zoom levels of the map kept scaled in memory. Level k is
+# the whole map at 2 ** k times the screen size (1x, 2x and 4x), but never
+# larger than the map image itself.
+MAP_LEVELS = 3
+
 # File Image Location
 MAP_FILE = 'images/map.png'
 
+# The most frames per second drawn while the map is panned or zoomed
+MAX_FPS = 60
+
+# The number of filters that can be undone
+FILTER_HISTORY_SIZE = 20
+
+# The default number of worker processes used to apply filters
+FILTER_WORKERS = os.cpu_count() or 1
+
 
 class Visualizer:
     """ Visualizer for the current state of a simulation.
@@ -63,15 +84,29 @@ class Visualizer:
     #   on the PyGame window.
     # _map: the Map object responsible for converting between longitude/latitude
     #   coordinates and the pixels of the visualization window.
+    # _filter_cache: the results of the most recently applied filters.
+    # _history: the flight segments that were displayed before each of the
+    #   most recent filters was applied, the latest last.
+    # _pool: chooses the flight segments matching a filter with a pool of
+    #   worker processes.
+    # _dirty: whether the window has changed since it was last drawn.
+    # _clock: limits how often the window is drawn to MAX_FPS.
     r: Tk
     _ui_screen: pygame.Surface
     _screen: pygame.Surface
     _mouse_down: bool
     _map: 'Map'
     _quit: bool
-
-    def __init__(self) -> None:
-        """ Initialize this visualizer. """
+    _filter_cache: FilterCache
+    _history: List[List[FlightSegment]]
+    _pool: FilterPool
+    _dirty: bool
+    _clock: pygame.time.Clock
+
+    def __init__(self, workers: int = FILTER_WORKERS) -> None:
+        """ Initialize this visualizer, which applies filters with <workers>
+            worker processes.
+        """
         self.r = Tk()
         Label(self.r, text="Python Air\'s Frequent Flyer System")\
             .grid(row=0, column=0)
@@ -98,10 +133,14 @@ class Visualizer:
                              (SCREEN_SIZE[0] + 10, 250))
         self._ui_screen.blit(font.render("Y: Date", True, WHITE),
                              (SCREEN_SIZE[0] + 10, 300))
+        self._ui_screen.blit(font.render("E: Expression", True, WHITE),
+                             (SCREEN_SIZE[0] + 10, 350))
 
         self._ui_screen.blit(font.render("S: Summary of Trip", True, WHITE),
                              (SCREEN_SIZE[0] + 10, 500))
 
+        self._ui_screen.blit(font.render("U: Undo Filter", True, WHITE),
+                             (SCREEN_SIZE[0] + 10, 550))
         self._ui_screen.blit(font.render("R: Reset Filters", True, WHITE),
                              (SCREEN_SIZE[0] + 10, 600))
         self._ui_screen.blit(font.render("Q: Quit Application", True, WHITE),
@@ -111,6 +150,11 @@ class Visualizer:
         self._screen.fill(WHITE)
         self._mouse_down = False
         self._map = Map(SCREEN_SIZE)
+        self._filter_cache = FilterCache()
+        self._history = []
+        self._pool = FilterPool(workers)
+        self._clock = pygame.time.Clock()
+        self._dirty = True
 
         # Initial render
         self.draw([])
@@ -118,16 +162,30 @@ class Visualizer:
 
     def draw(self, long_lats: List[FlightSegment]) -> None:
         """ Render the <long_lats> to the screen. """
+        # Wait, if needed, so that no more than MAX_FPS frames are drawn. The
+        # wait is not part of the time recorded for drawing.
+        self._clock.tick(MAX_FPS)
+        self._dirty = False
 
-        # Draw the background map onto the screen
-        self._screen.fill(WHITE)
-        self._screen.blit(self._map.get_current_view(), (0, 0))
+        with METRICS.time_stage("draw"):
+            # Draw the background map onto the screen
+            self._screen.fill(WHITE)
+            self._screen.blit(self._map.get_current_view(), (0, 0))
 
-        # Add all of the objects onto the screen
-        self._map.render_objects(long_lats, self._screen)
+            # Add all of the objects onto the screen
+            self._map.render_objects(long_lats, self._screen)
 
-        # Show the new image
-        pygame.display.flip()
+            # Show the new image
+            pygame.display.flip()
+
+    def close(self) -> None:
+        """ Stop the worker processes used to apply filters. """
+        self._pool.close()
+
+    def needs_redraw(self) -> bool:
+        """ Returns True if the window has changed since it was last drawn.
+        """
+        return self._dirty
 
     def has_quit(self) -> bool:
         """ Returns True if the program has received the quit command. """
@@ -140,14 +198,20 @@ class Visualizer:
             The <drawables> are the objects currently displayed, while the
             <customers> list contains all customers from the input data. Returns 
             a new list of FlightSegment, according to user input actions.
+
+            Waits until there is at least one event, so that no time is spent
+            while the user does nothing.
         """
         new_drawables = drawables
-        for event in pygame.event.get():
+        events = [pygame.event.wait()]
+        events.extend(pygame.event.get())
+        for event in events:
             if event.type == pygame.QUIT:
                 self._quit = True
+            elif event.type in [pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED]:
+                self._dirty = True
             elif event.type == pygame.KEYDOWN:
                 f = None
-                num_threads = 1
 
                 if event.unicode.lower() == "d":
                     f = DurationFilter()
@@ -159,80 +223,70 @@ class Visualizer:
                     f = DateFilter()
                 elif event.unicode.lower() == "t":
                     f = TripFilter()
+                elif event.unicode.lower() == "e":
+                    f = ExpressionFilter()
                 elif event.unicode.lower() == "s":
                     self.display_summary(customers)
+                elif event.unicode.lower() == "u":
+                    if self._history:
+                        new_drawables = self._history.pop()
+                        self._dirty = True
                 elif event.unicode.lower() == "r":
                     f = ResetFilter()
-                    num_threads = 1
                 elif event.unicode.lower() == "q":
                     self._quit = True
 
                 if f is not None:
-                    def result_wrapper(fun: Callable[[List[Customer],
-                                                      List[FlightSegment], str],
-                                                     List[FlightSegment]],
-                                       customers_lst: List[Customer],
-                                       data: List[FlightSegment],
-                                       filter_string: str, res: List) -> None:
-                        """ A final wrapper to return the result of the
-                            operation
-                        """
-                        res.append(fun(customers_lst, data,
-                                       filter_string.upper()))
-
-                    def threading_wrapper(customers_lst: List[Customer],
-                                          flight_data: List[FlightSegment],
-                                          filter_string: str
-                                          ) -> List[FlightSegment]:
+                    def filter_wrapper(customers_lst: List[Customer],
+                                       flight_data: List[FlightSegment],
+                                       filter_string: str
+                                       ) -> List[FlightSegment]:
                         """ A wrapper for the application of filters with
-                            threading
+                            worker processes, which records their metrics
                         """
-                        chunk_sz_flights = math.ceil(
-                            (len(flight_data) + num_threads - 1) / num_threads)
-                        print("Num_threads:", num_threads)
-                        print("Chunk_flights:", chunk_sz_flights)
-                        threads = []
-                        results = []
-                        for i in range(num_threads):
-                            res = []
-                            results.append(res)
-                            t = threading.Thread(
-                                target=result_wrapper,
-                                args=(f.apply, customers_lst,
-                                      flight_data[i * chunk_sz_flights:
-                                                  (i + 1) * chunk_sz_flights],
-                                      filter_string.upper(), res))
-                            t.daemon = True
-                            t.start()
-                            threads.append(t)
-                            # f.apply(customers_lst, flight_data,
-                            #         filter_string.upper())
-                        # Wait to finish
-                        for t in threads:
-                            t.join()
-
-                        # Now reconstruct the data
-                        new_data = []
-                        for res in results:
-                            new_data.extend(res[0])
-                        return new_data
-
-                    new_drawables = self.entry_window(str(f), customers,
-                                                      drawables,
-                                                      threading_wrapper)
+                        return apply_filter(f, customers_lst, flight_data,
+                                            filter_string.upper(),
+                                            self._pool.select)
+
+                    def cache_wrapper(customers_lst: List[Customer],
+                                      flight_data: List[FlightSegment],
+                                      filter_string: str
+                                      ) -> List[FlightSegment]:
+                        """ A wrapper which reuses the result of a recent
+                            application of the same filter, if possible
+                        """
+                        return self._filter_cache.apply(f, customers_lst,
+                                                        flight_data,
+                                                        filter_string,
+                                                        filter_wrapper)
+
+                    # the filter applies to what is displayed now, which is
+                    # not <drawables> if an earlier event in this batch
+                    # changed it
+                    result = self.entry_window(str(f), customers,
+                                               new_drawables, cache_wrapper)
+                    if not _same_segments(result, new_drawables):
+                        self._dirty = True
+                        self._history.append(new_drawables)
+                        if len(self._history) > FILTER_HISTORY_SIZE:
+                            self._history.pop(0)
+                        new_drawables = result
 
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
                     self._mouse_down = True
                 elif event.button == 4:
                     self._map.zoom(-0.1)
+                    self._dirty = True
                 elif event.button == 5:
                     self._map.zoom(0.1)
+                    self._dirty = True
             elif event.type == pygame.MOUSEBUTTONUP:
                 self._mouse_down = False
             elif event.type == pygame.MOUSEMOTION:
                 if self._mouse_down:
                     self._map.pan(pygame.mouse.get_rel())
+                    self._dirty = True
                 else:
                     pygame.mouse.get_rel()
 
@@ -296,24 +350,23 @@ class Visualizer:
             nonlocal m
             exists = False
             if all_customers:
-                for cus in all_customers:
-                    for tp in cus.get_trips():
-                        if tp.get_reservation_id() == input_string:
-                            exists = True
-                            print("-------------------------------------------")
-                            print("Summary of Trip (ID: {}):".
-                                  format(input_string))
-                            print("-------------------------------------------")
-                            print("The itinerary for this trip is: {}.".
-                                  format(tp.get_flight_segments()))
-                            print("The cost of this trip is: ${:.2f}.".
-                                  format(cus.get_cost_of_trip(tp)))
-                            print("The total trip time is: {}-minutes.".
-                                  format(tp.get_total_trip_time()))
-                            print("The time in-flight is: {}-minutes.".
-                                  format(tp.get_in_flight_time()))
-                            print("-------------------------------------------")
-                            print("\n")
+                for tp, cus in BookingIndex.for_customers(all_customers)\
+                        .get_reservations(input_string):
+                    exists = True
+                    print("-------------------------------------------")
+                    print("Summary of Trip (ID: {}):".
+                          format(input_string))
+                    print("-------------------------------------------")
+                    print("The itinerary for this trip is: {}.".
+                          format(tp.get_flight_segments()))
+                    print("The cost of this trip is: ${:.2f}.".
+                          format(cus.get_cost_of_trip(tp)))
+                    print("The total trip time is: {}-minutes.".
+                          format(tp.get_total_trip_time()))
+                    print("The time in-flight is: {}-minutes.".
+                          format(tp.get_in_flight_time()))
+                    print("-------------------------------------------")
+                    print("\n")
                 if not exists:
                     print("This Trip (ID: {}) does not exist in your dataset!"
                           .format(input_string))
@@ -341,6 +394,8 @@ class Map:
         the maximum long/lat coordinates
     screensize:
         the dimensions of the screen
+    weighted:
+        whether routes flown more often are drawn with thicker lines
     """
     # === Private attributes ===
     # _x_offset:
@@ -349,16 +404,35 @@ class Map:
     #    offset on y axis
     # _zoom:
     #    map zoom level
+    # _screen_points:
+    #    the pixel coordinates of each long/lat location drawn so far, which
+    #    are only valid for the transformation in _screen_transform
+    # _screen_transform:
+    #    the (x offset, y offset, zoom) that _screen_points were computed for
+    # _levels:
+    #    the whole map image scaled for each of the MAP_LEVELS fixed zoom
+    #    levels, or None for a level which has not been used yet
+    # _view:
+    #    the last view returned by get_current_view, along with the
+    #    (x offset, y offset, zoom) it was made for, or None if there is none
     image: pygame.image
     min_coords: Tuple[float, float]
     max_coords: Tuple[float, float]
     screensize: Tuple[int, int]
+    weighted: bool
     _x_offset: int
     _y_offset: int
     _zoom: int
-
-    def __init__(self, screen_dims: Tuple[int, int]) -> None:
-        """ Initialize this map for the screen dimensions <screen_dims>. """
+    _screen_points: Dict[Tuple[float, float], Tuple[int, int]]
+    _screen_transform: Tuple[int, int, float]
+    _levels: List[Optional[pygame.Surface]]
+    _view: Optional[Tuple[Tuple[int, int, float], pygame.Surface]]
+
+    def __init__(self, screen_dims: Tuple[int, int],
+                 weighted: bool = False) -> None:
+        """ Initialize this map for the screen dimensions <screen_dims>. If
+            <weighted> is True, routes flown more often are drawn thicker.
+        """
         self.image = pygame.image.load(
             os.path.join(os.path.dirname(__file__), MAP_FILE))
         self.min_coords = MAP_MIN
@@ -367,15 +441,44 @@ class Map:
         self._y_offset = 0
         self._zoom = 1
         self.screensize = screen_dims
+        self.weighted = weighted
+        self._screen_points = {}
+        self._screen_transform = (0, 0, 1)
+        self._levels = [None] * MAP_LEVELS
+        self._view = None
 
     def render_objects(self, drawables: List[FlightSegment],
                        screen: pygame.Surface) -> None:
-        """ Render the <drawables> onto the <screen>. """
-        for drw in drawables:
-            long_lat_position = drw.get_long_lat()
-            pygame.draw.aaline(screen, LINE_COLOUR,
-                               self._long_lat_to_screen(long_lat_position[0]),
-                               self._long_lat_to_screen(long_lat_position[1]))
+        """ Render the <drawables> onto the <screen>.
+
+            Flight segments flying the same route are drawn as a single line,
+            so the time taken depends on the number of distinct routes.
+        """
+        if self._screen_transform != (self._x_offset, self._y_offset,
+                                      self._zoom):
+            self._screen_points = {}
+            self._screen_transform = (self._x_offset, self._y_offset,
+                                      self._zoom)
+        routes = Counter(drw.get_long_lat() for drw in drawables)
+        METRICS.observe("render_objects.segments", len(drawables))
+        METRICS.count("render_objects.draw_calls", len(routes))
+        for route in routes:
+            start = self._screen_point(route[0])
+            end = self._screen_point(route[1])
+            if self.weighted and routes[route] > 1:
+                width = min(MAX_ROUTE_WIDTH,
+                            1 + int(math.log2(routes[route])))
+                pygame.draw.line(screen, LINE_COLOUR, start, end, width)
+            else:
+                pygame.draw.aaline(screen, LINE_COLOUR, start, end)
+
+    def _screen_point(self, location: Tuple[float, float]) -> Tuple[int, int]:
+        """ Returns the pixel coordinates of the <location> longitude/latitude
+            coordinates, computing them only once for each transformation.
+        """
+        if location not in self._screen_points:
+            self._screen_points[location] = self._long_lat_to_screen(location)
+        return self._screen_points[location]
 
     def _long_lat_to_screen(self, location: Tuple[float, float]) \
             -> Tuple[int, int]:
@@ -425,33 +528,78 @@ class Map:
         self._y_offset = min(raw_height - zoom_height, max(0, self._y_offset))
 
     def get_current_view(self) -> pygame.Surface:
-        """ Get the sub-image to display to screen from the map. """
-        raw_width = self.image.get_width()
-        raw_height = self.image.get_height()
-        zoom_width = round(raw_width / self._zoom)
-        zoom_height = round(raw_height / self._zoom)
+        """ Get the sub-image to display to screen from the map.
+
+            Only the visible region is scaled, and it is cut out of the
+            smallest fixed zoom level (see MAP_LEVELS) which is at least as
+            detailed as the screen. The view is reused until the map is panned
+            or zoomed.
+        """
+        transform = (self._x_offset, self._y_offset, self._zoom)
+        if self._view is None or self._view[0] != transform:
+            level = self._get_zoom_level()
+            x_scale = level.get_width() / self.image.get_width()
+            y_scale = level.get_height() / self.image.get_height()
+            width = min(level.get_width(),
+                        round(level.get_width() / self._zoom))
+            height = min(level.get_height(),
+                         round(level.get_height() / self._zoom))
+            x = max(0, min(level.get_width() - width,
+                           round(self._x_offset * x_scale)))
+            y = max(0, min(level.get_height() - height,
+                           round(self._y_offset * y_scale)))
+            region = level.subsurface(((x, y), (width, height)))
+            self._view = (transform,
+                          pygame.transform.smoothscale(region,
+                                                       self.screensize))
+        return self._view[1]
+
+    def _get_zoom_level(self) -> pygame.Surface:
+        """ Returns the whole map image at the smallest fixed zoom level whose
+            scale is at least the current zoom, scaling it the first time it is
+            used.
+        """
+        k = 0
+        while k < MAP_LEVELS - 1 and 2 ** k < self._zoom:
+            k += 1
+        if self._levels[k] is None:
+            size = (min(self.image.get_width(), self.screensize[0] * 2 ** k),
+                    min(self.image.get_height(),
+                        self.screensize[1] * 2 ** k))
+            if size == self.image.get_size():
+                self._levels[k] = self.image
+            else:
+                self._levels[k] = pygame.transform.smoothscale(self.image,
+                                                               size)
+        return self._levels[k]
 
-        map_segment = self.image.subsurface(((self._x_offset, self._y_offset),
-                                             (zoom_width, zoom_height)))
-        return pygame.transform.smoothscale(map_segment, self.screensize)
+
+def _same_segments(first: Sequence[FlightSegment],
+                   second: Sequence[FlightSegment]) -> bool:
+    """ Returns True iff <first> and <second> hold the same flight segment
+        objects, in the same order.
+    """
+    return first is second or (len(first) == len(second) and all(
+        one is other for one, other in zip(first, second)))
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'doctest', 'python_ta', 'typing',
-            'tkinter', 'os', 'pygame',
-            'threading', 'math', 'time',
-            'customer', 'flight', 'filter', 'typing'
+            'doctest', 'python_ta', 'typing', 'collections',
+            'tkinter', 'os', 'pygame', 'math',
+            'time', 'customer', 'flight', 'filter', 'parallel', 'metrics',
+            'typing'
         ],
         'allowed-io': [
-            'entry_window', 'callback_wrapper', 'threading_wrapper',
+            'entry_window', 'callback_wrapper', 'filter_wrapper',
             '__init__', 'handle_window_events', 'display_summary',
             'pretty_print'
         ],
         'disable': ['R0915', 'W0401', 'R0201'],
         'generated-members': 'pygame.*',
         'max-args': 6,
+        'max-attributes': 12,
         'max-nested-blocks': 4
     })